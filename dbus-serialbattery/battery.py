@@ -1,13 +1,15 @@
 # -*- coding: utf-8 -*-
-from typing import Union, Tuple, List, Dict, Callable
+from typing import Union, Tuple, List, Dict, Callable, Iterable
 
 from utils import logger, safe_number_format
 import utils
 import logging
 import math
+from array import array
 from datetime import datetime
-from time import time
+from time import time, monotonic
 from abc import ABC, abstractmethod
+from operator import attrgetter
 import sys
 
 
@@ -27,40 +29,71 @@ class Protection(object):
     WARNING = 1
     OK = 0
 
+    VALUES: Tuple[str, ...] = (
+        "high_voltage",
+        "high_cell_voltage",
+        "low_voltage",
+        "low_cell_voltage",
+        "low_soc",
+        "high_charge_current",
+        "high_discharge_current",
+        "cell_imbalance",
+        "internal_failure",
+        "high_charge_temperature",
+        "low_charge_temperature",
+        "high_temperature",
+        "low_temperature",
+        "high_internal_temperature",
+        "fuse_blown",
+    )
+    """
+    Names of the alarms, in the order they are serialized.
+    """
+
+    VALUES_INDEX: Dict[str, int] = {name: index for index, name in enumerate(VALUES)}
+
+    # `__dict__` allows some drivers to store additional BMS specific flags
+    __slots__ = VALUES + ("previous", "__dict__")
+
+    values_getter: Callable[["Protection"], tuple] = attrgetter(*VALUES)
+
     def __init__(self):
         # current values
-        self.high_voltage: int = None
-        self.high_cell_voltage: int = None
-        self.low_voltage: int = None
-        self.low_cell_voltage: int = None
-        self.low_soc: int = None
-        self.high_charge_current: int = None
-        self.high_discharge_current: int = None
-        self.cell_imbalance: int = None
-        self.internal_failure: int = None
-        self.high_charge_temperature: int = None
-        self.low_charge_temperature: int = None
-        self.high_temperature: int = None
-        self.low_temperature: int = None
-        self.high_internal_temperature: int = None
-        self.fuse_blown: int = None
+        for name in self.VALUES:
+            setattr(self, name, None)
 
         # previous values to check if the value has changed
-        self.previous_high_voltage: int = None
-        self.previous_high_cell_voltage: int = None
-        self.previous_low_voltage: int = None
-        self.previous_low_cell_voltage: int = None
-        self.previous_low_soc: int = None
-        self.previous_high_charge_current: int = None
-        self.previous_high_discharge_current: int = None
-        self.previous_cell_imbalance: int = None
-        self.previous_internal_failure: int = None
-        self.previous_high_charge_temperature: int = None
-        self.previous_low_charge_temperature: int = None
-        self.previous_high_temperature: int = None
-        self.previous_low_temperature: int = None
-        self.previous_high_internal_temperature: int = None
-        self.previous_fuse_blown: int = None
+        self.previous: tuple = (None,) * len(self.VALUES)
+
+    def serialize(self) -> tuple:
+        """
+        Get the current values as tuple in the order of `VALUES`.
+
+        :return: The current values
+        """
+        return self.values_getter(self)
+
+    def diff(self, previous: tuple = None) -> Dict[str, int]:
+        """
+        Get the values that changed compared to the previous values.
+
+        :param previous: The serialized values to compare with, defaults to the values saved with `set_previous()`
+        :return: A dict with the names and the current values of the changed alarms
+        """
+        previous = self.previous if previous is None else previous
+        current = self.serialize()
+        if current == previous:
+            return {}
+        return {name: value for name, value, previous_value in zip(self.VALUES, current, previous) if value != previous_value}
+
+    def get_previous(self, name: str) -> Union[int, None]:
+        """
+        Get the previous value of an alarm.
+
+        :param name: The name of the alarm
+        :return: The value saved with `set_previous()`
+        """
+        return self.previous[self.VALUES_INDEX[name]]
 
     def set_previous(self) -> None:
         """
@@ -68,21 +101,7 @@ class Protection(object):
 
         :return: None
         """
-        self.previous_high_voltage = self.high_voltage
-        self.previous_high_cell_voltage = self.high_cell_voltage
-        self.previous_low_voltage = self.low_voltage
-        self.previous_low_cell_voltage = self.low_cell_voltage
-        self.previous_low_soc = self.low_soc
-        self.previous_high_charge_current = self.high_charge_current
-        self.previous_high_discharge_current = self.high_discharge_current
-        self.previous_cell_imbalance = self.cell_imbalance
-        self.previous_internal_failure = self.internal_failure
-        self.previous_high_charge_temperature = self.high_charge_temperature
-        self.previous_low_charge_temperature = self.low_charge_temperature
-        self.previous_high_temperature = self.high_temperature
-        self.previous_low_temperature = self.low_temperature
-        self.previous_high_internal_temperature = self.high_internal_temperature
-        self.previous_fuse_blown = self.fuse_blown
+        self.previous = self.serialize()
 
 
 class History:
@@ -90,6 +109,33 @@ class History:
     This class holds the history data of the battery.
     """
 
+    VALUES: Tuple[str, ...] = (
+        "deepest_discharge",
+        "last_discharge",
+        "average_discharge",
+        "total_ah_drawn",
+        "charge_cycles",
+        "timestamp_last_full_charge",
+        "full_discharges",
+        "minimum_voltage",
+        "maximum_voltage",
+        "minimum_cell_voltage",
+        "maximum_cell_voltage",
+        "low_voltage_alarms",
+        "high_voltage_alarms",
+        "minimum_temperature",
+        "maximum_temperature",
+        "discharged_energy",
+        "charged_energy",
+    )
+    """
+    Names of the history values, in the order they are serialized and saved.
+    """
+
+    __slots__ = ("exclude_values_to_calculate", "clear") + VALUES
+
+    values_getter: Callable[["History"], tuple] = attrgetter(*VALUES)
+
     def __init__(self):
         self.exclude_values_to_calculate: list = []
         """
@@ -223,55 +269,458 @@ class History:
         :param attributes: list of attributes to reset, if empty all attributes are reset
         :return: None
         """
-        attributes = (
-            [
-                "deepest_discharge",
-                "last_discharge",
-                "average_discharge",
-                "total_ah_drawn",
-                "charge_cycles",
-                "timestamp_last_full_charge",
-                "full_discharges",
-                "minimum_voltage",
-                "maximum_voltage",
-                "minimum_cell_voltage",
-                "maximum_cell_voltage",
-                "low_voltage_alarms",
-                "high_voltage_alarms",
-                "minimum_temperature",
-                "maximum_temperature",
-                "discharged_energy",
-                "charged_energy",
-            ]
-            if not attributes
-            else attributes
-        )
+        attributes = self.VALUES if not attributes else attributes
 
         for attribute in attributes:
             if attribute not in self.exclude_values_to_calculate:
                 setattr(self, attribute, None)
 
+    def serialize(self) -> tuple:
+        """
+        Get the history values as tuple in the order of `VALUES`.
+
+        :return: The history values
+        """
+        return self.values_getter(self)
+
+    def diff(self, previous: tuple) -> Dict[str, Union[float, int, None]]:
+        """
+        Get the history values that changed compared to previously serialized values.
+
+        :param previous: The serialized values to compare with
+        :return: A dict with the names and the current values of the changed history values
+        """
+        current = self.serialize()
+        if current == previous:
+            return {}
+        return {name: value for name, value, previous_value in zip(self.VALUES, current, previous) if value != previous_value}
+
+    def get_values_to_save(self) -> Dict[str, Union[float, int]]:
+        """
+        Get the history values that are calculated by the driver and have a value.
+        Values fetched from the BMS are not saved, since they are read again after a restart.
+
+        :return: A dict with the names and the values
+        """
+        return {name: value for name, value in zip(self.VALUES, self.serialize()) if value is not None and name not in self.exclude_values_to_calculate}
+
 
 class Cell:
     """
     This class holds information about a single cell
 
+    The values are stored in the `CellList` the cell belongs to, the object itself is only a view
+    on its position in that list. As long as the cell is not part of a `CellList` the values are
+    kept in the object.
+
     :param voltage: float = the voltage of the cell in Volts
     :param balance: bool = the balance status of the cell
     """
 
-    voltage: float = None
+    __slots__ = ("store", "index", "local_voltage", "local_balance", "temperature")
+
+    def __init__(self, balance: bool = None):
+        self.store: "CellList" = None
+        self.index: int = None
+        self.local_voltage: float = None
+        self.local_balance: bool = None
+        self.temperature: float = None
+        """
+        The temperature of a specific cell in Celsius, if the BMS provides it
+        """
+        self.balance = balance
+
+    @property
+    def voltage(self) -> Union[float, None]:
+        """
+        The voltage of a specific cell in Volts
+        """
+        if self.store is None:
+            return self.local_voltage
+        return self.store.get_voltage(self.index)
+
+    @voltage.setter
+    def voltage(self, value: Union[float, None]) -> None:
+        if self.store is None:
+            self.local_voltage = value
+        else:
+            self.store.set_voltage(self.index, value)
+
+    @property
+    def balance(self) -> Union[bool, None]:
+        """
+        The balance status of a specific cell
+        """
+        if self.store is None:
+            return self.local_balance
+        return self.store.get_balance(self.index)
+
+    @balance.setter
+    def balance(self, value: Union[bool, None]) -> None:
+        if self.store is None:
+            self.local_balance = None if value is None else bool(value)
+        else:
+            self.store.set_balance(self.index, value)
+
+    def copy(self) -> "Cell":
+        """
+        Create a new cell with the same values, which is not part of any `CellList`.
+
+        :return: The new cell
+        """
+        cell = Cell(self.balance)
+        cell.voltage = self.voltage
+        cell.temperature = self.temperature
+        return cell
+
+
+def cell_list_structural_change(method: Callable) -> Callable:
     """
-    The voltage of a specific cell in Volts
+    Decorator for `CellList` methods, which add, remove or reorder cells.
+    The cells are detached before and attached again after the change, so that the store
+    matches the new order of the list.
+
+    :param method: The list method to wrap
+    :return: The wrapped method
     """
 
-    balance: bool = None
+    def wrapper(self, *args, **kwargs):
+        self.detach()
+        try:
+            return method(self, *args, **kwargs)
+        finally:
+            self.attach()
+
+    wrapper.__name__ = method.__name__
+    wrapper.__doc__ = method.__doc__
+    return wrapper
+
+
+class CellList(list):
     """
-    The balance status of a specific cell
+    This class holds the cells of a battery
+
+    It behaves like a list of `Cell` objects, but the values are stored compactly:
+
+    - the voltages in an `array('d')`, where a missing voltage is stored as NaN
+    - the balance status in two bitmasks, one for the known and one for the active balancers
+
+    The statistics of the cells are calculated in a single pass and cached until new cell data is written.
+
+    A cell can only be part of one list at a time. Cells that already belong to another list,
+    or are already in this list, are added as a copy.
+
+    :param cells: The cells to add to the list
     """
 
-    def __init__(self, balance: bool = None):
-        self.balance = balance
+    def __init__(self, cells: Iterable[Cell] = ()):
+        super().__init__(cells)
+        self.voltages: array = array("d")
+        self.balance_known: int = 0
+        self.balance_active: int = 0
+        self.statistics: Union[Dict[str, Union[float, int, None]], None] = None
+        self.statistics_key: Union[Tuple[int, int], None] = None
+        self.attach()
+
+    def attach(self) -> None:
+        """
+        Rebuild the store from the values of the cells and let all cells point to it.
+        Has to be called after `detach()`, since all cells that still point to a store are copied.
+
+        :return: None
+        """
+        # copy cells that belong to another list or appear twice in this list
+        seen = set()
+        for index, cell in enumerate(self):
+            if cell.store is not None or id(cell) in seen:
+                cell = cell.copy()
+                super().__setitem__(index, cell)
+            seen.add(id(cell))
+
+        values = [(cell.voltage, cell.balance) for cell in self]
+
+        self.voltages = array("d", (math.nan if voltage is None else voltage for voltage, _ in values))
+        self.balance_known = 0
+        self.balance_active = 0
+        for index, (_, balance) in enumerate(values):
+            if balance is not None:
+                self.balance_known |= 1 << index
+                if balance:
+                    self.balance_active |= 1 << index
+
+        for index, cell in enumerate(self):
+            cell.store = self
+            cell.index = index
+
+        self.statistics = None
+
+    def detach(self) -> None:
+        """
+        Copy the values back into the cells and detach them from the store.
+
+        :return: None
+        """
+        for cell in self:
+            if cell.store is self:
+                cell.local_voltage = cell.voltage
+                cell.local_balance = cell.balance
+                cell.store = None
+                cell.index = None
+
+    def attach_cell(self, index: int, cell: Cell) -> None:
+        """
+        Insert a single cell into the list and the store, without rebuilding the store.
+        A cell that belongs to another list or is already in this list is inserted as a copy.
+
+        :param index: The index where the cell is inserted, like `list.insert()`
+        :param cell: The cell to insert
+        :return: None
+        """
+        if cell.store is not None:
+            cell = cell.copy()
+
+        length = len(self)
+        index = max(0, min(length, index + length if index < 0 else index))
+        voltage = cell.voltage
+        balance = cell.balance
+
+        super().insert(index, cell)
+        self.voltages.insert(index, math.nan if voltage is None else voltage)
+
+        # shift the bits of the following cells by one
+        low = (1 << index) - 1
+        self.balance_known = (self.balance_known & low) | (self.balance_known & ~low) << 1
+        self.balance_active = (self.balance_active & low) | (self.balance_active & ~low) << 1
+        if balance is not None:
+            self.balance_known |= 1 << index
+            if balance:
+                self.balance_active |= 1 << index
+
+        cell.store = self
+        for position in range(index, length + 1):
+            self[position].index = position
+
+        self.statistics = None
+
+    def get_voltage(self, index: int) -> Union[float, None]:
+        """
+        Get the voltage of a specific cell.
+
+        :param index: The index of the cell
+        :return: The voltage of the cell
+        """
+        voltage = self.voltages[index]
+        return None if math.isnan(voltage) else voltage
+
+    def set_voltage(self, index: int, value: Union[float, None]) -> None:
+        """
+        Set the voltage of a specific cell.
+
+        :param index: The index of the cell
+        :param value: The voltage of the cell
+        :return: None
+        """
+        self.voltages[index] = math.nan if value is None else value
+        self.statistics = None
+
+    def get_balance(self, index: int) -> Union[bool, None]:
+        """
+        Get the balance status of a specific cell.
+
+        :param index: The index of the cell
+        :return: The balance status of the cell
+        """
+        if not self.balance_known >> index & 1:
+            return None
+        return bool(self.balance_active >> index & 1)
+
+    def set_balance(self, index: int, value: Union[bool, None]) -> None:
+        """
+        Set the balance status of a specific cell.
+
+        :param index: The index of the cell
+        :param value: The balance status of the cell
+        :return: None
+        """
+        mask = 1 << index
+        if value is None:
+            self.balance_known &= ~mask
+            self.balance_active &= ~mask
+        else:
+            self.balance_known |= mask
+            if value:
+                self.balance_active |= mask
+            else:
+                self.balance_active &= ~mask
+        self.statistics = None
+
+    def get_statistics(self, cell_count: Union[int, None]) -> Dict[str, Union[float, int, None]]:
+        """
+        Calculate the statistics of the first `cell_count` cells in a single pass.
+        Missing voltages are skipped. The result is cached until new cell data is written.
+
+        :param cell_count: The number of cells of the battery, if `None` all cells are used
+        :return: A dict with the following keys:
+
+            - `count`: number of cells with a voltage
+            - `min` and `max`: lowest and highest cell voltage
+            - `argmin` and `argmax`: index of the first cell with the lowest and highest voltage
+            - `sum` and `mean`: sum and mean of the cell voltages
+            - `half1`, `half2` and `middle`: sum of the lower half, sum of the upper half and the voltage
+              of the middle cell (only for an uneven number of cells)
+            - `balancing`: 1 if at least one cell is balancing, otherwise 0
+        """
+        limit = len(self) if cell_count is None else min(len(self), cell_count)
+        key = (limit, cell_count)
+        if self.statistics is not None and self.statistics_key == key:
+            return self.statistics
+
+        halfcount = limit // 2
+        upper_start = halfcount + limit % 2
+
+        count = 0
+        voltage_sum = 0.0
+        half1 = 0.0
+        half2 = 0.0
+        middle = None if limit % 2 else 0.0
+        min_voltage = math.inf
+        max_voltage = -math.inf
+        argmin = None
+        argmax = None
+
+        voltages = self.voltages
+        for index in range(limit):
+            voltage = voltages[index]
+            # NaN is the only value that is not equal to itself
+            if voltage != voltage:
+                continue
+
+            count += 1
+            voltage_sum += voltage
+            if voltage < min_voltage:
+                min_voltage = voltage
+                argmin = index
+            if voltage > max_voltage:
+                max_voltage = voltage
+                argmax = index
+
+            if index < halfcount:
+                half1 += voltage
+            elif index >= upper_start:
+                half2 += voltage
+            else:
+                middle = voltage
+
+        self.statistics = {
+            "count": count,
+            "min": min_voltage if count else None,
+            "max": max_voltage if count else None,
+            "argmin": argmin,
+            "argmax": argmax,
+            "sum": voltage_sum,
+            "mean": voltage_sum / count if count else None,
+            "half1": half1,
+            "half2": half2,
+            "middle": middle,
+            "balancing": 1 if self.balance_active & ((1 << limit) - 1) else 0,
+        }
+        self.statistics_key = key
+
+        return self.statistics
+
+    @cell_list_structural_change
+    def __setitem__(self, *args, **kwargs):
+        return super().__setitem__(*args, **kwargs)
+
+    @cell_list_structural_change
+    def __delitem__(self, *args, **kwargs):
+        return super().__delitem__(*args, **kwargs)
+
+    def __iadd__(self, cells: Iterable[Cell]):
+        self.extend(cells)
+        return self
+
+    @cell_list_structural_change
+    def __imul__(self, *args, **kwargs):
+        return super().__imul__(*args, **kwargs)
+
+    # adding cells only attaches the new cells, since the drivers rebuild their lists on each refresh
+    def append(self, cell: Cell) -> None:
+        self.attach_cell(len(self), cell)
+
+    def insert(self, index: int, cell: Cell) -> None:
+        self.attach_cell(index, cell)
+
+    def extend(self, cells: Iterable[Cell]) -> None:
+        # copy the iterable first, it could be this list
+        for cell in list(cells):
+            self.attach_cell(len(self), cell)
+
+    @cell_list_structural_change
+    def pop(self, *args, **kwargs):
+        return super().pop(*args, **kwargs)
+
+    @cell_list_structural_change
+    def remove(self, *args, **kwargs):
+        return super().remove(*args, **kwargs)
+
+    @cell_list_structural_change
+    def clear(self, *args, **kwargs):
+        return super().clear(*args, **kwargs)
+
+    @cell_list_structural_change
+    def reverse(self, *args, **kwargs):
+        return super().reverse(*args, **kwargs)
+
+    @cell_list_structural_change
+    def sort(self, *args, **kwargs):
+        return super().sort(*args, **kwargs)
+
+
+class LimitationReason:
+    """
+    Bits of the charge and discharge current limitation reason bitmask.
+    The order of the bits is the order in which the reasons are shown in the GUI.
+    """
+
+    MAX_BATTERY_CURRENT: int = 1 << 0
+    BMS_SETTINGS: int = 1 << 1
+    CELL_VOLTAGE: int = 1 << 2
+    TEMPERATURE: int = 1 << 3
+    MOSFET: int = 1 << 4
+    SOC: int = 1 << 5
+    BMS: int = 1 << 6
+
+    CALCULATED: int = CELL_VOLTAGE | TEMPERATURE | MOSFET | SOC
+    """
+    Reasons calculated from the config curves. They are not shown, if the global limit applies.
+    """
+
+    NAMES: Dict[int, str] = {
+        BMS_SETTINGS: "BMS Settings",
+        CELL_VOLTAGE: "Cell Voltage",
+        TEMPERATURE: "Temp",
+        MOSFET: "MOSFET",
+        SOC: "SoC",
+        BMS: "BMS",
+    }
+
+    @classmethod
+    def to_string(cls, reasons: int, charge: bool) -> str:
+        """
+        Render the human readable limitation shown in the GUI.
+
+        :param reasons: The limitation reason bitmask
+        :param charge: True for the charge, False for the discharge limitation
+        :return: The reasons separated by a comma
+        """
+        names = []
+        if reasons & cls.MAX_BATTERY_CURRENT:
+            names.append("Max Battery Charge Current" if charge else "Max Battery Discharge Current")
+        for reason, name in cls.NAMES.items():
+            if reasons & reason:
+                names.append(name)
+        return ", ".join(names)
 
 
 class Battery(ABC):
@@ -281,6 +730,24 @@ class Battery(ABC):
     use the individual implementations as type Battery and work with it.
     """
 
+    TIME_SERIES_NAMES: Tuple[str, ...] = (
+        "voltage",
+        "current",
+        "power",
+        "soc",
+        "temperature",
+        "min_temperature",
+        "max_temperature",
+        "min_cell_voltage",
+        "max_cell_voltage",
+        "control_voltage",
+        "control_charge_current",
+        "control_discharge_current",
+    )
+    """
+    Names of the values recorded in the time series, followed by `cell_1` to `cell_<cell_count>`.
+    """
+
     def __init__(self, port: str, baud: int, address: str):
         self.port: str = port
         self.baud_rate: int = baud
@@ -290,6 +757,8 @@ class Battery(ABC):
         self.type: str = "Generic"
         self.poll_interval: int = 1000
         self.dbus_external_objects: dict = None
+        self.dbus_external_connection = None
+        self.dbus_external_name_watch = None
         self.online: bool = None
         self.connection_info: str = "Initializing..."
         self.hardware_version: str = None
@@ -306,7 +775,6 @@ class Battery(ABC):
         # this values should only be initialized once,
         # else the BMS turns off the inverter on disconnect
         self.soc_calc_capacity_remain: float = None
-        self.soc_calc_capacity_remain_last_time: float = None
         self.soc_calc_reset_start_time: int = None
         self.soc_calc: float = None  # save soc_calc to preserve on restart
         self.soc: float = None
@@ -321,7 +789,7 @@ class Battery(ABC):
         self.control_allow_discharge: bool = None
 
         self.current_avg: float = None
-        self.current_avg_lst: list = []
+        self.current_avg_statistics: utils.RollingStatistics = utils.RollingStatistics(utils.CURRENT_AVG_WINDOW)
         self.previous_current_avg: float = None
         self.current_external: float = None
         self.capacity_remain: float = None
@@ -337,7 +805,7 @@ class Battery(ABC):
         self.temperature_3: float = None
         self.temperature_4: float = None
         self.temperature_mos: float = None
-        self.cells: List[Cell] = []
+        self.cells = []
         self.control_voltage: float = None
         self.control_voltage_last_limit_time: int = None
         self.soc_reset_requested: bool = False
@@ -354,6 +822,11 @@ class Battery(ABC):
         self.charge_mode_debug_bulk: str = ""
         self.charge_limitation: str = None
         self.discharge_limitation: str = None
+        self.charge_limitation_reasons: int = None
+        self.discharge_limitation_reasons: int = None
+        self.charge_limitation_text: str = None
+        self.discharge_limitation_text: str = None
+        self.current_limiters: Dict[bool, List[Tuple[int, Callable[[], Union[float, None]]]]] = {}
         self.linear_cvl_last_set: int = 0
         self.linear_ccl_last_set: int = 0
         self.linear_dcl_last_set: int = 0
@@ -365,16 +838,33 @@ class Battery(ABC):
         """
 
         # Calculation of charge
-        self.current_calc_last_time: int = None
+        self.charge_integrator: utils.TrapezoidalIntegrator = utils.TrapezoidalIntegrator()
         self.charge_charged: float = 0
         self.charge_discharged: float = 0
         self.charge_discharged_last: float = 0
+        self.charge_delta: float = 0
+        """
+        Net charge in Ah integrated from the current in the last cycle. Used for the SoC calculation.
+        """
 
         # Calculation of energy
-        self.power_calc_last_time: int = None
+        self.energy_integrator: utils.TrapezoidalIntegrator = utils.TrapezoidalIntegrator()
         self.energy_charged: float = 0
         self.energy_discharged: float = 0
 
+        self.current_timestamp: float = None
+        """
+        Monotonic timestamp (`time.monotonic()`) when `self.current` was received.
+        Can be set by the driver or transport, else the time of the calculation is used.
+        """
+
+        self.current_samples: List[Tuple[float, float]] = []
+        """
+        Additional `(monotonic timestamp, current)` samples received since the last cycle,
+        e.g. from CAN frames or BLE notifications. They are used for the coulomb counting
+        and cleared after each cycle.
+        """
+
         # list of available callbacks, in order to display the buttons in the GUI
         self.available_callbacks: List[str] = []
 
@@ -408,8 +898,41 @@ class Battery(ABC):
         Custom field that the user can define in the BMS settings via the BMS app.
         """
 
+        self.derived_snapshot: Union[Dict[str, Union[float, int, str, dict, None]], None] = None
+        """
+        Values derived from the BMS data, calculated once per refresh.
+        Use `get_derived_value()` to read them.
+        """
+
+        self.resistance_estimator: utils.ResistanceEstimator = None
+        """
+        Estimator of the internal resistance of the cells, created by `estimate_cell_resistances()`.
+        """
+
+        self.cell_resistances: List[Union[float, None]] = []
+        """
+        Estimated internal resistance of each cell in Ohm, `None` if not known yet.
+        """
+
+        self.time_series: utils.TimeSeries = None
+        """
+        Values of the last hours/days, recorded by `record_time_series()`.
+        `None` if `TIME_SERIES_ENABLE` is disabled or nothing was recorded yet.
+        """
+
         self.init_values()
 
+    @property
+    def cells(self) -> CellList:
+        """
+        The cells of the battery. Lists assigned by the drivers are converted to a `CellList`.
+        """
+        return self.cell_list
+
+    @cells.setter
+    def cells(self, cells: List[Cell]) -> None:
+        self.cell_list = cells if isinstance(cells, CellList) else CellList(cells)
+
     def init_values(self) -> None:
         """
         Used to initialize and reset values, if battery unexpectly disconnects.
@@ -502,6 +1025,41 @@ class Battery(ABC):
         """
         self.can_transport_interface: object = can_transport_interface
 
+    def get_can_filters(self) -> Union[List[dict], None]:
+        """
+        Each CAN driver should override this function to return the arbitration ids it needs.
+        They are installed as kernel filters, so the driver receives only its own messages.
+        Use `utils_can.can_filter()` to create the filters.
+
+        :return: list of filters or None to receive all messages
+        """
+        return None
+
+    def get_can_sample_ids(self) -> List[int]:
+        """
+        CAN drivers can override this function to return the arbitration ids (as cached) of the frames,
+        which contain the current. Every received frame is kept with its timestamp and can be decoded
+        with `add_can_current_samples()`, so the coulomb counting is not limited to the last cached frame.
+
+        :return: list of arbitration ids
+        """
+        return []
+
+    def add_can_current_samples(self, can_decoders: Dict[int, Tuple[object, Callable]]) -> None:
+        """
+        Decode all frames of `get_can_sample_ids()` received since the last cycle and add the current
+        with the reception time to `current_samples`. The time of the newest valid frame is used as `current_timestamp`.
+
+        :param can_decoders: dict with the frame ID as key and a tuple of struct and decode function as value
+        :return: None
+        """
+        for timestamp, frame_id, data in self.can_transport_interface.get_samples():
+            decoder = can_decoders.get(frame_id)
+            # the decode functions return 0, if the data is not valid
+            if decoder is not None and decoder[1](*decoder[0].unpack_from(data)) and self.current is not None:
+                self.current_samples.append((timestamp, self.current))
+                self.current_timestamp = timestamp
+
     @abstractmethod
     def get_settings(self) -> bool:
         """
@@ -589,19 +1147,18 @@ class Battery(ABC):
             return None
 
         if self.soc_calc_capacity_remain is not None:
-            # calculate remaining capacity based on current
-            self.soc_calc_capacity_remain = self.soc_calc_capacity_remain + self.current_calc * (current_time - self.soc_calc_capacity_remain_last_time) / 3600
+            # calculate remaining capacity based on the charge integrated from the current
+            self.soc_calc_capacity_remain = self.soc_calc_capacity_remain + self.charge_delta
 
             # limit soc_calc_capacity_remain to capacity and zero
             # in case 100% is reached and the battery is not fully charged
             # in case 0% is reached and the battery is not fully discharged
             self.soc_calc_capacity_remain = max(min(self.soc_calc_capacity_remain, self.capacity), 0)
-            self.soc_calc_capacity_remain_last_time = current_time
 
             # execute checks only if one cell reaches min voltage
             # use lowest cell voltage, since in this case the battery is empty
             # else a unbalanced battery won't reach 0% and the BMS will shut down
-            if self.get_min_cell_voltage() <= utils.MIN_CELL_VOLTAGE:
+            if self.get_derived_value("min_cell_voltage") <= utils.MIN_CELL_VOLTAGE:
                 # check if battery is still being discharged
                 if self.current_calc < 0 and self.soc_calc_reset_start_time:
                     # set soc to 0%, if SOC_RESET_TIME is reached and soc_calc is not rounded 0%
@@ -629,8 +1186,6 @@ class Battery(ABC):
                 self.soc_calc_capacity_remain = self.capacity * self.soc_calc / 100 if self.soc_calc > 0 else 0
                 logger.debug("SOC initialized from dbus and set to " + str(self.soc_calc) + "%")
 
-            self.soc_calc_capacity_remain_last_time = current_time
-
         # calculate the SOC based on remaining capacity
         return round(max(min((self.soc_calc_capacity_remain / self.capacity) * 100, 100), 0), 3)
 
@@ -683,7 +1238,8 @@ class Battery(ABC):
 
         try:
             voltage_sum = self.get_cell_voltage_sum()
-            voltage_cell_diff = self.get_max_cell_voltage() - self.get_min_cell_voltage()
+            max_cell_voltage = self.get_derived_value("max_cell_voltage")
+            voltage_cell_diff = max_cell_voltage - self.get_derived_value("min_cell_voltage")
 
             if self.max_voltage_start_time is None:
                 # start timer, if max voltage is reached and cells are balanced
@@ -753,7 +1309,7 @@ class Battery(ABC):
                     found_high_cell_voltage = False
 
                     # check for cell overvoltage
-                    if self.get_max_cell_voltage() > cell_voltage_max_allowed:
+                    if max_cell_voltage > cell_voltage_max_allowed:
                         for i in range(self.cell_count):
                             voltage = self.get_cell_voltage(i)
                             if voltage:
@@ -779,7 +1335,7 @@ class Battery(ABC):
                 elif utils.CVL_CONTROLLER_MODE == 2:
                     if self.control_voltage:
                         control_voltage = self.control_voltage - (
-                            (self.get_max_cell_voltage() - cell_voltage_max_allowed - utils.SWITCH_TO_FLOAT_CELL_VOLTAGE_DIFF) * utils.CVL_ICONTROLLER_FACTOR
+                            (max_cell_voltage - cell_voltage_max_allowed - utils.SWITCH_TO_FLOAT_CELL_VOLTAGE_DIFF) * utils.CVL_ICONTROLLER_FACTOR
                         )
                     else:
                         control_voltage = self.max_battery_voltage
@@ -794,7 +1350,7 @@ class Battery(ABC):
                     found_high_cell_voltage = False
 
                     # check for cell overvoltage
-                    if self.get_max_cell_voltage() > cell_voltage_max_allowed:
+                    if max_cell_voltage > cell_voltage_max_allowed:
                         for i in range(self.cell_count):
                             voltage = self.get_cell_voltage(i)
                             if voltage:
@@ -947,7 +1503,7 @@ class Battery(ABC):
                     + f"{current_time - self.control_voltage_last_limit_time if self.control_voltage_last_limit_time is not None else 0} s\n"
                     + f"voltage_sum: {safe_number_format(voltage_sum, '{:.2f}')} V • "
                     + f"voltage_cell_diff: {safe_number_format(voltage_cell_diff, '{:.3f}')} V\n"
-                    + f"max_cell_voltage: {self.get_max_cell_voltage()} V"
+                    + f"max_cell_voltage: {max_cell_voltage} V"
                     + (f" • penalty_sum: {safe_number_format(penalty_sum, '{:.3f}')} V" if utils.CVL_CONTROLLER_MODE == 1 else "")
                     + "\n"
                     + f"soc: {self.soc}% • soc_calc: {self.soc_calc}%\n"
@@ -1026,67 +1582,12 @@ class Battery(ABC):
         :return: None
         """
         # ---------- Manage Charge Current Limitations ----------
-        charge_limits = {utils.MAX_BATTERY_CHARGE_CURRENT: "Max Battery Charge Current"}
-
-        # if BMS limit is lower then config limit and therefore the values are not the same,
-        # then the limit was also read from the BMS
-        if isinstance(self.max_battery_charge_current, (int, float)) and utils.MAX_BATTERY_CHARGE_CURRENT > self.max_battery_charge_current:
-            charge_limits.update({self.max_battery_charge_current: "BMS Settings"})
-
-        if utils.CCCM_CV_ENABLE:
-            tmp = self.calc_max_charge_current_from_cell_voltage()
-            if self.max_battery_charge_current != tmp:
-                if tmp in charge_limits:
-                    # do not add string, if global limitation is applied
-                    if charge_limits[tmp] != "Max Battery Charge Current":
-                        charge_limits.update({tmp: charge_limits[tmp] + ", Cell Voltage"})
-                    else:
-                        pass
-                else:
-                    charge_limits.update({tmp: "Cell Voltage"})
-
-        if utils.CCCM_T_ENABLE:
-            tmp = self.calc_max_charge_current_from_temperature()
-            if self.max_battery_charge_current != tmp:
-                if tmp in charge_limits:
-                    # do not add string, if global limitation is applied
-                    if charge_limits[tmp] != "Max Battery Charge Current":
-                        charge_limits.update({tmp: charge_limits[tmp] + ", Temp"})
-                    else:
-                        pass
-                else:
-                    charge_limits.update({tmp: "Temp"})
-
-        if utils.CCCM_T_MOSFET_ENABLE:
-            tmp = self.calc_max_charge_current_from_mosfet_temperature()
-            if self.max_battery_charge_current != tmp:
-                if tmp in charge_limits:
-                    # do not add string, if global limitation is applied
-                    if charge_limits[tmp] != "Max Battery Charge Current":
-                        charge_limits.update({tmp: charge_limits[tmp] + ", MOSFET"})
-                    else:
-                        pass
-                else:
-                    charge_limits.update({tmp: "MOSFET"})
-
-        if utils.CCCM_SOC_ENABLE:
-            tmp = self.calc_max_charge_current_from_soc()
-            if self.max_battery_charge_current != tmp:
-                if tmp in charge_limits:
-                    # do not add string, if global limitation is applied
-                    if charge_limits[tmp] != "Max Battery Charge Current":
-                        charge_limits.update({tmp: charge_limits[tmp] + ", SoC"})
-                    else:
-                        pass
-                else:
-                    charge_limits.update({tmp: "SoC"})
+        charge_limit, charge_reasons = self.reduce_current_limiters(True)
 
-        # set CCL to 0, if BMS does not allow to charge
-        if self.charge_fet is False or self.block_because_disconnect:
-            if 0 in charge_limits:
-                charge_limits.update({0: charge_limits[0] + ", BMS"})
-            else:
-                charge_limits.update({0: "BMS"})
+        # render the limitation only, if the reasons changed
+        if charge_reasons != self.charge_limitation_reasons:
+            self.charge_limitation_reasons = charge_reasons
+            self.charge_limitation_text = LimitationReason.to_string(charge_reasons, True)
 
         """
         do not set CCL immediately, but only
@@ -1094,7 +1595,7 @@ class Battery(ABC):
         - if CCL changes to 0
         - if CCL changes more than CVL_RECALCULATION_ON_MAX_PERCENTAGE_CHANGE
         """
-        ccl = round(min(charge_limits), 3)
+        ccl = round(charge_limit, 3)
         diff = abs(self.control_charge_current - ccl) if self.control_charge_current is not None else 0
         if (
             int(time()) - self.linear_ccl_last_set >= utils.CVL_RECALCULATION_EVERY
@@ -1106,14 +1607,14 @@ class Battery(ABC):
             # Introduce a threshold mechanism to prevent flapping
             if ccl == 0:
                 self.control_charge_current = ccl
-                self.charge_limitation = charge_limits[min(charge_limits)]
+                self.charge_limitation = self.charge_limitation_text
             else:
                 # Don't allow recovery if the new allowed current is smaller than 1% of the previous allowed current
                 if self.control_charge_current == 0 and ccl < utils.MAX_BATTERY_CHARGE_CURRENT * utils.CHARGE_CURRENT_RECOVERY_THRESHOLD_PERCENT:
-                    self.charge_limitation = charge_limits[min(charge_limits)] + " *"
+                    self.charge_limitation = self.charge_limitation_text + " *"
                 else:
                     self.control_charge_current = ccl
-                    self.charge_limitation = charge_limits[min(charge_limits)]
+                    self.charge_limitation = self.charge_limitation_text
 
         # set allow to charge to no, if CCL is 0
         if self.control_charge_current == 0:
@@ -1124,67 +1625,12 @@ class Battery(ABC):
         #####
 
         # ---------- Manage Discharge Current Limitations ----------
-        discharge_limits = {utils.MAX_BATTERY_DISCHARGE_CURRENT: "Max Battery Discharge Current"}
-
-        # if BMS limit is lower then config limit and therefore the values are not the same,
-        # then the limit was also read from the BMS
-        if isinstance(self.max_battery_discharge_current, (int, float)) and utils.MAX_BATTERY_DISCHARGE_CURRENT > self.max_battery_discharge_current:
-            discharge_limits.update({self.max_battery_discharge_current: "BMS Settings"})
-
-        if utils.DCCM_CV_ENABLE:
-            tmp = self.calc_max_discharge_current_from_cell_voltage()
-            if self.max_battery_discharge_current != tmp:
-                if tmp in discharge_limits:
-                    # do not add string, if global limitation is applied
-                    if discharge_limits[tmp] != "Max Battery Discharge Current":
-                        discharge_limits.update({tmp: discharge_limits[tmp] + ", Cell Voltage"})
-                    else:
-                        pass
-                else:
-                    discharge_limits.update({tmp: "Cell Voltage"})
-
-        if utils.DCCM_T_ENABLE:
-            tmp = self.calc_max_discharge_current_from_temperature()
-            if self.max_battery_discharge_current != tmp:
-                if tmp in discharge_limits:
-                    # do not add string, if global limitation is applied
-                    if discharge_limits[tmp] != "Max Battery Discharge Current":
-                        discharge_limits.update({tmp: discharge_limits[tmp] + ", Temp"})
-                    else:
-                        pass
-                else:
-                    discharge_limits.update({tmp: "Temp"})
-
-        if utils.DCCM_T_MOSFET_ENABLE:
-            tmp = self.calc_max_discharge_current_from_mosfet_temperature()
-            if self.max_battery_discharge_current != tmp:
-                if tmp in discharge_limits:
-                    # do not add string, if global limitation is applied
-                    if discharge_limits[tmp] != "Max Battery Discharge Current":
-                        discharge_limits.update({tmp: discharge_limits[tmp] + ", MOSFET"})
-                    else:
-                        pass
-                else:
-                    discharge_limits.update({tmp: "MOSFET"})
-
-        if utils.DCCM_SOC_ENABLE:
-            tmp = self.calc_max_discharge_current_from_soc()
-            if self.max_battery_discharge_current != tmp:
-                if tmp in discharge_limits:
-                    # do not add string, if global limitation is applied
-                    if discharge_limits[tmp] != "Max Battery Discharge Current":
-                        discharge_limits.update({tmp: discharge_limits[tmp] + ", SoC"})
-                    else:
-                        pass
-                else:
-                    discharge_limits.update({tmp: "SoC"})
+        discharge_limit, discharge_reasons = self.reduce_current_limiters(False)
 
-        # set DCL to 0, if BMS does not allow to discharge
-        if self.discharge_fet is False or self.block_because_disconnect:
-            if 0 in discharge_limits:
-                discharge_limits.update({0: discharge_limits[0] + ", BMS"})
-            else:
-                discharge_limits.update({0: "BMS"})
+        # render the limitation only, if the reasons changed
+        if discharge_reasons != self.discharge_limitation_reasons:
+            self.discharge_limitation_reasons = discharge_reasons
+            self.discharge_limitation_text = LimitationReason.to_string(discharge_reasons, False)
 
         """
         do not set DCL immediately, but only
@@ -1192,7 +1638,7 @@ class Battery(ABC):
         - if DCL changes to 0
         - if DCL changes more than CVL_RECALCULATION_ON_MAX_PERCENTAGE_CHANGE
         """
-        dcl = round(min(discharge_limits), 3)
+        dcl = round(discharge_limit, 3)
         diff = abs(self.control_discharge_current - dcl) if self.control_discharge_current is not None else 0
         if (
             int(time()) - self.linear_dcl_last_set >= utils.CVL_RECALCULATION_EVERY
@@ -1204,14 +1650,14 @@ class Battery(ABC):
             # Introduce a threshold mechanism to prevent flapping
             if dcl == 0:
                 self.control_discharge_current = dcl
-                self.discharge_limitation = discharge_limits[min(discharge_limits)]
+                self.discharge_limitation = self.discharge_limitation_text
             else:
                 # Don't allow recovery if the new allowed current is smaller than 1% of the previous allowed current
                 if self.control_discharge_current == 0 and dcl < utils.MAX_BATTERY_DISCHARGE_CURRENT * utils.DISCHARGE_CURRENT_RECOVERY_THRESHOLD_PERCENT:
-                    self.discharge_limitation = discharge_limits[min(discharge_limits)] + " *"
+                    self.discharge_limitation = self.discharge_limitation_text + " *"
                 else:
                     self.control_discharge_current = dcl
-                    self.discharge_limitation = discharge_limits[min(discharge_limits)]
+                    self.discharge_limitation = self.discharge_limitation_text
 
         # set allow to discharge to no, if DCL is 0
         if self.control_discharge_current == 0:
@@ -1219,34 +1665,122 @@ class Battery(ABC):
         else:
             self.control_allow_discharge = True
 
+    def get_current_limiters(self, charge: bool) -> List[Tuple[int, Callable[[], Union[float, None]]]]:
+        """
+        Get the stages of the charge or discharge current limitation. Each stage consists of the
+        limitation reason bit and a function returning the current limit or `None`, if it doesn't limit.
+        The list is built once, since the enabled stages are defined by the config.
+
+        :param charge: True for the charge, False for the discharge current limiters
+        :return: The list of limiters
+        """
+        if charge not in self.current_limiters:
+            if charge:
+                limiters = [
+                    (LimitationReason.MAX_BATTERY_CURRENT, lambda: utils.MAX_BATTERY_CHARGE_CURRENT),
+                    # if BMS limit is lower then config limit and therefore the values are not the same,
+                    # then the limit was also read from the BMS
+                    (
+                        LimitationReason.BMS_SETTINGS,
+                        lambda: (
+                            self.max_battery_charge_current
+                            if isinstance(self.max_battery_charge_current, (int, float)) and utils.MAX_BATTERY_CHARGE_CURRENT > self.max_battery_charge_current
+                            else None
+                        ),
+                    ),
+                ]
+                if utils.CCCM_CV_ENABLE:
+                    limiters.append((LimitationReason.CELL_VOLTAGE, self.calc_max_charge_current_from_cell_voltage))
+                if utils.CCCM_T_ENABLE:
+                    limiters.append((LimitationReason.TEMPERATURE, self.calc_max_charge_current_from_temperature))
+                if utils.CCCM_T_MOSFET_ENABLE:
+                    limiters.append((LimitationReason.MOSFET, self.calc_max_charge_current_from_mosfet_temperature))
+                if utils.CCCM_SOC_ENABLE:
+                    limiters.append((LimitationReason.SOC, self.calc_max_charge_current_from_soc))
+                # set CCL to 0, if BMS does not allow to charge
+                limiters.append((LimitationReason.BMS, lambda: 0 if self.charge_fet is False or self.block_because_disconnect else None))
+            else:
+                limiters = [
+                    (LimitationReason.MAX_BATTERY_CURRENT, lambda: utils.MAX_BATTERY_DISCHARGE_CURRENT),
+                    # if BMS limit is lower then config limit and therefore the values are not the same,
+                    # then the limit was also read from the BMS
+                    (
+                        LimitationReason.BMS_SETTINGS,
+                        lambda: (
+                            self.max_battery_discharge_current
+                            if isinstance(self.max_battery_discharge_current, (int, float))
+                            and utils.MAX_BATTERY_DISCHARGE_CURRENT > self.max_battery_discharge_current
+                            else None
+                        ),
+                    ),
+                ]
+                if utils.DCCM_CV_ENABLE:
+                    limiters.append((LimitationReason.CELL_VOLTAGE, self.calc_max_discharge_current_from_cell_voltage))
+                if utils.DCCM_T_ENABLE:
+                    limiters.append((LimitationReason.TEMPERATURE, self.calc_max_discharge_current_from_temperature))
+                if utils.DCCM_T_MOSFET_ENABLE:
+                    limiters.append((LimitationReason.MOSFET, self.calc_max_discharge_current_from_mosfet_temperature))
+                if utils.DCCM_SOC_ENABLE:
+                    limiters.append((LimitationReason.SOC, self.calc_max_discharge_current_from_soc))
+                # set DCL to 0, if BMS does not allow to discharge
+                limiters.append((LimitationReason.BMS, lambda: 0 if self.discharge_fet is False or self.block_because_disconnect else None))
+
+            self.current_limiters[charge] = limiters
+
+        return self.current_limiters[charge]
+
+    def reduce_current_limiters(self, charge: bool) -> Tuple[float, int]:
+        """
+        Run all charge or discharge current limiters once and reduce them to the lowest limit
+        and the bitmask of the reasons with exactly this limit.
+
+        :param charge: True for the charge, False for the discharge current limitation
+        :return: The lowest current limit and the limitation reason bitmask
+        """
+        max_current = self.max_battery_charge_current if charge else self.max_battery_discharge_current
+        limit_min = None
+        reasons = 0
+
+        for reason, calculate in self.get_current_limiters(charge):
+            limit = calculate()
+
+            # calculated limits equal to the battery maximum don't limit
+            if limit is None or (reason & LimitationReason.CALCULATED and limit == max_current):
+                continue
+
+            if limit_min is None or limit < limit_min:
+                limit_min = limit
+                reasons = reason
+            elif limit == limit_min:
+                reasons |= reason
+
+        # do not show the calculated reasons, if the global limitation is applied
+        if reasons & LimitationReason.MAX_BATTERY_CURRENT:
+            reasons &= ~LimitationReason.CALCULATED
+
+        return limit_min, reasons
+
     def calc_max_charge_current_from_cell_voltage(self) -> float:
         """
         Calculate the maximum charge current referring to the cell voltage.
 
         :return: The maximum charge current
         """
-        if self.get_max_cell_voltage() is None:
+        max_cell_voltage = self.get_derived_value("max_cell_voltage")
+
+        if max_cell_voltage is None:
             logger.warning(
                 "calc_max_charge_current_from_cell_voltage():"
-                + f" get_max_cell_voltage() is {self.get_max_cell_voltage()}, using default current instead."
+                + f" get_max_cell_voltage() is {max_cell_voltage}, using default current instead."
                 + " If you don't see this warning very often, you can ignore it."
             )
             return self.max_battery_charge_current
 
         try:
             if utils.CHARGE_MODE == 2:
-                return utils.calc_step_relationship(
-                    self.get_max_cell_voltage(),
-                    utils.CELL_VOLTAGES_WHILE_CHARGING,
-                    utils.MAX_CHARGE_CURRENT_CV,
-                    False,
-                )
+                return utils.MAX_CHARGE_CURRENT_CV_LOOKUP.step(max_cell_voltage, False)
             else:
-                return utils.calc_linear_relationship(
-                    self.get_max_cell_voltage(),
-                    utils.CELL_VOLTAGES_WHILE_CHARGING,
-                    utils.MAX_CHARGE_CURRENT_CV,
-                )
+                return utils.MAX_CHARGE_CURRENT_CV_LOOKUP.linear(max_cell_voltage)
         except Exception:
             # set error code, to show in the GUI that something is wrong
             self.manage_error_code(8)
@@ -1257,7 +1791,7 @@ class Battery(ABC):
                 + " If you don't see this warning very often, you can ignore it."
             )
             logger.error(
-                f"get_max_cell_voltage: {self.get_max_cell_voltage()}"
+                f"get_max_cell_voltage: {max_cell_voltage}"
                 + f" • CELL_VOLTAGES_WHILE_CHARGING: {utils.CELL_VOLTAGES_WHILE_CHARGING}"
                 + f" • MAX_CHARGE_CURRENT_CV: {utils.MAX_CHARGE_CURRENT_CV}"
             )
@@ -1274,35 +1808,28 @@ class Battery(ABC):
 
         :return: The maximum discharge current
         """
-        if self.get_min_cell_voltage() is None:
+        min_cell_voltage = self.get_derived_value("min_cell_voltage")
+
+        if min_cell_voltage is None:
             logger.warning(
                 "calc_max_discharge_current_from_cell_voltage():"
-                + f" get_min_cell_voltage() is {self.get_min_cell_voltage()}, using default current instead."
+                + f" get_min_cell_voltage() is {min_cell_voltage}, using default current instead."
                 + " If you don't see this warning very often, you can ignore it."
             )
             return self.max_battery_discharge_current
 
         try:
             if utils.CHARGE_MODE == 2:
-                return utils.calc_step_relationship(
-                    self.get_min_cell_voltage(),
-                    utils.CELL_VOLTAGES_WHILE_DISCHARGING,
-                    utils.MAX_DISCHARGE_CURRENT_CV,
-                    True,
-                )
+                return utils.MAX_DISCHARGE_CURRENT_CV_LOOKUP.step(min_cell_voltage, True)
             else:
-                return utils.calc_linear_relationship(
-                    self.get_min_cell_voltage(),
-                    utils.CELL_VOLTAGES_WHILE_DISCHARGING,
-                    utils.MAX_DISCHARGE_CURRENT_CV,
-                )
+                return utils.MAX_DISCHARGE_CURRENT_CV_LOOKUP.linear(min_cell_voltage)
         except Exception:
             # set error code, to show in the GUI that something is wrong
             self.manage_error_code(8)
 
             logger.error("calc_max_charge_current_from_cell_voltage(): Error while executing," + " using default current instead.")
             logger.error(
-                f"get_min_cell_voltage: {self.get_min_cell_voltage()}"
+                f"get_min_cell_voltage: {min_cell_voltage}"
                 + f" • CELL_VOLTAGES_WHILE_DISCHARGING: {utils.CELL_VOLTAGES_WHILE_DISCHARGING}"
                 + f" • MAX_DISCHARGE_CURRENT_CV: {utils.MAX_DISCHARGE_CURRENT_CV}"
             )
@@ -1319,37 +1846,27 @@ class Battery(ABC):
 
         :return: The maximum charge current
         """
-        if self.get_max_temperature() is None or self.get_min_temperature() is None:
+        max_temperature = self.get_derived_value("max_temperature")
+        min_temperature = self.get_derived_value("min_temperature")
+
+        if max_temperature is None or min_temperature is None:
             logging.warning(
                 "calc_max_charge_current_from_temperature():"
-                + f" get_max_temperature() is {self.get_max_temperature()} or get_min_temperature() is {self.get_min_temperature()}"
+                + f" get_max_temperature() is {max_temperature} or get_min_temperature() is {min_temperature}"
                 + ", using default current instead."
                 + " If you don't see this warning very often, you can ignore it."
             )
             return self.max_battery_charge_current
 
-        temperatures = {0: self.get_max_temperature(), 1: self.get_min_temperature()}
+        temperatures = {0: max_temperature, 1: min_temperature}
         currents = []
 
         try:
             for key, currentMaxTemperature in temperatures.items():
                 if utils.CHARGE_MODE == 2:
-                    currents.append(
-                        utils.calc_step_relationship(
-                            currentMaxTemperature,
-                            utils.TEMPERATURES_WHILE_CHARGING,
-                            utils.MAX_CHARGE_CURRENT_T,
-                            False,
-                        )
-                    )
+                    currents.append(utils.MAX_CHARGE_CURRENT_T_LOOKUP.step(currentMaxTemperature, False))
                 else:
-                    currents.append(
-                        utils.calc_linear_relationship(
-                            currentMaxTemperature,
-                            utils.TEMPERATURES_WHILE_CHARGING,
-                            utils.MAX_CHARGE_CURRENT_T,
-                        )
-                    )
+                    currents.append(utils.MAX_CHARGE_CURRENT_T_LOOKUP.linear(currentMaxTemperature))
             return min(currents)
         except Exception:
             # set error code, to show in the GUI that something is wrong
@@ -1374,37 +1891,27 @@ class Battery(ABC):
 
         :return: The maximum discharge current
         """
-        if self.get_max_temperature() is None or self.get_min_temperature() is None:
+        max_temperature = self.get_derived_value("max_temperature")
+        min_temperature = self.get_derived_value("min_temperature")
+
+        if max_temperature is None or min_temperature is None:
             logging.warning(
                 "calc_max_discharge_current_from_temperature():"
-                + f" get_max_temperature() is {self.get_max_temperature()} or get_min_temperature() is {self.get_min_temperature()}"
+                + f" get_max_temperature() is {max_temperature} or get_min_temperature() is {min_temperature}"
                 + ", using default current instead."
                 + " If you don't see this warning very often, you can ignore it."
             )
             return self.max_battery_discharge_current
 
-        temperatures = {0: self.get_max_temperature(), 1: self.get_min_temperature()}
+        temperatures = {0: max_temperature, 1: min_temperature}
         currents = []
 
         try:
             for key, currentMaxTemperature in temperatures.items():
                 if utils.CHARGE_MODE == 2:
-                    currents.append(
-                        utils.calc_step_relationship(
-                            currentMaxTemperature,
-                            utils.TEMPERATURES_WHILE_DISCHARGING,
-                            utils.MAX_DISCHARGE_CURRENT_T,
-                            True,
-                        )
-                    )
+                    currents.append(utils.MAX_DISCHARGE_CURRENT_T_LOOKUP.step(currentMaxTemperature, True))
                 else:
-                    currents.append(
-                        utils.calc_linear_relationship(
-                            currentMaxTemperature,
-                            utils.TEMPERATURES_WHILE_DISCHARGING,
-                            utils.MAX_DISCHARGE_CURRENT_T,
-                        )
-                    )
+                    currents.append(utils.MAX_DISCHARGE_CURRENT_T_LOOKUP.linear(currentMaxTemperature))
             return min(currents)
         except Exception:
             # set error code, to show in the GUI that something is wrong
@@ -1434,18 +1941,9 @@ class Battery(ABC):
 
         try:
             if utils.CHARGE_MODE == 2:
-                return utils.calc_step_relationship(
-                    self.temperature_mos,
-                    utils.MOSFET_TEMPERATURES_WHILE_CHARGING,
-                    utils.MAX_CHARGE_CURRENT_T_MOSFET,
-                    False,
-                )
+                return utils.MAX_CHARGE_CURRENT_T_MOSFET_LOOKUP.step(self.temperature_mos, False)
             else:
-                return utils.calc_linear_relationship(
-                    self.temperature_mos,
-                    utils.MOSFET_TEMPERATURES_WHILE_CHARGING,
-                    utils.MAX_CHARGE_CURRENT_T_MOSFET,
-                )
+                return utils.MAX_CHARGE_CURRENT_T_MOSFET_LOOKUP.linear(self.temperature_mos)
         except Exception:
             # set error code, to show in the GUI that something is wrong
             self.manage_error_code(8)
@@ -1474,18 +1972,9 @@ class Battery(ABC):
 
         try:
             if utils.CHARGE_MODE == 2:
-                return utils.calc_step_relationship(
-                    self.temperature_mos,
-                    utils.MOSFET_TEMPERATURES_WHILE_DISCHARGING,
-                    utils.MAX_DISCHARGE_CURRENT_T_MOSFET,
-                    False,
-                )
+                return utils.MAX_DISCHARGE_CURRENT_T_MOSFET_LOOKUP.step(self.temperature_mos, False)
             else:
-                return utils.calc_linear_relationship(
-                    self.temperature_mos,
-                    utils.MOSFET_TEMPERATURES_WHILE_DISCHARGING,
-                    utils.MAX_DISCHARGE_CURRENT_T_MOSFET,
-                )
+                return utils.MAX_DISCHARGE_CURRENT_T_MOSFET_LOOKUP.linear(self.temperature_mos)
         except Exception:
             # set error code, to show in the GUI that something is wrong
             self.manage_error_code(8)
@@ -1511,18 +2000,9 @@ class Battery(ABC):
         """
         try:
             if utils.CHARGE_MODE == 2:
-                return utils.calc_step_relationship(
-                    self.soc_calc,
-                    utils.SOC_WHILE_CHARGING,
-                    utils.MAX_CHARGE_CURRENT_SOC,
-                    True,
-                )
+                return utils.MAX_CHARGE_CURRENT_SOC_LOOKUP.step(self.soc_calc, True)
             else:
-                return utils.calc_linear_relationship(
-                    self.soc_calc,
-                    utils.SOC_WHILE_CHARGING,
-                    utils.MAX_CHARGE_CURRENT_SOC,
-                )
+                return utils.MAX_CHARGE_CURRENT_SOC_LOOKUP.linear(self.soc_calc)
         except Exception:
             # set error code, to show in the GUI that something is wrong
             self.manage_error_code(8)
@@ -1548,18 +2028,9 @@ class Battery(ABC):
         """
         try:
             if utils.CHARGE_MODE == 2:
-                return utils.calc_step_relationship(
-                    self.soc_calc,
-                    utils.SOC_WHILE_DISCHARGING,
-                    utils.MAX_DISCHARGE_CURRENT_SOC,
-                    True,
-                )
+                return utils.MAX_DISCHARGE_CURRENT_SOC_LOOKUP.step(self.soc_calc, True)
             else:
-                return utils.calc_linear_relationship(
-                    self.soc_calc,
-                    utils.SOC_WHILE_DISCHARGING,
-                    utils.MAX_DISCHARGE_CURRENT_SOC,
-                )
+                return utils.MAX_DISCHARGE_CURRENT_SOC_LOOKUP.linear(self.soc_calc)
         except Exception:
             # set error code, to show in the GUI that something is wrong
             self.manage_error_code(8)
@@ -1577,22 +2048,64 @@ class Battery(ABC):
             logger.error(f"Exception occurred: {repr(exception_object)} of type {exception_type} in {file} line #{line}")
             return self.max_battery_discharge_current
 
+    def update_derived_snapshot(self) -> None:
+        """
+        Calculate the values derived from the BMS data once, after `refresh_data()` succeeded.
+        The getters are called, so that overrides of the drivers are respected.
+
+        :return: None
+        """
+        self.derived_snapshot = {
+            "min_cell_voltage": self.get_min_cell_voltage(),
+            "max_cell_voltage": self.get_max_cell_voltage(),
+            "min_cell_desc": self.get_min_cell_desc(),
+            "max_cell_desc": self.get_max_cell_desc(),
+            "filtered_temperature_map": self.get_filtered_temperature_map(),
+            "temperature": self.get_temperature(),
+            "min_temperature": self.get_min_temperature(),
+            "max_temperature": self.get_max_temperature(),
+        }
+
+    def invalidate_derived_snapshot(self) -> None:
+        """
+        Invalidate the derived values before new data is read from the BMS.
+
+        :return: None
+        """
+        self.derived_snapshot = None
+
+    def get_derived_value(self, name: str) -> Union[float, int, str, dict, None]:
+        """
+        Get a value from the derived snapshot. If there is no snapshot for the current data,
+        it's calculated first.
+
+        :param name: The name of the value, e.g. `max_cell_voltage`
+        :return: The derived value
+        """
+        if self.derived_snapshot is None:
+            self.update_derived_snapshot()
+        return self.derived_snapshot[name]
+
+    def get_cell_statistics(self) -> Dict[str, Union[float, int, None]]:
+        """
+        Get the statistics of the cells within the cell count.
+        They are calculated in a single pass and cached until the driver writes new cell data.
+        See `CellList.get_statistics()` for the available keys.
+
+        :return: The statistics of the cells
+        """
+        return self.cells.get_statistics(self.cell_count)
+
     def get_min_cell(self) -> int:
         """
         Get the cell with the lowest voltage.
 
         :return: The number of the cell with the lowest voltage
         """
-        min_voltage = 9999
-        min_cell = None
         if len(self.cells) == 0 and hasattr(self, "cell_min_no"):
             return self.cell_min_no
 
-        for c in range(min(len(self.cells), self.cell_count)):
-            if self.cells[c].voltage is not None and min_voltage > self.cells[c].voltage:
-                min_voltage = self.cells[c].voltage
-                min_cell = c
-        return min_cell
+        return self.get_cell_statistics()["argmin"]
 
     def get_max_cell(self) -> int:
         """
@@ -1600,16 +2113,12 @@ class Battery(ABC):
 
         :return: The number of the cell with the highest voltage
         """
-        max_voltage = 0
-        max_cell = None
         if len(self.cells) == 0 and hasattr(self, "cell_max_no"):
             return self.cell_max_no
 
-        for c in range(min(len(self.cells), self.cell_count)):
-            if self.cells[c].voltage is not None and max_voltage < self.cells[c].voltage:
-                max_voltage = self.cells[c].voltage
-                max_cell = c
-        return max_cell
+        statistics = self.get_cell_statistics()
+        # a cell with 0 V is not considered as the highest cell
+        return statistics["argmax"] if statistics["max"] is not None and statistics["max"] > 0 else None
 
     def get_min_cell_desc(self) -> Union[str, None]:
         """
@@ -1646,12 +2155,7 @@ class Battery(ABC):
 
         :return: The sum of all cell voltages
         """
-        voltage_sum = 0
-        for i in range(self.cell_count):
-            voltage = self.get_cell_voltage(i)
-            if voltage:
-                voltage_sum += voltage
-        return voltage_sum
+        return self.get_cell_statistics()["sum"]
 
     def get_cell_balancing(self, idx: int) -> Union[int, None]:
         """
@@ -1775,10 +2279,7 @@ class Battery(ABC):
             min_voltage = self.cell_min_voltage
 
         if min_voltage is None:
-            try:
-                min_voltage = min(c.voltage for c in self.cells if c.voltage is not None)
-            except ValueError:
-                pass
+            min_voltage = self.get_cell_statistics()["min"]
         return min_voltage
 
     def get_max_cell_voltage(self) -> Union[float, None]:
@@ -1787,10 +2288,7 @@ class Battery(ABC):
             max_voltage = self.cell_max_voltage
 
         if max_voltage is None:
-            try:
-                max_voltage = max(c.voltage for c in self.cells if c.voltage is not None)
-            except ValueError:
-                pass
+            max_voltage = self.get_cell_statistics()["max"]
         return max_voltage
 
     def get_midvoltage(self) -> Tuple[Union[float, None], Union[float, None]]:
@@ -1803,35 +2301,26 @@ class Battery(ABC):
         if not utils.MIDPOINT_ENABLE or self.cell_count is None or self.cell_count == 0 or self.cell_count < 4 or len(self.cells) != self.cell_count:
             return None, None
 
-        halfcount = int(math.floor(self.cell_count / 2))
-        uneven_cells_offset = self.cell_count % 2
-        half1voltage = 0
-        half2voltage = 0
+        statistics = self.get_cell_statistics()
+        half1voltage = statistics["half1"]
+        half2voltage = statistics["half2"]
 
-        try:
-            half1voltage = sum(cell.voltage for cell in self.cells[:halfcount] if cell.voltage is not None)
-            half2voltage = sum(cell.voltage for cell in self.cells[halfcount + uneven_cells_offset :] if cell.voltage is not None)
-        except ValueError:
-            pass
+        # the middle cell of an uneven number of cells has no voltage
+        if statistics["middle"] is None:
+            return None, None
 
-        try:
-            extra = 0 if self.cell_count % 2 == 0 else self.cells[halfcount].voltage / 2
-            # get the midpoint of the battery
-            midpoint = half1voltage + extra
-            if (half2voltage + half1voltage) == 0:
-                return None, None
-            return (
-                abs(midpoint),
-                abs((half2voltage - half1voltage) / (half2voltage + half1voltage) * 100),
-            )
-        except ValueError:
+        extra = statistics["middle"] / 2
+        # get the midpoint of the battery
+        midpoint = half1voltage + extra
+        if (half2voltage + half1voltage) == 0:
             return None, None
+        return (
+            abs(midpoint),
+            abs((half2voltage - half1voltage) / (half2voltage + half1voltage) * 100),
+        )
 
     def get_balancing(self) -> int:
-        for c in range(min(len(self.cells), self.cell_count)):
-            if self.cells[c].balance is not None and self.cells[c].balance:
-                return 1
-        return 0
+        return self.get_cell_statistics()["balancing"]
 
     def get_filtered_temperature_map(self) -> Dict[int, float]:
         """
@@ -1868,7 +2357,7 @@ class Battery(ABC):
 
     def get_min_temperature_id(self) -> Union[str, None]:
         try:
-            temperature_map = self.get_filtered_temperature_map()
+            temperature_map = self.get_derived_value("filtered_temperature_map")
             temperatures = [(temperature, sensor) for sensor, temperature in temperature_map.items()]
             if not temperatures:
                 return None
@@ -1889,7 +2378,7 @@ class Battery(ABC):
 
     def get_max_temperature_id(self) -> Union[str, None]:
         try:
-            temperature_map = self.get_filtered_temperature_map()
+            temperature_map = self.get_derived_value("filtered_temperature_map")
             temperatures = [(temperature, sensor) for sensor, temperature in temperature_map.items()]
             if not temperatures:
                 return None
@@ -1930,61 +2419,117 @@ class Battery(ABC):
 
     def setup_external_sensor(self) -> None:
         """
-        Setup external sensor and it's dbus items
+        Setup external sensor and it's dbus items.
+
+        The presence of the external sensor service is tracked with a NameOwnerChanged
+        subscription, so the poll loop doesn't have to query the bus daemon. The values
+        itself are cached in VeDbusItemImport objects and updated via PropertiesChanged.
         """
         import dbus
         import os
         from dbus.mainloop.glib import DBusGMainLoop
-        from vedbus import VeDbusItemImport
 
         # setup external dbus paths
         try:
             DBusGMainLoop(set_as_default=True)
 
             # connect to the sessionbus, on a CC GX the systembus is used
-            dbus_connection = dbus.SessionBus() if "DBUS_SESSION_BUS_ADDRESS" in os.environ else dbus.SystemBus()
+            self.dbus_external_connection = dbus.SessionBus() if "DBUS_SESSION_BUS_ADDRESS" in os.environ else dbus.SystemBus()
+
+            # subscribe to NameOwnerChanged for the external sensor service
+            # the callback is also called once with the current owner, which creates the dbus items
+            if self.dbus_external_name_watch is None:
+                self.dbus_external_name_watch = self.dbus_external_connection.watch_name_owner(
+                    utils.EXTERNAL_SENSOR_DBUS_DEVICE, self.external_sensor_owner_changed
+                )
+
+        except Exception:
+            self.external_sensor_setup_failed()
 
+    def external_sensor_owner_changed(self, new_owner: str) -> None:
+        """
+        Called when the owner of the external sensor dbus service changes.
+        An empty owner means that the service disappeared from the dbus.
+
+        :param new_owner: The unique bus name of the new owner or an empty string
+        """
+        from vedbus import VeDbusItemImport
+
+        # external sensor disconnected
+        if new_owner == "":
+            if self.dbus_external_objects is not None:
+                logger.error("External current sensor was disconnected, falling back to internal sensor")
+            self.dbus_external_objects = None
+            return
+
+        # external sensor already connected
+        if self.dbus_external_objects is not None:
+            return
+
+        try:
             # dictionary containing the different items
             dbus_objects = {}
 
-            # check if the dbus service is available
-            is_present_in_vebus = utils.EXTERNAL_SENSOR_DBUS_DEVICE in dbus_connection.list_names()
+            if utils.EXTERNAL_SENSOR_DBUS_PATH_CURRENT is not None:
+                logger.info("Using external sensor for current: " + f"{utils.EXTERNAL_SENSOR_DBUS_DEVICE}{utils.EXTERNAL_SENSOR_DBUS_PATH_CURRENT}")
+                dbus_objects["Current"] = VeDbusItemImport(
+                    self.dbus_external_connection,
+                    utils.EXTERNAL_SENSOR_DBUS_DEVICE,
+                    utils.EXTERNAL_SENSOR_DBUS_PATH_CURRENT,
+                )
+
+            if utils.EXTERNAL_SENSOR_DBUS_PATH_SOC is not None:
+                logger.info("Using external sensor for SOC: " + f"{utils.EXTERNAL_SENSOR_DBUS_DEVICE}{utils.EXTERNAL_SENSOR_DBUS_PATH_SOC}")
+                dbus_objects["Soc"] = VeDbusItemImport(
+                    self.dbus_external_connection,
+                    utils.EXTERNAL_SENSOR_DBUS_DEVICE,
+                    utils.EXTERNAL_SENSOR_DBUS_PATH_SOC,
+                )
 
-            if is_present_in_vebus:
+            self.dbus_external_objects = dbus_objects
 
-                if utils.EXTERNAL_SENSOR_DBUS_PATH_CURRENT is not None:
-                    logger.info("Using external sensor for current: " + f"{utils.EXTERNAL_SENSOR_DBUS_DEVICE}{utils.EXTERNAL_SENSOR_DBUS_PATH_CURRENT}")
-                    dbus_objects["Current"] = VeDbusItemImport(
-                        dbus_connection,
-                        utils.EXTERNAL_SENSOR_DBUS_DEVICE,
-                        utils.EXTERNAL_SENSOR_DBUS_PATH_CURRENT,
-                    )
+        except Exception:
+            self.external_sensor_setup_failed()
 
-                if utils.EXTERNAL_SENSOR_DBUS_PATH_SOC is not None:
-                    logger.info("Using external sensor for SOC: " + f"{utils.EXTERNAL_SENSOR_DBUS_DEVICE}{utils.EXTERNAL_SENSOR_DBUS_PATH_SOC}")
-                    dbus_objects["Soc"] = VeDbusItemImport(
-                        dbus_connection,
-                        utils.EXTERNAL_SENSOR_DBUS_DEVICE,
-                        utils.EXTERNAL_SENSOR_DBUS_PATH_SOC,
-                    )
+    def external_sensor_setup_failed(self) -> None:
+        """
+        Disable the external sensor after a failed setup and fallback to the battery values
+        """
+        # set to None to avoid crashing, fallback to battery current
+        utils.EXTERNAL_SENSOR_DBUS_DEVICE = None
+        utils.EXTERNAL_SENSOR_DBUS_PATH_CURRENT = None
+        utils.EXTERNAL_SENSOR_DBUS_PATH_SOC = None
+        self.dbus_external_objects = None
 
-                self.dbus_external_objects = dbus_objects
+        # stop watching the external sensor service
+        if self.dbus_external_name_watch is not None:
+            self.dbus_external_name_watch.cancel()
+            self.dbus_external_name_watch = None
 
-        except Exception:
-            # set to None to avoid crashing, fallback to battery current
-            utils.EXTERNAL_SENSOR_DBUS_DEVICE = None
-            utils.EXTERNAL_SENSOR_DBUS_PATH_CURRENT = None
-            utils.EXTERNAL_SENSOR_DBUS_PATH_SOC = None
-            self.dbus_external_objects = None
-            (
-                exception_type,
-                exception_object,
-                exception_traceback,
-            ) = sys.exc_info()
-            file = exception_traceback.tb_frame.f_code.co_filename
-            line = exception_traceback.tb_lineno
-            logger.error("Exception occurred: " + f"{repr(exception_object)} of type {exception_type} in {file} line #{line}")
-            logger.error("External current sensor setup failed, fallback to internal sensor")
+        (
+            exception_type,
+            exception_object,
+            exception_traceback,
+        ) = sys.exc_info()
+        file = exception_traceback.tb_frame.f_code.co_filename
+        line = exception_traceback.tb_lineno
+        logger.error("Exception occurred: " + f"{repr(exception_object)} of type {exception_type} in {file} line #{line}")
+        logger.error("External current sensor setup failed, fallback to internal sensor")
+
+    def correct_current(self, current: float) -> float:
+        """
+        Correct the current reported by the BMS with `CURRENT_REPORTED_BY_BMS` and `CURRENT_MEASURED_BY_USER`.
+
+        :param current: The current reported by the BMS
+        :return: The corrected current
+        """
+        # calculate current only, if lists are different
+        if utils.CURRENT_CORRECTION:
+            # calculate current from real current
+            return round(utils.CURRENT_CORRECTION_LOOKUP.linear(current), 3)
+
+        # use current as it is
+        return current
 
     def get_current(self) -> Union[float, None]:
         """
@@ -1994,69 +2539,93 @@ class Battery(ABC):
 
         :return: The current
         """
-        current_time = time()
-
-        # Has to be calculated from last measurement until now
-        if self.current_calc is not None and self.current_calc_last_time is not None:
-            # Calculate charge based on the current from last measurement until now
-            charge = self.current_calc / 3600 * (current_time - self.current_calc_last_time)
-
-            # Coloumb count charged charge
-            self.charge_charged += charge if charge > 0 else 0
-
-            # Coloumb count discharged charge
-            self.charge_discharged += charge * -1 if charge < 0 else 0
-            self.charge_discharged_last += charge * -1 if charge < 0 else 0
-
         # get external sensor value
-        if self.dbus_external_objects is not None and "Current" in self.dbus_external_objects and self.dbus_external_objects["Current"] is not None:
+        if not self.current_calc_is_from_bms():
             current_external = round(self.dbus_external_objects["Current"].get_value(), 3)
             logger.debug(f"current: {self.current} - current_external: {current_external}")
-            current = current_external
-        else:
-            # calculate current only, if lists are different
-            if utils.CURRENT_CORRECTION:
-                # calculate current from real current
-                current = round(
-                    utils.calc_linear_relationship(
-                        self.current,
-                        utils.CURRENT_REPORTED_BY_BMS,
-                        utils.CURRENT_MEASURED_BY_USER,
-                    ),
-                    3,
-                )
-                # set for debugging
-                self.current_corrected = current
-            else:
-                # use current as it is
-                current = self.current
+            return current_external
+
+        if self.current is None:
+            return None
+
+        current = self.correct_current(self.current)
+        if utils.CURRENT_CORRECTION:
+            # set for debugging
+            self.current_corrected = current
 
-        self.current_calc_last_time = current_time
         return current
 
-    def get_power(self) -> Union[float, None]:
+    def integrate_charge_and_energy(self) -> None:
         """
-        Calculate the power from the current and voltage.
+        Integrate the current to the charge (coulomb counting) and the power to the energy
+        with the trapezoidal rule. Uses the monotonic timestamps of the samples and all
+        additional samples the transport collected since the last cycle.
 
-        :return: The power
+        :return: None
         """
-        current_time = time()
+        timestamp = self.current_timestamp if self.current_timestamp is not None and self.current_calc_is_from_bms() else monotonic()
+        self.current_timestamp = None
+        samples = []
 
-        # Has to be calculated from last measurement until now
-        if self.power_calc is not None and self.power_calc_last_time is not None:
-            # Calculate energy based on the power from last measurement until now
-            energy = self.power_calc / 3600 * (current_time - self.power_calc_last_time)
+        # swap the list first, since BLE drivers can add samples from their own thread
+        current_samples, self.current_samples = self.current_samples, []
 
-            # Coloumb count charged energy
-            self.energy_charged += energy if energy > 0 else 0
+        # additional samples of the BMS current, not available if an external sensor is used
+        if current_samples and self.current_calc is not None and self.current_calc_is_from_bms():
+            samples = [
+                (sample_timestamp, self.correct_current(current)) for sample_timestamp, current in sorted(current_samples) if sample_timestamp < timestamp
+            ]
+
+        # prevent errors, if the values were reset due to connection loss, and don't integrate the gap
+        if self.current_calc is None:
+            self.charge_integrator.reset()
+            self.energy_integrator.reset()
+            self.charge_delta = 0
+            return
+
+        samples.append((timestamp, self.current_calc))
+
+        charged = 0.0
+        discharged = 0.0
+        energy_charged = 0.0
+        energy_discharged = 0.0
+        for sample_timestamp, current in samples:
+            positive, negative = self.charge_integrator.add(current, sample_timestamp)
+            charged += positive
+            discharged += negative
+
+            if self.voltage is not None:
+                positive, negative = self.energy_integrator.add(self.voltage * current, sample_timestamp)
+                energy_charged += positive
+                energy_discharged += negative
+            else:
+                self.energy_integrator.reset()
+
+        # Coloumb count charged and discharged charge in Ah
+        self.charge_charged += charged / 3600
+        self.charge_discharged += discharged / 3600
+        self.charge_discharged_last += discharged / 3600
+        self.charge_delta = (charged - discharged) / 3600
 
-            # Coloumb count discharged energy
-            self.energy_discharged += energy * -1 if energy < 0 else 0
+        # Count charged and discharged energy in Wh
+        self.energy_charged += energy_charged / 3600
+        self.energy_discharged += energy_discharged / 3600
 
-        power = self.voltage * self.current_calc if self.current_calc is not None and self.voltage is not None else None
+    def current_calc_is_from_bms(self) -> bool:
+        """
+        Check if the calculated current is based on the BMS current and not on an external sensor.
+
+        :return: True if the current of the BMS is used
+        """
+        return not (self.dbus_external_objects is not None and "Current" in self.dbus_external_objects and self.dbus_external_objects["Current"] is not None)
+
+    def get_power(self) -> Union[float, None]:
+        """
+        Calculate the power from the current and voltage.
 
-        self.power_calc_last_time = current_time
-        return power
+        :return: The power
+        """
+        return self.voltage * self.current_calc if self.current_calc is not None and self.voltage is not None else None
 
     def get_soc(self) -> Union[float, None]:
         """
@@ -2087,6 +2656,7 @@ class Battery(ABC):
         """
         self.current_calc = self.get_current()
         self.power_calc = self.get_power()
+        self.integrate_charge_and_energy()
         self.soc_calc = self.get_soc()
 
     def manage_error_code(self, error_code: int = 8) -> None:
@@ -2194,6 +2764,11 @@ class Battery(ABC):
         """
         Calculate missing values based on the history data
         """
+        min_cell_voltage = self.get_derived_value("min_cell_voltage")
+        max_cell_voltage = self.get_derived_value("max_cell_voltage")
+        min_temperature = self.get_derived_value("min_temperature")
+        max_temperature = self.get_derived_value("max_temperature")
+
         if "deepest_discharge" not in self.history.exclude_values_to_calculate and self.get_capacity_consumed() is not None:
             # Has to be negative
             if self.history.deepest_discharge is None or self.history.deepest_discharge > self.get_capacity_consumed():
@@ -2250,41 +2825,39 @@ class Battery(ABC):
             if self.history.maximum_voltage is None or (self.voltage is not None and self.history.maximum_voltage < self.voltage):
                 self.history.maximum_voltage = self.voltage
 
-        if "minimum_cell_voltage" not in self.history.exclude_values_to_calculate and self.get_min_cell_voltage() is not None:
-            if self.history.minimum_cell_voltage is None or (
-                self.get_min_cell_voltage() is not None and self.history.minimum_cell_voltage > self.get_min_cell_voltage()
-            ):
-                self.history.minimum_cell_voltage = self.get_min_cell_voltage()
+        if "minimum_cell_voltage" not in self.history.exclude_values_to_calculate and min_cell_voltage is not None:
+            if self.history.minimum_cell_voltage is None or (min_cell_voltage is not None and self.history.minimum_cell_voltage > min_cell_voltage):
+                self.history.minimum_cell_voltage = min_cell_voltage
 
-        if "maximum_cell_voltage" not in self.history.exclude_values_to_calculate and self.get_max_cell_voltage() is not None:
-            if self.history.maximum_cell_voltage is None or (
-                self.get_max_cell_voltage() is not None and self.history.maximum_cell_voltage < self.get_max_cell_voltage()
-            ):
-                self.history.maximum_cell_voltage = self.get_max_cell_voltage()
+        if "maximum_cell_voltage" not in self.history.exclude_values_to_calculate and max_cell_voltage is not None:
+            if self.history.maximum_cell_voltage is None or (max_cell_voltage is not None and self.history.maximum_cell_voltage < max_cell_voltage):
+                self.history.maximum_cell_voltage = max_cell_voltage
 
         if "low_voltage_alarms" not in self.history.exclude_values_to_calculate:
             if self.history.low_voltage_alarms is None:
                 self.history.low_voltage_alarms = 0
-            elif (self.protection.low_voltage is not None and self.protection.low_voltage > 0 and self.protection.previous_low_voltage == 0) or (
-                self.protection.low_cell_voltage is not None and self.protection.low_cell_voltage > 0 and self.protection.previous_low_cell_voltage == 0
+            elif (self.protection.low_voltage is not None and self.protection.low_voltage > 0 and self.protection.get_previous("low_voltage") == 0) or (
+                self.protection.low_cell_voltage is not None and self.protection.low_cell_voltage > 0 and self.protection.get_previous("low_cell_voltage") == 0
             ):
                 self.history.low_voltage_alarms += 1
 
         if "high_voltage_alarms" not in self.history.exclude_values_to_calculate:
             if self.history.high_voltage_alarms is None:
                 self.history.high_voltage_alarms = 0
-            elif (self.protection.high_voltage is not None and self.protection.high_voltage > 0 and self.protection.previous_high_voltage == 0) or (
-                self.protection.high_cell_voltage is not None and self.protection.high_cell_voltage > 0 and self.protection.previous_high_cell_voltage == 0
+            elif (self.protection.high_voltage is not None and self.protection.high_voltage > 0 and self.protection.get_previous("high_voltage") == 0) or (
+                self.protection.high_cell_voltage is not None
+                and self.protection.high_cell_voltage > 0
+                and self.protection.get_previous("high_cell_voltage") == 0
             ):
                 self.history.high_voltage_alarms += 1
 
-        if "minimum_temperature" not in self.history.exclude_values_to_calculate and self.get_min_temperature() is not None:
-            if self.history.minimum_temperature is None or self.history.minimum_temperature > self.get_min_temperature():
-                self.history.minimum_temperature = self.get_min_temperature()
+        if "minimum_temperature" not in self.history.exclude_values_to_calculate and min_temperature is not None:
+            if self.history.minimum_temperature is None or self.history.minimum_temperature > min_temperature:
+                self.history.minimum_temperature = min_temperature
 
-        if "maximum_temperature" not in self.history.exclude_values_to_calculate and self.get_max_temperature() is not None:
-            if self.history.maximum_temperature is None or self.history.maximum_temperature < self.get_max_temperature():
-                self.history.maximum_temperature = self.get_max_temperature()
+        if "maximum_temperature" not in self.history.exclude_values_to_calculate and max_temperature is not None:
+            if self.history.maximum_temperature is None or self.history.maximum_temperature < max_temperature:
+                self.history.maximum_temperature = max_temperature
 
         if "discharged_energy" not in self.history.exclude_values_to_calculate:
             if self.history.discharged_energy is None:
@@ -2310,6 +2883,78 @@ class Battery(ABC):
                 # reset energy_charged, since it is already added to the history
                 self.energy_charged = 0
 
+    def estimate_cell_resistances(self) -> None:
+        """
+        Update the estimation of the internal resistance of the cells with the values of this cycle.
+
+        :return: None
+        """
+        if not utils.CELL_RESISTANCE_ENABLE or not self.cell_count:
+            return
+
+        if self.resistance_estimator is None or self.resistance_estimator.cell_count != self.cell_count:
+            self.resistance_estimator = utils.ResistanceEstimator(
+                self.cell_count, utils.CELL_RESISTANCE_MIN_CURRENT_STEP, utils.CELL_RESISTANCE_FORGETTING_FACTOR
+            )
+            self.cell_resistances = [None] * self.cell_count
+
+        # use the current of the BMS, an external sensor is not synchronized with the cell voltages at all
+        if self.current is None or len(self.cells) < self.cell_count:
+            return
+
+        # some BMS send the cell voltages less often than the current (e.g. JKBMS CAN every 1000 ms, the current every 20 ms),
+        # so the drivers publish the cached cell voltages again. Pairing them with a newer current would add a current step
+        # without its voltage step, therefore only update the estimation when new cell voltages were received
+        voltages = self.cells.voltages[: self.cell_count]
+        if voltages == self.resistance_estimator.last_voltages:
+            return
+
+        if self.resistance_estimator.update(monotonic(), self.correct_current(self.current), voltages):
+            self.cell_resistances = self.resistance_estimator.get_resistances()
+
+    def record_time_series(self) -> None:
+        """
+        Add the values of this cycle to the time series. The time series is created on the first call
+        and columns are appended, when the cell count increases, since some drivers know it only later.
+
+        Query the values with `self.time_series.query()`, e.g. the cell voltages of the last hour:
+        `self.time_series.query(["cell_1", "cell_2"], time() - 3600, time())`
+
+        :return: None
+        """
+        if not utils.TIME_SERIES_ENABLE or not utils.TIME_SERIES_LEVELS:
+            return
+
+        if self.time_series is None:
+            cell_names = tuple(f"cell_{cell}" for cell in range(1, (self.cell_count or 0) + 1))
+            self.time_series = utils.TimeSeries(self.TIME_SERIES_NAMES + cell_names, utils.TIME_SERIES_LEVELS)
+            logger.info(f"Time series with {len(self.time_series.names)} values uses {self.time_series.get_memory_size() / 1024:.0f} kB of memory")
+
+        cell_count = len(self.time_series.names) - len(self.TIME_SERIES_NAMES)
+        if (self.cell_count or 0) > cell_count:
+            self.time_series.add_columns(f"cell_{cell}" for cell in range(cell_count + 1, self.cell_count + 1))
+            cell_count = self.cell_count
+            logger.info(f"Time series with {len(self.time_series.names)} values uses {self.time_series.get_memory_size() / 1024:.0f} kB of memory")
+
+        values = [
+            self.voltage,
+            self.current_calc,
+            self.power_calc,
+            self.soc_calc,
+            self.get_derived_value("temperature"),
+            self.get_derived_value("min_temperature"),
+            self.get_derived_value("max_temperature"),
+            self.get_derived_value("min_cell_voltage"),
+            self.get_derived_value("max_cell_voltage"),
+            self.control_voltage,
+            self.control_charge_current,
+            self.control_discharge_current,
+        ]
+        # the voltages of missing cells are NaN and are ignored like None
+        values.extend(self.cells.voltages[:cell_count])
+
+        self.time_series.add(time(), values)
+
     def history_reset_callback(self, path: str, value: int) -> bool:
         """
         Callback to reset the history values.
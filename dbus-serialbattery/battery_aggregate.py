@@ -0,0 +1,285 @@
+# -*- coding: utf-8 -*-
+from typing import Union, Tuple, List, Callable
+from battery import Battery, LimitationReason, Protection
+from utils import logger
+
+
+class AggregateBattery(Battery):
+    """
+    Virtual battery that combines all batteries of this driver instance, which are connected in parallel.
+
+    The values are calculated directly from the data of the batteries after they were refreshed,
+    so no additional dbus round trip is needed. It has to be published after all batteries.
+    """
+
+    def __init__(self, batteries: List[Battery]):
+        super(AggregateBattery, self).__init__(batteries[0].port, batteries[0].baud_rate, None)
+        self.batteries: List[Battery] = batteries
+        self.batteries_online: List[Battery] = []
+        """
+        Batteries that were online in the last refresh, only those are combined.
+        """
+        self.type = "Aggregate"
+        self.poll_interval = batteries[0].poll_interval
+
+    def test_connection(self) -> bool:
+        """
+        The batteries are already connected, so only the settings have to be combined.
+
+        :return: True if the settings could be combined
+        """
+        return self.get_settings()
+
+    def get_settings(self) -> bool:
+        """
+        Combine the settings of the batteries.
+
+        :return: True if successful
+        """
+        batteries = self.batteries
+
+        # batteries connected in parallel have the same number of cells in series
+        self.cell_count = batteries[0].cell_count
+        self.capacity = self.get_sum([battery.capacity for battery in batteries])
+        self.max_battery_charge_current = self.get_sum([battery.max_battery_charge_current for battery in batteries])
+        self.max_battery_discharge_current = self.get_sum([battery.max_battery_discharge_current for battery in batteries])
+        self.hardware_version = f"{len(batteries)} x " + (batteries[0].hardware_version if batteries[0].hardware_version else batteries[0].type)
+
+        return True
+
+    def unique_identifier(self) -> str:
+        """
+        The virtual battery is identified by the batteries it combines.
+
+        :return: the unique identifier
+        """
+        return "Aggregate_" + "_".join(battery.unique_identifier() for battery in self.batteries)
+
+    def connection_name(self) -> str:
+        return f"Aggregate of {len(self.batteries)} batteries on " + self.port
+
+    def setup_external_sensor(self) -> None:
+        """
+        The external sensor is used by the batteries itself, the virtual battery takes over their values.
+
+        :return: None
+        """
+        return
+
+    def get_battery_name(self, battery: Battery) -> str:
+        """
+        Get the short name of a battery, which is used to mark the values in the GUI.
+
+        :param battery: One of the combined batteries
+        :return: The name, e.g. `B2` for the second battery
+        """
+        return "B" + str(self.batteries.index(battery) + 1)
+
+    def refresh_data(self) -> bool:
+        """
+        Combine the data of the batteries, which are online.
+
+        :return: False if no battery is online, else True
+        """
+        batteries = [battery for battery in self.batteries if battery.online and battery.voltage is not None]
+
+        if len(batteries) != len(self.batteries_online):
+            logger.info(f"Aggregate battery: {len(batteries)} of {len(self.batteries)} batteries online")
+        self.batteries_online = batteries
+
+        if not batteries:
+            return False
+
+        # batteries in parallel have the same voltage, the average compensates measurement differences
+        self.voltage = sum(battery.voltage for battery in batteries) / len(batteries)
+        self.current = self.get_sum([battery.current_calc for battery in batteries])
+        self.capacity = self.get_sum([battery.capacity for battery in batteries])
+        self.capacity_remain = self.get_sum([battery.get_capacity_remain() for battery in batteries])
+
+        # weight the SoC with the capacity, if all capacities are known
+        socs = [battery.soc_calc for battery in batteries]
+        capacities = [battery.capacity for battery in batteries]
+        if None in socs:
+            self.soc = None
+        elif None in capacities or sum(capacities) == 0:
+            self.soc = sum(socs) / len(socs)
+        else:
+            self.soc = sum(soc * capacity for soc, capacity in zip(socs, capacities)) / sum(capacities)
+
+        self.soh = self.get_extreme([battery.soh for battery in batteries], min)
+        self.temperature_mos = self.get_extreme([battery.temperature_mos for battery in batteries], max)
+
+        # the virtual battery can only be charged/discharged, if all batteries can
+        self.charge_fet = all(battery.charge_fet for battery in batteries)
+        self.discharge_fet = all(battery.discharge_fet for battery in batteries)
+        balance_fets = [battery.balance_fet for battery in batteries if battery.balance_fet is not None]
+        self.balance_fet = any(balance_fets) if balance_fets else None
+
+        # use the highest alarm state of all batteries
+        for name in Protection.VALUES:
+            setattr(self.protection, name, self.get_extreme([getattr(battery.protection, name) for battery in batteries], max))
+
+        # show the first error and block the virtual battery, if one battery is in error state
+        error_codes = [battery.error_code for battery in batteries if battery.error_code is not None]
+        self.error_code = error_codes[0] if error_codes else None
+        if any(battery.state == 10 for battery in batteries):
+            self.state = 10
+        elif self.state == 10:
+            self.state = 0
+
+        return True
+
+    def set_calculated_data(self) -> None:
+        """
+        The current and SoC are already calculated by the batteries, only the sums are needed.
+
+        :return: None
+        """
+        self.current_calc = self.current
+        self.power_calc = self.get_sum([battery.power_calc for battery in self.batteries_online]) if self.batteries_online else None
+        self.integrate_charge_and_energy()
+        self.soc_calc = self.soc
+
+    def manage_charge_voltage(self) -> None:
+        """
+        Use the lowest charge voltage of all batteries, so that no battery is overcharged.
+
+        :return: None
+        """
+        self.max_battery_voltage = self.get_extreme([battery.max_battery_voltage for battery in self.batteries_online], min)
+        self.min_battery_voltage = self.get_extreme([battery.min_battery_voltage for battery in self.batteries_online], max)
+
+        batteries = [battery for battery in self.batteries_online if battery.control_voltage is not None]
+        if not batteries:
+            return
+
+        battery = min(batteries, key=lambda battery: battery.control_voltage)
+        self.control_voltage = battery.control_voltage
+        self.charge_mode = battery.charge_mode
+
+    def manage_charge_and_discharge_current(self) -> None:
+        """
+        Use the lowest charge and discharge current limit of all batteries multiplied by the batteries online,
+        so that no battery exceeds its limit, as long as the current is distributed evenly.
+
+        :return: None
+        """
+        self.control_charge_current, self.charge_limitation = self.combine_current_limits(
+            lambda battery: battery.control_charge_current if battery.get_allow_to_charge() else 0,
+            lambda battery: battery.charge_limitation if battery.get_allow_to_charge() else LimitationReason.to_string(LimitationReason.BMS, True),
+        )
+        self.control_allow_charge = self.control_charge_current != 0
+
+        self.control_discharge_current, self.discharge_limitation = self.combine_current_limits(
+            lambda battery: battery.control_discharge_current if battery.get_allow_to_discharge() else 0,
+            lambda battery: battery.discharge_limitation if battery.get_allow_to_discharge() else LimitationReason.to_string(LimitationReason.BMS, False),
+        )
+        self.control_allow_discharge = self.control_discharge_current != 0
+
+    def combine_current_limits(self, get_limit: Callable[[Battery], float], get_limitation: Callable[[Battery], str]) -> Tuple[float, str]:
+        """
+        Combine the current limits of the batteries online.
+
+        :param get_limit: Function returning the current limit of a battery
+        :param get_limitation: Function returning the limitation reason of a battery
+        :return: The lowest limit multiplied by the batteries online and the limitation reason of this battery
+        """
+        # a battery without calculated limit yet, does not allow any current
+        limits = [(get_limit(battery) or 0, battery) for battery in self.batteries_online]
+        limit, battery = min(limits, key=lambda item: item[0])
+
+        return round(limit * len(limits), 3), self.get_battery_name(battery) + ": " + str(get_limitation(battery))
+
+    def get_extreme_battery_value(self, name: str, function: Callable) -> Tuple[Union[float, None], Union[Battery, None]]:
+        """
+        Get the lowest or highest derived value of the batteries online.
+
+        :param name: The name of the derived value, e.g. `min_cell_voltage`
+        :param function: `min` or `max`
+        :return: The value and the battery it's from
+        """
+        values = [(battery.get_derived_value(name), battery) for battery in self.batteries_online]
+        values = [value for value in values if value[0] is not None]
+        if not values:
+            return None, None
+        return function(values, key=lambda item: item[0])
+
+    def get_extreme_battery_desc(self, name: str, function: Callable, get_desc: Callable[[Battery], Union[str, None]], separator: str = "") -> Union[str, None]:
+        """
+        Get the description of the lowest or highest derived value of the batteries online.
+
+        :param name: The name of the derived value, e.g. `min_cell_voltage`
+        :param function: `min` or `max`
+        :param get_desc: Function returning the description of the value from the battery
+        :param separator: Separator between the battery name and the description
+        :return: The description prefixed with the battery name, e.g. `B2C5`
+        """
+        _, battery = self.get_extreme_battery_value(name, function)
+        if battery is None:
+            return None
+        desc = get_desc(battery)
+        return self.get_battery_name(battery) + (separator + str(desc) if desc is not None else "")
+
+    def get_min_cell_voltage(self) -> Union[float, None]:
+        return self.get_extreme_battery_value("min_cell_voltage", min)[0]
+
+    def get_max_cell_voltage(self) -> Union[float, None]:
+        return self.get_extreme_battery_value("max_cell_voltage", max)[0]
+
+    def get_min_cell_desc(self) -> Union[str, None]:
+        return self.get_extreme_battery_desc("min_cell_voltage", min, lambda battery: battery.get_derived_value("min_cell_desc"))
+
+    def get_max_cell_desc(self) -> Union[str, None]:
+        return self.get_extreme_battery_desc("max_cell_voltage", max, lambda battery: battery.get_derived_value("max_cell_desc"))
+
+    def get_cell_voltage_sum(self) -> float:
+        """
+        The batteries are connected in parallel, so the average of the cell voltage sums is used.
+
+        :return: The average sum of all cell voltages
+        """
+        sums = [battery.get_cell_voltage_sum() for battery in self.batteries_online]
+        sums = [value for value in sums if value is not None]
+        return sum(sums) / len(sums) if sums else 0
+
+    def get_balancing(self) -> int:
+        return 1 if any(battery.get_balancing() for battery in self.batteries_online) else 0
+
+    def get_temperature(self) -> Union[float, None]:
+        temperatures = [battery.get_derived_value("temperature") for battery in self.batteries_online]
+        temperatures = [temperature for temperature in temperatures if temperature is not None]
+        return round(sum(temperatures) / len(temperatures), 1) if temperatures else None
+
+    def get_min_temperature(self) -> Union[float, None]:
+        return self.get_extreme_battery_value("min_temperature", min)[0]
+
+    def get_max_temperature(self) -> Union[float, None]:
+        return self.get_extreme_battery_value("max_temperature", max)[0]
+
+    def get_min_temperature_id(self) -> Union[str, None]:
+        return self.get_extreme_battery_desc("min_temperature", min, lambda battery: battery.get_min_temperature_id(), " ")
+
+    def get_max_temperature_id(self) -> Union[str, None]:
+        return self.get_extreme_battery_desc("max_temperature", max, lambda battery: battery.get_max_temperature_id(), " ")
+
+    @staticmethod
+    def get_sum(values: List[Union[float, None]]) -> Union[float, None]:
+        """
+        Sum up the values of all batteries.
+
+        :param values: The values of the batteries
+        :return: The sum or `None`, if a value is missing
+        """
+        return sum(values) if values and None not in values else None
+
+    @staticmethod
+    def get_extreme(values: List[Union[float, None]], function: Callable) -> Union[float, None]:
+        """
+        Get the lowest or highest of the known values of all batteries.
+
+        :param values: The values of the batteries
+        :param function: `min` or `max`
+        :return: The lowest or highest value or `None`, if no value is known
+        """
+        values = [value for value in values if value is not None]
+        return function(values) if values else None
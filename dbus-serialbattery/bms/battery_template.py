@@ -166,6 +166,8 @@ class BatteryTemplate(Battery):
 
         # current of the battery in amps (float)
         self.current = VALUE_FROM_BMS
+        # optional: time the current was measured, improves the coulomb counting (SOC_CALCULATION)
+        # self.current_timestamp = monotonic()
 
         # state of charge in percent (float)
         self.soc = VALUE_FROM_BMS
@@ -15,13 +15,17 @@ from utils import (
     INVERT_CURRENT_MEASUREMENT,
     logger,
     AUTO_RESET_SOC,
+    CAN_USE_POLLING,
     MAX_BATTERY_CHARGE_CURRENT,
     MAX_BATTERY_DISCHARGE_CURRENT,
     MIN_CELL_VOLTAGE,
 )
-from struct import unpack_from, pack_into
+from utils_can import can_filter
+from struct import Struct, pack_into
 from time import time
+from typing import Callable, Dict, Tuple
 import sys
+import threading
 from can import Message, CanOperationError
 from time import sleep
 
@@ -50,6 +54,9 @@ class Daly_Can(Battery):
         self.last_error_time = 0
         self.history.exclude_values_to_calculate = ["charge_cycles"]
 
+        self.can_decoders = self.get_can_decoders()
+        self.request_thread = None
+
     COMMAND_BASE = "COMMAND_BASE"
     COMMAND_SOC = "COMMAND_SOC"
     COMMAND_MINMAX_CELL_VOLTS = "COMMAND_MINMAX_CELL_VOLTS"
@@ -104,6 +111,8 @@ class Daly_Can(Battery):
     LENGTH_CHECK = 4
     LENGTH_POS = 3
     CURRENT_ZERO_CONSTANT = 30000
+    CURRENT_MIN_VALID = -(MAX_BATTERY_DISCHARGE_CURRENT * 2.1)
+    CURRENT_MAX_VALID = MAX_BATTERY_CHARGE_CURRENT * 1.3
     TEMP_ZERO_CONSTANT = 40
 
     def connection_name(self) -> str:
@@ -118,6 +127,22 @@ class Daly_Can(Battery):
         """
         return self.port + ("__" + bytearray_to_string(self.address).replace("\\", "0") if self.address is not None else "")
 
+    def get_can_filters(self) -> list:
+        """
+        All responses are sent to the uplink ID 0x40 from the device address
+
+        :return: list of filters
+        """
+        return [can_filter(0x18004000 | self.device_address, 0xFF00FFFF)]
+
+    def get_can_sample_ids(self) -> list:
+        """
+        RESPONSE_SOC contains the current
+
+        :return: list of arbitration ids
+        """
+        return [(frame_id & 0xFFFFFF00) | self.device_address for frame_id in self.CAN_FRAMES[self.RESPONSE_SOC]]
+
     def test_connection(self):
         """
         call a function that will connect to the battery, send a command and retrieve the result.
@@ -158,6 +183,9 @@ class Daly_Can(Battery):
             logger.error("CAN Bus Error while sending data. Check cabeling")
 
         self.capacity = BATTERY_CAPACITY
+
+        # request the data once, so that the first refresh_data() can read the responses
+        self.request_daly_can()
         sleep(0.1)
 
         self.read_daly_can()
@@ -170,16 +198,42 @@ class Daly_Can(Battery):
         # Return True if success, False for failure
         self.reset_soc = self.soc if self.soc else 0
 
-        self.request_daly_can()
-        sleep(0.1)
-
         result = self.read_daly_can()
         self.write_soc()
         if AUTO_RESET_SOC:
             self.update_soc_on_bms()
 
+        # with active callbacks the requests are sent by the request thread, else request the data for the next cycle
+        # instead of waiting for the responses, which would block the main loop
+        if self.request_thread is None:
+            self.request_daly_can()
+
         return result
 
+    def use_callback(self, callback: Callable) -> bool:
+        """
+        Send the requests every `poll_interval` from a separate thread and publish the data
+        as soon as the response to the last request (RESPONSE_ALARM) was received.
+        """
+        if CAN_USE_POLLING:
+            return False
+
+        frame_id = (self.CAN_FRAMES[self.RESPONSE_ALARM][0] & 0xFFFFFF00) | self.device_address
+        if not self.can_transport_interface.set_callback([frame_id], callback):
+            return False
+
+        self.request_thread = threading.Thread(target=self.request_daly_can_loop, name=f"DalyCanRequestThread-{self.device_address}", daemon=True)
+        self.request_thread.start()
+        return True
+
+    def request_daly_can_loop(self):
+        while True:
+            try:
+                self.request_daly_can()
+            except Exception as e:
+                logger.error(f"Error while requesting data: {e}")
+            sleep(self.poll_interval / 1000)
+
     def request_daly_can(self):
         data = bytearray(b"\x00\x00\x00\x00\x00\x00\x00\x00")
 
@@ -209,6 +263,201 @@ class Daly_Can(Battery):
         except CanOperationError:
             logger.error("CAN Bus Error while sending data. Check cabeling")
 
+    def get_can_decoders(self) -> Dict[int, Tuple[Struct, Callable]]:
+        """
+        Map the frame IDs sent by this BMS to the precompiled struct and the function to decode the frame.
+        It's built once with the device address applied, so each frame is decoded with one dict lookup.
+
+        :return: dict with the frame ID as key and a tuple of struct and decode function as value
+        """
+        decoders = {
+            self.RESPONSE_STATUS: (Struct(">BB??BHx"), self.decode_status),
+            self.RESPONSE_SOC: (Struct(">HHHH"), self.decode_soc),
+            self.RESPONSE_MINMAX_CELL_VOLTS: (Struct(">hbhb"), self.decode_minmax_cell_volts),
+            self.RESPONSE_MINMAX_TEMP: (Struct(">BBBB"), self.decode_minmax_temp),
+            self.RESPONSE_FET: (Struct(">b??BL"), self.decode_fet),
+            self.RESPONSE_SETTINGS: (Struct(">LL"), self.decode_settings),
+            self.RESPONSE_ALARM: (Struct(">BBBBBBBB"), self.decode_alarm),
+        }
+        can_decoders = {(frame_id & 0xFFFFFF00) | self.device_address: decoder for name, decoder in decoders.items() for frame_id in self.CAN_FRAMES[name]}
+
+        # as daly sends all cell voltage frames with the same ID, the receive thread encodes the frame number (from the data field)
+        # into the arbitration id to make it unique to be able to store it in a map
+        cell_volts_struct = Struct(">BHHHx")
+        for frame in range(1, 14):
+            frame_id = self.CAN_FRAMES[self.RESPONSE_CELL_VOLTS][0] + 0x100000 + (frame << 16)
+            can_decoders[(frame_id & 0xFFFFFF00) | self.device_address] = (cell_volts_struct, self.decode_cell_volts)
+
+        return can_decoders
+
+    def decode_status(self, cell_count: int, temperature_sensors: int, charger_connected: bool, load_connected: bool, state: int, charge_cycles: int) -> int:
+        self.cell_count = cell_count
+        self.charger_connected = charger_connected
+        self.load_connected = load_connected
+        self.history.charge_cycles = charge_cycles
+
+        # check if all needed data is available
+        return 1 if self.cell_count != 0 else 0
+
+    def decode_soc(self, voltage: int, tmp: int, current: int, soc: int) -> int:
+        current = (current - self.CURRENT_ZERO_CONSTANT) / -10 * INVERT_CURRENT_MEASUREMENT
+        # logger.info("voltage: " + str(voltage) + ", current: " + str(current) + ", soc: " + str(soc))
+        if not self.CURRENT_MIN_VALID < current < self.CURRENT_MAX_VALID:
+            return 0
+
+        self.voltage = voltage / 10
+        self.current = current
+        self.soc = soc / 10
+
+        # check if all needed data is available
+        return 1
+
+    def decode_cell_volts(self, frame: int, *cell_voltages: int) -> int:
+        if self.cell_count is None:
+            return 0
+
+        lowMin = MIN_CELL_VOLTAGE / 2
+
+        if len(self.cells) != self.cell_count:
+            # init the numbers of cells
+            self.cells = []
+            for idx in range(self.cell_count):
+                self.cells.append(Cell(True))
+
+        for idx in range(3):
+            cellnum = ((frame - 1) * 3) + idx  # daly is 1 based, driver 0 based
+            if cellnum >= self.cell_count:
+                break
+            cellVoltage = cell_voltages[idx] / 1000
+            self.cells[cellnum].voltage = None if cellVoltage < lowMin else cellVoltage
+
+        return 0
+
+    def decode_minmax_cell_volts(self, cell_max_voltage: int, cell_max_no: int, cell_min_voltage: int, cell_min_no: int) -> int:
+        # Daly cells numbers are 1 based and not 0 based
+        self.cell_min_no = cell_min_no - 1
+        self.cell_max_no = cell_max_no - 1
+        # Voltage is returned in mV
+        self.cell_max_voltage = cell_max_voltage / 1000
+        self.cell_min_voltage = cell_min_voltage / 1000
+
+        return 0
+
+    def decode_minmax_temp(self, max_temp: int, max_no: int, min_temp: int, min_no: int) -> int:
+        # store temperatures in a dict to assign the temperature to the correct sensor
+        temperatures = {min_no: (min_temp - self.TEMP_ZERO_CONSTANT), max_no: (max_temp - self.TEMP_ZERO_CONSTANT)}
+
+        self.to_temperature(1, temperatures[min_no])
+        self.to_temperature(2, temperatures[max_no])
+
+        return 0
+
+    def decode_fet(self, status: int, charge_fet: bool, discharge_fet: bool, charge_cycles: int, capacity_remain: int) -> int:
+        self.charge_fet = charge_fet
+        self.discharge_fet = discharge_fet
+        self.history.charge_cycles = charge_cycles
+        self.capacity_remain = capacity_remain / 1000
+
+        return 0
+
+    def decode_settings(self, capacity: int, nominalVoltage: int) -> int:
+        self.capacity = capacity / 1000
+
+        return 0
+
+    def decode_alarm(self, al_volt: int, al_temp: int, al_crnt_soc: int, al_diff: int, al_mos: int, al_misc1: int, al_misc2: int, al_fault: int) -> int:
+        if al_volt & 48:
+            # High voltage levels - Alarm
+            self.protection.high_voltage = 2
+        elif al_volt & 15:
+            # High voltage Warning levels - Pre-alarm
+            self.protection.high_voltage = 1
+        else:
+            self.protection.high_voltage = 0
+
+        if al_volt & 128:
+            # Low voltage level - Alarm
+            self.protection.low_voltage = 2
+        elif al_volt & 64:
+            # Low voltage Warning level - Pre-alarm
+            self.protection.low_voltage = 1
+        else:
+            self.protection.low_voltage = 0
+
+        if al_temp & 2:
+            # High charge temp - Alarm
+            self.protection.high_charge_temperature = 2
+        elif al_temp & 1:
+            # High charge temp - Pre-alarm
+            self.protection.high_charge_temperature = 1
+        else:
+            self.protection.high_charge_temperature = 0
+
+        if al_temp & 8:
+            # Low charge temp - Alarm
+            self.protection.low_charge_temperature = 2
+        elif al_temp & 4:
+            # Low charge temp - Pre-alarm
+            self.protection.low_charge_temperature = 1
+        else:
+            self.protection.low_charge_temperature = 0
+
+        if al_temp & 32:
+            # High discharge temp - Alarm
+            self.protection.high_temperature = 2
+        elif al_temp & 16:
+            # High discharge temp - Pre-alarm
+            self.protection.high_temperature = 1
+        else:
+            self.protection.high_temperature = 0
+
+        if al_temp & 128:
+            # Low discharge temp - Alarm
+            self.protection.low_temperature = 2
+        elif al_temp & 64:
+            # Low discharge temp - Pre-alarm
+            self.protection.low_temperature = 1
+        else:
+            self.protection.low_temperature = 0
+
+        # if al_crnt_soc & 2:
+        #    # High charge current - Alarm
+        #    self.protection.high_charge_current = 2
+        # elif al_crnt_soc & 1:
+        #    # High charge current - Pre-alarm
+        #    self.protection.high_charge_current = 1
+        # else:
+        #    self.protection.high_charge_current = 0
+
+        # if al_crnt_soc & 8:
+        #    # High discharge current - Alarm
+        #    self.protection.high_charge_current = 2
+        # elif al_crnt_soc & 4:
+        #    # High discharge current - Pre-alarm
+        #    self.protection.high_charge_current = 1
+        # else:
+        #    self.protection.high_charge_current = 0
+
+        if al_crnt_soc & 2 or al_crnt_soc & 8:
+            # High charge/discharge current - Alarm
+            self.protection.high_charge_current = 2
+        elif al_crnt_soc & 1 or al_crnt_soc & 4:
+            # High charge/discharge current - Pre-alarm
+            self.protection.high_charge_current = 1
+        else:
+            self.protection.high_charge_current = 0
+
+        if al_crnt_soc & 128:
+            # Low SoC - Alarm
+            self.protection.low_soc = 2
+        elif al_crnt_soc & 64:
+            # Low SoC Warning level - Pre-alarm
+            self.protection.low_soc = 1
+        else:
+            self.protection.low_soc = 0
+
+        return 0
+
     def read_daly_can(self):
         try:
             # reset errors after timeout
@@ -220,221 +469,12 @@ class Daly_Can(Battery):
             # check if all needed data is available
             data_check = 0
 
-            # CONSTANTS
-            crntMinValid = -(MAX_BATTERY_DISCHARGE_CURRENT * 2.1)
-            crntMaxValid = MAX_BATTERY_CHARGE_CURRENT * 1.3
-
+            can_decoders = self.can_decoders
+            self.add_can_current_samples(can_decoders)
             for frame_id, data in self.can_transport_interface.can_message_cache_callback().items():
-                if frame_id & 0xFF != self.device_address:  # check if id byte is matching
-                    continue
-                normalized_arbitration_id = (frame_id & 0xFFFFFF00) + 1
-                # Status data
-                if normalized_arbitration_id in self.CAN_FRAMES[self.RESPONSE_STATUS]:
-                    (
-                        self.cell_count,
-                        temperature_sensors,
-                        self.charger_connected,
-                        self.load_connected,
-                        state,
-                        self.history.charge_cycles,
-                    ) = unpack_from(">BB??BHx", data)
-
-                    if self.cell_count != 0:
-                        # check if all needed data is available
-                        data_check += 1
-
-                # SOC data
-                elif normalized_arbitration_id in self.CAN_FRAMES[self.RESPONSE_SOC]:
-
-                    voltage, tmp, current, soc = unpack_from(">HHHH", data)
-                    current = (current - self.CURRENT_ZERO_CONSTANT) / -10 * INVERT_CURRENT_MEASUREMENT
-                    # logger.info("voltage: " + str(voltage) + ", current: " + str(current) + ", soc: " + str(soc))
-                    if crntMinValid < current < crntMaxValid:
-                        self.voltage = voltage / 10
-                        self.current = current
-                        self.soc = soc / 10
-
-                        # check if all needed data is available
-                        data_check += 1
-
-                # Cell voltage data
-                # as daly sends all frames with the same ID, the receive thread must encode the frame id (from the data field) into the
-                # arbitration id to make it unique to be able to store it in a map. here we mask the frame number out so we can
-                # compare it with the original message id
-                elif (
-                    normalized_arbitration_id > self.CAN_FRAMES[self.RESPONSE_CELL_VOLTS][0] + 0x100000
-                    and normalized_arbitration_id <= self.CAN_FRAMES[self.RESPONSE_CELL_VOLTS][0] + 0x1D0000
-                ):
-                    if self.cell_count is not None:
-
-                        frameCell = [0, 0, 0]
-                        lowMin = MIN_CELL_VOLTAGE / 2
-                        frame = 0
-                        bufIdx = 0
-
-                        if len(self.cells) != self.cell_count:
-                            # init the numbers of cells
-                            self.cells = []
-                            for idx in range(self.cell_count):
-                                self.cells.append(Cell(True))
-
-                        while bufIdx < len(data):
-                            frame, frameCell[0], frameCell[1], frameCell[2] = unpack_from(">BHHHx", data, bufIdx)
-                            for idx in range(3):
-                                cellnum = ((frame - 1) * 3) + idx  # daly is 1 based, driver 0 based
-                                if cellnum >= self.cell_count:
-                                    break
-                                cellVoltage = frameCell[idx] / 1000
-                                self.cells[cellnum].voltage = None if cellVoltage < lowMin else cellVoltage
-                            bufIdx += 8
-
-                # Cell voltage range data
-                elif normalized_arbitration_id in self.CAN_FRAMES[self.RESPONSE_MINMAX_CELL_VOLTS]:
-                    (
-                        cell_max_voltage,
-                        self.cell_max_no,
-                        cell_min_voltage,
-                        self.cell_min_no,
-                    ) = unpack_from(">hbhb", data)
-                    # Daly cells numbers are 1 based and not 0 based
-                    self.cell_min_no -= 1
-                    self.cell_max_no -= 1
-                    # Voltage is returned in mV
-                    self.cell_max_voltage = cell_max_voltage / 1000
-                    self.cell_min_voltage = cell_min_voltage / 1000
-
-                # Temperature range data
-                elif normalized_arbitration_id in self.CAN_FRAMES[self.RESPONSE_MINMAX_TEMP]:
-
-                    max_temp, max_no, min_temp, min_no = unpack_from(">BBBB", data)
-
-                    # store temperatures in a dict to assign the temperature to the correct sensor
-                    temperatures = {min_no: (min_temp - self.TEMP_ZERO_CONSTANT), max_no: (max_temp - self.TEMP_ZERO_CONSTANT)}
-
-                    self.to_temperature(1, temperatures[min_no])
-                    self.to_temperature(2, temperatures[max_no])
-
-                # FET data
-                elif normalized_arbitration_id in self.CAN_FRAMES[self.RESPONSE_FET]:
-                    (
-                        status,
-                        self.charge_fet,
-                        self.discharge_fet,
-                        self.history.charge_cycles,
-                        capacity_remain,
-                    ) = unpack_from(">b??BL", data)
-                    self.capacity_remain = capacity_remain / 1000
-
-                # Settings data
-                elif normalized_arbitration_id in self.CAN_FRAMES[self.RESPONSE_SETTINGS]:
-                    (
-                        capacity,
-                        nominalVoltage,
-                    ) = unpack_from(">LL", data)
-                    self.capacity = capacity / 1000
-
-                # Alarm data
-                elif normalized_arbitration_id in self.CAN_FRAMES[self.RESPONSE_ALARM]:
-                    (
-                        al_volt,
-                        al_temp,
-                        al_crnt_soc,
-                        al_diff,
-                        al_mos,
-                        al_misc1,
-                        al_misc2,
-                        al_fault,
-                    ) = unpack_from(">BBBBBBBB", data)
-
-                    if al_volt & 48:
-                        # High voltage levels - Alarm
-                        self.protection.high_voltage = 2
-                    elif al_volt & 15:
-                        # High voltage Warning levels - Pre-alarm
-                        self.protection.high_voltage = 1
-                    else:
-                        self.protection.high_voltage = 0
-
-                    if al_volt & 128:
-                        # Low voltage level - Alarm
-                        self.protection.low_voltage = 2
-                    elif al_volt & 64:
-                        # Low voltage Warning level - Pre-alarm
-                        self.protection.low_voltage = 1
-                    else:
-                        self.protection.low_voltage = 0
-
-                    if al_temp & 2:
-                        # High charge temp - Alarm
-                        self.protection.high_charge_temperature = 2
-                    elif al_temp & 1:
-                        # High charge temp - Pre-alarm
-                        self.protection.high_charge_temperature = 1
-                    else:
-                        self.protection.high_charge_temperature = 0
-
-                    if al_temp & 8:
-                        # Low charge temp - Alarm
-                        self.protection.low_charge_temperature = 2
-                    elif al_temp & 4:
-                        # Low charge temp - Pre-alarm
-                        self.protection.low_charge_temperature = 1
-                    else:
-                        self.protection.low_charge_temperature = 0
-
-                    if al_temp & 32:
-                        # High discharge temp - Alarm
-                        self.protection.high_temperature = 2
-                    elif al_temp & 16:
-                        # High discharge temp - Pre-alarm
-                        self.protection.high_temperature = 1
-                    else:
-                        self.protection.high_temperature = 0
-
-                    if al_temp & 128:
-                        # Low discharge temp - Alarm
-                        self.protection.low_temperature = 2
-                    elif al_temp & 64:
-                        # Low discharge temp - Pre-alarm
-                        self.protection.low_temperature = 1
-                    else:
-                        self.protection.low_temperature = 0
-
-                    # if al_crnt_soc & 2:
-                    #    # High charge current - Alarm
-                    #    self.protection.high_charge_current = 2
-                    # elif al_crnt_soc & 1:
-                    #    # High charge current - Pre-alarm
-                    #    self.protection.high_charge_current = 1
-                    # else:
-                    #    self.protection.high_charge_current = 0
-
-                    # if al_crnt_soc & 8:
-                    #    # High discharge current - Alarm
-                    #    self.protection.high_charge_current = 2
-                    # elif al_crnt_soc & 4:
-                    #    # High discharge current - Pre-alarm
-                    #    self.protection.high_charge_current = 1
-                    # else:
-                    #    self.protection.high_charge_current = 0
-
-                    if al_crnt_soc & 2 or al_crnt_soc & 8:
-                        # High charge/discharge current - Alarm
-                        self.protection.high_charge_current = 2
-                    elif al_crnt_soc & 1 or al_crnt_soc & 4:
-                        # High charge/discharge current - Pre-alarm
-                        self.protection.high_charge_current = 1
-                    else:
-                        self.protection.high_charge_current = 0
-
-                    if al_crnt_soc & 128:
-                        # Low SoC - Alarm
-                        self.protection.low_soc = 2
-                    elif al_crnt_soc & 64:
-                        # Low SoC Warning level - Pre-alarm
-                        self.protection.low_soc = 1
-                    else:
-                        self.protection.low_soc = 0
+                decoder = can_decoders.get(frame_id)
+                if decoder is not None:
+                    data_check += decoder[1](*decoder[0].unpack_from(data))
 
             self.hardware_version = "Daly CAN " + str(self.cell_count) + "S"
 
@@ -446,22 +486,6 @@ class Daly_Can(Battery):
                 return False
 
             return True
-
-            # TODO handle errors?
-            """
-            can_filters = [
-                {"can_id": self.response_base, "can_mask": 0xFFFFFFF},
-                {"can_id": self.response_soc, "can_mask": 0xFFFFFFF},
-                {"can_id": self.response_minmax_cell_volts, "can_mask": 0xFFFFFFF},
-                {"can_id": self.response_minmax_temp, "can_mask": 0xFFFFFFF},
-                {"can_id": self.response_fet, "can_mask": 0xFFFFFFF},
-                {"can_id": self.response_status, "can_mask": 0xFFFFFFF},
-                {"can_id": self.response_cell_volts, "can_mask": 0xFFFFFFF},
-                {"can_id": self.response_temp, "can_mask": 0xFFFFFFF},
-                {"can_id": self.response_cell_balance, "can_mask": 0xFFFFFFF},
-                {"can_id": self.response_alarm, "can_mask": 0xFFFFFFF},
-            ]
-            """
         except Exception:
             (
                 exception_type,
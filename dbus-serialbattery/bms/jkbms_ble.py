@@ -205,6 +205,10 @@ class Jkbms_Ble(Battery):
             self.to_temperature(2, temperature_2 if temperature_2 < 32767 else (65535 - temperature_2) * -1)
 
             self.current = round(st["cell_info"]["current"], 1)
+            # all currents received since the last cycle with the time they were decoded, for the coulomb counting
+            for timestamp, current in self.jk.take_current_samples():
+                self.current_samples.append((timestamp, round(current, 1)))
+                self.current_timestamp = timestamp
             self.voltage = round(st["cell_info"]["total_voltage"], 2)
 
             self.soc = st["cell_info"]["battery_soc"]
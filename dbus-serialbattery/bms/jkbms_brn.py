@@ -5,9 +5,10 @@
 # https://github.com/Louisvdw/dbus-serialbattery/pull/372
 # Updated by https://github.com/mr-manuel
 
+from collections import deque
 from struct import unpack_from, calcsize
 from bleak import BleakScanner, BleakClient, exc
-from time import sleep, time
+from time import monotonic, sleep, time
 import asyncio
 import threading
 import sys
@@ -157,6 +158,8 @@ class Jkbms_Brn:
         self.trigger_soc_reset = False
         self.bt_client = None
         self.last_status = {"device_info": False, "cell_info": False, "settings": False}
+        # (monotonic timestamp, current) of each decoded cell info frame, for the coulomb counting
+        self.current_samples = deque(maxlen=1000)
 
     async def scanForDevices(self):
         devices = await BleakScanner.discover()
@@ -298,6 +301,7 @@ class Jkbms_Brn:
                 if protocol_version == PROTOCOL_VERSION_JK02:
                     self.decode_cellinfo_jk02()
                     self.bms_status["last_update"] = time()
+                    self.current_samples.append((monotonic(), self.bms_status["cell_info"]["current"]))
                 # power is calculated from voltage x current as
                 # register 122 contains unsigned power-value
                 self.bms_status["cell_info"]["power"] = self.bms_status["cell_info"]["current"] * self.bms_status["cell_info"]["total_voltage"]
@@ -317,6 +321,17 @@ class Jkbms_Brn:
     def set_callback(self, callback):
         self._new_data_callback = callback
 
+    def take_current_samples(self) -> list:
+        """
+        Get the current samples decoded since the last call
+
+        :return: list of (monotonic timestamp, current), oldest first
+        """
+        samples = []
+        while self.current_samples:
+            samples.append(self.current_samples.popleft())
+        return samples
+
     def assemble_frame(self, data: bytearray):
         logger.debug(f"--> assemble_frame() -> self.frame_buffer (before extend) -> lenght:  {len(self.frame_buffer)}")
         logger.debug(self.frame_buffer)
@@ -11,9 +11,12 @@
 
 from __future__ import absolute_import, division, print_function, unicode_literals
 from battery import Battery, Cell
-from utils import bytearray_to_string, get_connection_error_message, logger
-from struct import unpack_from
+from utils import bytearray_to_string, get_connection_error_message, logger, CAN_USE_POLLING
+from utils_can import can_filter
+from functools import partial
+from struct import Struct
 from time import sleep, time
+from typing import Callable, Dict, Tuple
 import sys
 
 
@@ -31,6 +34,12 @@ class Jkbms_Can(Battery):
         self.error_active = False
         self.protocol_version = None
 
+        # values of the JKBMS CAN V1 frames, which are needed to fill the missing cell voltages
+        self.v1_cell_volt = None
+        self.v1_temperatures = None
+
+        self.can_decoders = self.get_can_decoders()
+
     BATTERYTYPE = "JKBMS CAN"
 
     BATT_STAT = "BATT_STAT"
@@ -82,6 +91,22 @@ class Jkbms_Can(Battery):
         """
         return self.port + ("__" + bytearray_to_string(self.address).replace("\\", "0") if self.address is not None else "")
 
+    def get_can_filters(self) -> list:
+        """
+        The BMS adds the device address to the frame IDs
+
+        :return: list of filters
+        """
+        return [can_filter(frame_id + self.device_address) for frame_ids in self.CAN_FRAMES.values() for frame_id in frame_ids]
+
+    def get_can_sample_ids(self) -> list:
+        """
+        BATT_STAT contains the current and is sent every 20ms
+
+        :return: list of arbitration ids
+        """
+        return [frame_id + self.device_address for frame_id in self.CAN_FRAMES[self.BATT_STAT]]
+
     def test_connection(self):
         """
         call a function that will connect to the battery, send a command and retrieve the result.
@@ -174,9 +199,42 @@ class Jkbms_Can(Battery):
         self.protection.internal_failure = 0
         self.protection.internal_failure = 0
 
-    def update_cell_voltages(self, start_index, end_index, data):
-        for i in range(start_index, end_index + 1):
-            cell_voltage = unpack_from("<H", data[2 * (i - start_index) : 2 * (i - start_index) + 2])[0] / 1000
+    def get_can_decoders(self) -> Dict[int, Tuple[Struct, Callable]]:
+        """
+        Map the frame IDs sent by this BMS to the precompiled struct and the function to decode the frame.
+        It's built once with the device address applied, so each frame is decoded with one dict lookup.
+
+        :return: dict with the frame ID as key and a tuple of struct and decode function as value
+        """
+        decoders = {
+            # skip voltage due to 0.1V accuracy only and use the cell voltages instead
+            self.BATT_STAT: (Struct("<2xHB"), self.decode_batt_stat),
+            self.BATT_STAT_EXT: (Struct("<HHHH"), self.decode_batt_stat_ext),
+            self.ALM_INFO: (Struct("<L"), self.decode_alm_info),
+            self.CELL_VOLT: (Struct("<HBHB"), self.decode_cell_volt),
+            self.CELL_TEMP: (Struct("<BBBB"), self.decode_cell_temp),
+            self.ALL_TEMP: (Struct("<xBBBBB"), self.decode_all_temp),
+            self.BMS_SWITCH_STATE: (Struct("<B"), self.decode_bms_switch_state),
+            self.CELL_VOLT_EXT1: (Struct("<HHHH"), partial(self.update_cell_voltages, 0)),
+            self.CELL_VOLT_EXT2: (Struct("<HHHH"), partial(self.update_cell_voltages, 4)),
+            self.CELL_VOLT_EXT3: (Struct("<HHHH"), partial(self.update_cell_voltages, 8)),
+            self.CELL_VOLT_EXT4: (Struct("<HHHH"), partial(self.update_cell_voltages, 12)),
+            self.CELL_VOLT_EXT5: (Struct("<HHHH"), partial(self.update_cell_voltages, 16)),
+            self.CELL_VOLT_EXT6: (Struct("<HHHH"), partial(self.update_cell_voltages, 20)),
+        }
+
+        return {frame_id + self.device_address: decoder for name, decoder in decoders.items() for frame_id in self.CAN_FRAMES[name]}
+
+    def update_cell_voltages(self, start_index: int, *cell_voltages: int) -> int:
+        """
+        Frame is send every 1000ms, CELL_VOLT_EXT2 to CELL_VOLT_EXT6 only if the BMS has more cells
+
+        :param start_index: index of the first cell in the frame
+        :param cell_voltages: cell voltages in mV
+        :return: data check value
+        """
+        for i, cell_voltage in enumerate(cell_voltages, start_index):
+            cell_voltage = cell_voltage / 1000
             if cell_voltage > 0:
                 if len(self.cells) <= i:
                     self.cells.insert(i, Cell(False))
@@ -184,6 +242,103 @@ class Jkbms_Can(Battery):
                 self.cells[i].voltage = cell_voltage
         self.voltage = self.get_cell_voltage_sum()
 
+        # this is important to differentiate between the JKBMS CAN V1 and V2
+        return 128 if start_index == 0 else 0
+
+    def decode_batt_stat(self, current: int, soc: int) -> int:
+        # Frame is send every 20ms
+        self.current = (current / 10) - 400
+        self.soc = soc
+
+        # self.time_to_go = unpack_from("<H", bytes([data[6], data[7]]))[0] * 36
+
+        return 1
+
+    def decode_batt_stat_ext(self, capacity_remain: int, capacity: int, total_ah_drawn: int, charge_cycles: int) -> int:
+        # Frame is send every 100ms
+        self.capacity_remain = capacity_remain / 10
+        self.capacity = capacity / 10
+        self.history.total_ah_drawn = total_ah_drawn / 10
+        self.history.charge_cycles = charge_cycles
+
+        return 2
+
+    def decode_alm_info(self, alarms: int) -> int:
+        # Frame is send every 100ms
+        logger.debug("alarms %d" % (alarms))
+        self.last_error_time = time()
+        self.error_active = True
+        self.to_protection_bits(alarms)
+
+        return 4
+
+    def decode_cell_volt(self, max_cell_volt: int, max_cell_nr: int, min_cell_volt: int, min_cell_nr: int) -> int:
+        # Frame is send every 100ms
+        self.v1_cell_volt = (max_cell_volt / 1000, max_cell_nr, min_cell_volt / 1000, min_cell_nr)
+
+        # logger.info(f"Min cell: {min_cell_nr} {min_cell_volt} - Max cell: {max_cell_nr} {max_cell_volt}")
+
+        return 8
+
+    def decode_cell_temp(self, max_temperature: int, max_nr: int, min_temperature: int, min_nr: int) -> int:
+        # Frame is send every 500ms
+        # store temperatures in a dict to assign the temperature to the correct sensor
+        self.v1_temperatures = {min_nr: min_temperature - 50, max_nr: max_temperature - 50}
+
+        return 16
+
+    def decode_all_temp(self, *temperatures: int) -> int:
+        # Frame is send every 500ms
+        # temperature_1, temperature_2, temperature_mosfet, temperature_4 and temperature_5 (currently only JKBMS PB Model)
+        for sensor, temperature in zip((1, 2, 0, 3, 4), temperatures):
+            if temperature != 0x00:
+                self.to_temperature(sensor, temperature - 50)
+
+        return 32
+
+    def decode_bms_switch_state(self, switch_state_bytes: int) -> int:
+        # Frame is send every 500ms
+        # logger.info(switch_state_bytes)
+        self.charge_fet = bool((switch_state_bytes >> 0) & 0x01)
+        self.discharge_fet = bool((switch_state_bytes >> 1) & 0x01)
+        # set balance status, if only a common balance status is available (bool)
+        # not needed, if balance status is available for each cell
+        self.balancing = bool((switch_state_bytes >> 2) & 0x01)
+        if self.get_min_cell() is not None and self.get_max_cell() is not None and self.cell_count > 1:
+            for c in range(self.cell_count):
+                if self.balancing and (self.get_min_cell() == c or self.get_max_cell() == c):
+                    self.cells[c].balance = True
+                else:
+                    self.cells[c].balance = False
+
+        return 64
+
+    def use_callback(self, callback: Callable) -> bool:
+        """
+        Publish the data as soon as the cell voltages of a cycle were received.
+        JKBMS CAN V2 sends the last CELL_VOLT_EXT frame every 1000ms, V1 only sends CELL_TEMP every 500ms.
+        """
+        if CAN_USE_POLLING:
+            return False
+
+        # the detection can finish before all frames were received, then the protocol version is not known yet
+        for _ in range(3):
+            if self.protocol_version is not None:
+                break
+            self.read_jkbms_can()
+
+        if self.protocol_version is None:
+            logger.warning("JKBMS CAN protocol version could not be determined, falling back to polling")
+            return False
+
+        if self.protocol_version == 2:
+            cell_volt_ext = [self.CELL_VOLT_EXT1, self.CELL_VOLT_EXT2, self.CELL_VOLT_EXT3, self.CELL_VOLT_EXT4, self.CELL_VOLT_EXT5, self.CELL_VOLT_EXT6]
+            name = cell_volt_ext[min(max(self.cell_count - 1, 0) // 4, len(cell_volt_ext) - 1)]
+        else:
+            name = self.CELL_TEMP
+
+        return self.can_transport_interface.set_callback([frame_id + self.device_address for frame_id in self.CAN_FRAMES[name]], callback)
+
     def read_jkbms_can(self):
         # reset errors after timeout
         # timeout is 300 seconds, to prevent notification spam
@@ -194,150 +349,13 @@ class Jkbms_Can(Battery):
         # check if all needed data is available
         data_check = 0
 
+        # BMSERR_INFO and BMS_INFO are not decoded
+        can_decoders = self.can_decoders
+        self.add_can_current_samples(can_decoders)
         for frame_id, data in self.can_transport_interface.can_message_cache_callback().items():
-            normalized_arbitration_id = frame_id - self.device_address
-
-            # Frame is send every 20ms
-            if normalized_arbitration_id in self.CAN_FRAMES[self.BATT_STAT]:
-                # skip voltage due to 0.1V accuracy only and use update_cell_voltages() instead
-                # voltage = unpack_from("<H", bytes([data[0], data[1]]))[0]
-                # self.voltage = voltage / 10
-                current = unpack_from("<H", bytes([data[2], data[3]]))[0]
-                self.current = (current / 10) - 400
-
-                self.soc = unpack_from("<B", bytes([data[4]]))[0]
-
-                # self.time_to_go = unpack_from("<H", bytes([data[6], data[7]]))[0] * 36
-
-                # check if all needed data is available
-                data_check += 1
-
-            # Frame is send every 100ms
-            elif normalized_arbitration_id in self.CAN_FRAMES[self.BATT_STAT_EXT]:
-                self.capacity_remain = unpack_from("<H", bytes([data[0], data[1]]))[0] / 10
-                self.capacity = unpack_from("<H", bytes([data[2], data[3]]))[0] / 10
-                self.history.total_ah_drawn = unpack_from("<H", bytes([data[4], data[5]]))[0] / 10
-                self.history.charge_cycles = unpack_from("<H", bytes([data[6], data[7]]))[0]
-
-                # check if all needed data is available
-                data_check += 2
-
-            # Frame is send every 100ms
-            elif normalized_arbitration_id in self.CAN_FRAMES[self.ALM_INFO]:
-                alarms = unpack_from(
-                    "<L",
-                    bytes([data[0], data[1], data[2], data[3]]),
-                )[0]
-                logger.debug("alarms %d" % (alarms))
-                self.last_error_time = time()
-                self.error_active = True
-                self.to_protection_bits(alarms)
-
-                # check if all needed data is available
-                data_check += 4
-
-            # Frame is send every 100ms
-            # elif normalized_arbitration_id in self.CAN_FRAMES[self.BMSERR_INFO]:
-            #    pass
-
-            # Frame is send every 100ms
-            elif normalized_arbitration_id in self.CAN_FRAMES[self.CELL_VOLT]:
-                v1_max_cell_volt = unpack_from("<H", bytes([data[0], data[1]]))[0] / 1000
-                v1_max_cell_nr = unpack_from("<B", bytes([data[2]]))[0]
-
-                v1_min_cell_volt = unpack_from("<H", bytes([data[3], data[4]]))[0] / 1000
-                v1_min_cell_nr = unpack_from("<B", bytes([data[5]]))[0]
-
-                # logger.info(f"Min cell: {self.min_cell_nr} {min_cell_volt} - Max cell: {self.max_cell_nr} {max_cell_volt}")
-
-                # check if all needed data is available
-                data_check += 8
-
-            # Frame is send every 500ms
-            elif normalized_arbitration_id in self.CAN_FRAMES[self.CELL_TEMP]:
-                v1_max_temperature = unpack_from("<B", bytes([data[0]]))[0] - 50
-                v1_max_nr = unpack_from("<B", bytes([data[1]]))[0]
-                v1_min_temperature = unpack_from("<B", bytes([data[2]]))[0] - 50
-                v1_min_nr = unpack_from("<B", bytes([data[3]]))[0]
-
-                # store temperatures in a dict to assign the temperature to the correct sensor
-                v1_temperatures = {v1_min_nr: v1_min_temperature, v1_max_nr: v1_max_temperature}
-
-                # check if all needed data is available
-                data_check += 16
-
-            # Frame is send every 500ms
-            elif normalized_arbitration_id in self.CAN_FRAMES[self.ALL_TEMP]:
-                # temperature_sensor_cnt = unpack_from("<B", bytes([data[0]]))[0]
-                # temperature_1
-                if data[1] != 0x00:
-                    temperature_1 = unpack_from("<B", bytes([data[1]]))[0] - 50
-                    self.to_temperature(1, temperature_1)
-                # temperature_2
-                if data[2] != 0x00:
-                    temperature_2 = unpack_from("<B", bytes([data[2]]))[0] - 50
-                    self.to_temperature(2, temperature_2)
-                # temperature_3 equals mosfet temperature_
-                if data[3] != 0x00:
-                    temperature_mosfet = unpack_from("<B", bytes([data[3]]))[0] - 50
-                    self.to_temperature(0, temperature_mosfet)
-                # temperature_4 (currently only JKBMS PB Model)
-                if data[4] != 0x00:
-                    temperature_4 = unpack_from("<B", bytes([data[4]]))[0] - 50
-                    self.to_temperature(3, temperature_4)
-                # temperature_5 (currently only JKBMS PB Model)
-                if data[5] != 0x00:
-                    temperature_5 = unpack_from("<B", bytes([data[5]]))[0] - 50
-                    self.to_temperature(4, temperature_5)
-
-                # check if all needed data is available
-                data_check += 32
-
-            # Frame is send every 500ms
-            # elif normalized_arbitration_id in self.CAN_FRAMES[self.BMS_INFO]:
-            #    pass
-
-            # Frame is send every 500ms
-            elif normalized_arbitration_id in self.CAN_FRAMES[self.BMS_SWITCH_STATE]:
-                switch_state_bytes = unpack_from("<B", bytes([data[0]]))[0]
-                # logger.info(switch_state_bytes)
-                self.charge_fet = bool((switch_state_bytes >> 0) & 0x01)
-                self.discharge_fet = bool((switch_state_bytes >> 1) & 0x01)
-                # set balance status, if only a common balance status is available (bool)
-                # not needed, if balance status is available for each cell
-                self.balancing = bool((switch_state_bytes >> 2) & 0x01)
-                if self.get_min_cell() is not None and self.get_max_cell() is not None and self.cell_count > 1:
-                    for c in range(self.cell_count):
-                        if self.balancing and (self.get_min_cell() == c or self.get_max_cell() == c):
-                            self.cells[c].balance = True
-                        else:
-                            self.cells[c].balance = False
-
-                # check if all needed data is available
-                data_check += 64
-
-            # Frame is send every 1000ms
-            elif normalized_arbitration_id in self.CAN_FRAMES[self.CELL_VOLT_EXT1]:
-                self.update_cell_voltages(0, 3, data)
-                # check if all needed data is available
-                # this is important to differentiate between the JKBMS CAN V1 and V2
-                data_check += 128
-
-            # Frame is send every 1000ms, if the BMS has more than 4 cells
-            elif normalized_arbitration_id in self.CAN_FRAMES[self.CELL_VOLT_EXT2]:
-                self.update_cell_voltages(4, 7, data)
-            # Frame is send every 1000ms, if the BMS has more than 8 cells
-            elif normalized_arbitration_id in self.CAN_FRAMES[self.CELL_VOLT_EXT3]:
-                self.update_cell_voltages(8, 11, data)
-            # Frame is send every 1000ms, if the BMS has more than 12 cells
-            elif normalized_arbitration_id in self.CAN_FRAMES[self.CELL_VOLT_EXT4]:
-                self.update_cell_voltages(12, 15, data)
-            # Frame is send every 1000ms, if the BMS has more than 16 cells
-            elif normalized_arbitration_id in self.CAN_FRAMES[self.CELL_VOLT_EXT5]:
-                self.update_cell_voltages(16, 19, data)
-            # Frame is send every 1000ms, if the BMS has more than 20 cells
-            elif normalized_arbitration_id in self.CAN_FRAMES[self.CELL_VOLT_EXT6]:
-                self.update_cell_voltages(20, 23, data)
+            decoder = can_decoders.get(frame_id)
+            if decoder is not None:
+                data_check += decoder[1](*decoder[0].unpack_from(data))
 
         # check if all needed data is available
         # sum of all data checks except for alarms
@@ -355,6 +373,8 @@ class Jkbms_Can(Battery):
         # fetch data from min/max values if protocol is JKBMS CAN V1 (extra frames missing)
         if data_check < 128:
 
+            v1_max_cell_volt, v1_max_cell_nr, v1_min_cell_volt, v1_min_cell_nr = self.v1_cell_volt
+            v1_temperatures = self.v1_temperatures
             cell_mean_voltage = (v1_max_cell_volt + v1_min_cell_volt) / 2
 
             if self.cell_count == 0:
@@ -12,7 +12,7 @@ import threading
 import sys
 import asyncio
 from bleak import BleakClient
-from time import time
+from time import monotonic, time
 from utils import logger
 from typing import Optional
 
@@ -160,6 +160,9 @@ class Kilovault_Ble(Battery):
         self.voltage = float(unpacked_data[next(i)]) * 0.001
         unpacked_data[next(i)]  # unknown value at unpacked_data[1]
         self.current = float(unpacked_data[next(i)]) * 0.001
+        # keep each notification for the coulomb counting, the driver is only polled every poll interval
+        self.current_timestamp = monotonic()
+        self.current_samples.append((self.current_timestamp, self.current))
         self.capacity = float(unpacked_data[next(i)]) * 0.001
         self._charge_cycles = unpacked_data[next(i)]
         self.soc = unpacked_data[next(i)]
@@ -6,6 +6,7 @@
 from __future__ import absolute_import, division, print_function, unicode_literals
 from battery import Battery, Cell
 from utils import bytearray_to_string, logger
+from utils_can import can_filter
 from struct import unpack_from
 from time import sleep, time
 import sys
@@ -55,6 +56,14 @@ class RV_C_Can(Battery):
         """
         return self.port + ("__" + bytearray_to_string(self.address).replace("\\", "0") if self.address is not None else "")
 
+    def get_can_filters(self) -> list:
+        """
+        The BMS subtracts the device address from the frame IDs
+
+        :return: list of filters
+        """
+        return [can_filter(frame_id - self.device_address) for frame_ids in self.CAN_FRAMES.values() for frame_id in frame_ids]
+
     def test_connection(self):
         """
         call a function that will connect to the battery, send a command and retrieve the result.
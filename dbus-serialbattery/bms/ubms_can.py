@@ -7,13 +7,13 @@
 # - sum in cell voltage display is wrong (adding not only a string up)
 #   and worse ignoring the correctly calculated one and setting CVL wrongly
 # - cell balancing status
-# - CAN masking for used ids only
 # - VMU keep alive cyclic message on successful connect, otherwise the BMS disconnects battery
 
 
 from __future__ import absolute_import, division, print_function, unicode_literals
 from battery import Battery, Cell
 from utils import bytearray_to_string, logger
+from utils_can import can_filter
 from utils import (
     MAX_BATTERY_CHARGE_CURRENT,
     MAX_BATTERY_DISCHARGE_CURRENT,
@@ -99,6 +99,14 @@ class Ubms_Can(Battery):
         """
         return self.port + ("__" + bytearray_to_string(self.address).replace("\\", "0") if self.address is not None else "")
 
+    def get_can_filters(self) -> list:
+        """
+        Status (0xC0-0xC4), firmware (0x180) and module (0x350-0x365) frames
+
+        :return: list of filters
+        """
+        return [can_filter(0x180), can_filter(0xC0, 0x7F8)] + [can_filter(0x350 + i) for i in range(0x16)]
+
     def test_connection(self):
         """
         call a function that will connect to the battery, send a command and retrieve the result.
@@ -5,16 +5,18 @@ import os
 import signal
 import sys
 from datetime import datetime
-from time import sleep
+from time import monotonic, sleep
 from typing import Union
 
 from dbus.mainloop.glib import DBusGMainLoop
 from gi.repository import GLib as gobject
 
 from battery import Battery
+from battery_aggregate import AggregateBattery
 from dbushelper import DbusHelper
 from utils import (
     BATTERY_ADDRESSES,
+    BATTERY_AGGREGATE,
     BMS_TYPE,
     bytearray_to_string,
     DRIVER_VERSION,
@@ -100,10 +102,17 @@ logger.info("Starting dbus-serialbattery")
 count_for_loops = 5
 delayed_loop_count = 0
 
+# last time the battery was polled and if a poll is scheduled by an active callback
+last_poll_time = 0
+poll_scheduled = False
+
 
 def main():
     global expected_bms_types, supported_bms_types
 
+    # DbusHelper instances, one per battery address
+    helper = {}
+
     def exit_driver(sig, frame, code: int = 0) -> None:
         """
         Gracefully exit the driver.
@@ -115,6 +124,13 @@ def main():
 
         port = get_port()
 
+        # Save the battery state, since it's only saved periodically while running
+        for key_address in helper:
+            try:
+                helper[key_address].save_current_battery_state(True)
+            except Exception as e:
+                logger.error(f"Failed to save the battery state: {e}")
+
         # Stop the main loop, if set
         if "mainloop" in globals() and mainloop is not None:
             mainloop.quit()
@@ -151,7 +167,9 @@ def main():
         :param loop: The main event loop
         :return: Always returns True
         """
-        global delayed_loop_count
+        global delayed_loop_count, last_poll_time
+
+        last_poll_time = monotonic()
 
         # count execution time in milliseconds
         start = datetime.now()
@@ -405,6 +423,7 @@ def main():
         can_transport_interface = CanTransportInterface()
         can_transport_interface.can_message_cache_callback = can_thread.get_message_cache
         can_transport_interface.can_bus = can_thread.can_bus
+        can_transport_interface.can_receiver_thread = can_thread
         logger.debug("Wait shortly to make sure that all needed data is in the cache")
         # Slowest message cycle transmission is every 1 second, wait a bit more for the first time to fetch all needed data (only jk bms)
         sleep(2)
@@ -427,6 +446,11 @@ def main():
             can_thread.setup_can(channel=port, bitrate=busspeed, force=True)
             sleep(2)
 
+        # let each battery receive only its own frames, which are then filtered by the kernel
+        for bat in battery.values():
+            bat.set_can_transport_interface(can_transport_interface.subscribe(bat.get_can_filters(), bat.get_can_sample_ids()))
+        can_thread.release_message_cache()
+
     # SERIAL
     else:
         # check if BMS_TYPE is not empty and all BMS types in the list are supported
@@ -464,6 +488,17 @@ def main():
         )
         exit_driver(None, None, 1)
 
+    # combine the batteries into one virtual battery, it's added last to be refreshed after all batteries
+    if BATTERY_AGGREGATE:
+        batteries = [battery[key_address] for key_address in battery if battery[key_address] is not None]
+        if len(batteries) > 1:
+            aggregate_battery = AggregateBattery(batteries)
+            aggregate_battery.test_connection()
+            battery["aggregate"] = aggregate_battery
+            logger.info(f"Combine {len(batteries)} batteries into one aggregate battery")
+        else:
+            logger.warning("BATTERY_AGGREGATE is enabled, but less than two batteries were found")
+
     # Have a mainloop, so we can send/receive asynchronous calls to and from dbus
     DBusGMainLoop(set_as_default=True)
     if sys.version_info.major == 2:
@@ -471,8 +506,6 @@ def main():
     mainloop = gobject.MainLoop()
 
     # Get the initial values for the battery used by setup_vedbus
-    helper = {}
-
     for key_address in battery:
         helper[key_address] = DbusHelper(battery[key_address], key_address)
         if not helper[key_address].setup_vedbus():
@@ -489,12 +522,51 @@ def main():
     # get first key from battery dict
     first_key = list(battery.keys())[0]
 
-    # try using active callback on this battery (normally only used for Bluetooth BMS)
-    if not battery[first_key].use_callback(lambda: poll_battery(mainloop)):
-        # change poll interval if set in config
-        if POLL_INTERVAL is not None:
-            battery[first_key].poll_interval = POLL_INTERVAL
+    def schedule_poll_battery() -> None:
+        """
+        Called from the CAN receiver thread when a complete set of frames was received.
+        Polls the battery in the main loop and ignores further calls until it was polled.
+
+        :return: None
+        """
+        global poll_scheduled
+
+        if not poll_scheduled:
+            poll_scheduled = True
+            gobject.idle_add(poll_scheduled_battery)
 
+    def poll_scheduled_battery() -> bool:
+        """
+        Polls the battery scheduled by `schedule_poll_battery`.
+
+        :return: Always returns False to remove the idle callback
+        """
+        global poll_scheduled
+
+        poll_scheduled = False
+        poll_battery(mainloop)
+        return False
+
+    def poll_stale_battery() -> bool:
+        """
+        Polls the battery, if no complete set of frames was received for more than two poll intervals.
+        This makes sure that a disconnected battery is detected.
+
+        :return: Always returns True
+        """
+        if monotonic() - last_poll_time > battery[first_key].poll_interval / 1000 * 2:
+            poll_battery(mainloop)
+        return True
+
+    # try using active callback on this battery (normally only used for Bluetooth and CAN BMS)
+    # CAN callbacks are called from the receiver thread, so the battery is polled in the main loop
+    callback = schedule_poll_battery if port.startswith(("can", "vecan", "vcan")) else lambda: poll_battery(mainloop)
+
+    # change poll interval if set in config, it's also used to send the requests of CAN BMS with active callbacks
+    if POLL_INTERVAL is not None:
+        battery[first_key].poll_interval = POLL_INTERVAL
+
+    if not battery[first_key].use_callback(callback):
         logger.info(f"Polling interval: {battery[first_key].poll_interval/1000:.3f} s")
 
         # if not possible, poll the battery every poll_interval milliseconds
@@ -505,6 +577,9 @@ def main():
     else:
         logger.info("Polling interval: active callback used")
 
+        if callback is schedule_poll_battery:
+            gobject.timeout_add(battery[first_key].poll_interval, poll_stale_battery)
+
     # print log at this point, else not all data is correctly populated
     for key_address in battery:
         battery[key_address].log_settings()
@@ -11,11 +11,13 @@ from xml.etree import ElementTree
 import requests
 import threading
 import json
+import math
+from typing import Callable, Union
 
 # add path to velib_python
 sys.path.insert(1, os.path.join(os.path.dirname(__file__), "ext", "velib_python"))
-from vedbus import VeDbusService  # noqa: E402
-from ve_utils import get_vrm_portal_id  # noqa: E402
+from vedbus import VeDbusService, VeDbusItemExport, VeDbusItemImport  # noqa: E402
+from ve_utils import get_vrm_portal_id, wrap_dbus_value  # noqa: E402
 from settingsdevice import SettingsDevice  # noqa: E402
 
 
@@ -33,6 +35,106 @@ def get_bus() -> dbus.bus.BusConnection:
     return SessionBus() if "DBUS_SESSION_BUS_ADDRESS" in os.environ else SystemBus()
 
 
+class VeDbusItemExportTracked(VeDbusItemExport):
+    """
+    VeDbusItemExport which calls `value_changed_callback` with the path and the new value,
+    when the value changes. This covers changes from the driver and changes over the dbus.
+
+    If a `deadband` is set, numeric changes from the driver smaller than the deadband are not published,
+    until `max_interval` seconds passed since the value was last published. Values written by other
+    services over `SetValue` are never filtered.
+    """
+
+    value_changed_callback: callable = None
+    deadband: float = None
+    max_interval: float = None
+    last_published: float = 0
+    external_write: bool = False
+
+    def within_deadband(self, newvalue) -> bool:
+        """
+        Check if the new value differs less than the deadband from the published value.
+        Lists of numbers are within the deadband, if every element is.
+
+        :param newvalue: The new value.
+        :return: True if the change is within the deadband.
+        """
+        # the small offset prevents float rounding errors, e.g. 3.302 - 3.300 < 0.002
+        if isinstance(newvalue, (int, float)) and isinstance(self._value, (int, float)):
+            return abs(newvalue - self._value) + 1e-9 < self.deadband
+
+        # missing elements are NaN, they are unchanged if they are still missing
+        if isinstance(newvalue, list) and isinstance(self._value, list) and len(newvalue) == len(self._value):
+            return all(
+                isinstance(new, (int, float)) and isinstance(old, (int, float)) and ((new != new and old != old) or abs(new - old) + 1e-9 < self.deadband)
+                for new, old in zip(newvalue, self._value)
+            )
+
+        return False
+
+    def SetValue(self, newvalue):
+        # called over the dbus by other services, the dbus signature is inherited from VeDbusItemExport
+        self.external_write = True
+        try:
+            return super().SetValue(newvalue)
+        finally:
+            self.external_write = False
+
+    def local_set_value(self, newvalue):
+        # skip small changes, the consumers are not interested in the measurement jitter
+        # values written by other services are never filtered, else they would be dropped but acknowledged
+        if self.deadband is not None and not self.external_write and self.within_deadband(newvalue) and time() - self.last_published < self.max_interval:
+            return
+
+        super().local_set_value(newvalue)
+
+    def _local_set_value(self, newvalue):
+        changes = super()._local_set_value(newvalue)
+        if changes is not None:
+            self.last_published = time()
+            if self.value_changed_callback is not None:
+                self.value_changed_callback(self._path, newvalue)
+        return changes
+
+
+class DbusService(VeDbusService):
+    """
+    VeDbusService which reports added paths and value changes, so that derived data
+    like the JSON data can be updated incrementally. It also applies the publish deadband
+    returned by `deadband_callback` for each path.
+    """
+
+    def __init__(
+        self,
+        servicename,
+        bus=None,
+        register=None,
+        path_added_callback: callable = None,
+        value_changed_callback: callable = None,
+        deadband_callback: callable = None,
+    ):
+        self.path_added_callback = path_added_callback
+        self.value_changed_callback = value_changed_callback
+        self.deadband_callback = deadband_callback
+        super().__init__(servicename, bus, register)
+
+    def add_path(self, path, value, *args, **kwargs):
+        kwargs.setdefault("itemtype", VeDbusItemExportTracked)
+
+        item = super().add_path(path, value, *args, **kwargs)
+
+        if isinstance(item, VeDbusItemExportTracked):
+            item.value_changed_callback = self.value_changed_callback
+            if self.deadband_callback is not None:
+                item.deadband = self.deadband_callback(path)
+                item.max_interval = utils.PUBLISH_MAX_INTERVAL
+
+        if self.path_added_callback is not None:
+            self.path_added_callback(path, value)
+
+        return item
+
+
 class DbusHelper:
     """
     This class is used to handle all the dbus communication.
@@ -40,6 +142,34 @@ class DbusHelper:
 
     EMPTY_DICT = {}
 
+    # dbus paths with a publish deadband, all other paths are published on each change
+    PUBLISH_DEADBAND_PATHS_CELL_VOLTAGE = ["/System/MinCellVoltage", "/System/MaxCellVoltage", "/Voltages/Diff", "/Cell/Diff", "/Voltages/All"]
+    PUBLISH_DEADBAND_PATHS_VOLTAGE = ["/Dc/0/Voltage", "/Dc/0/MidVoltage", "/Voltages/Sum", "/Cell/Sum"]
+    PUBLISH_DEADBAND_PATHS_CURRENT = ["/Dc/0/Current", "/CurrentAvg"]
+    PUBLISH_DEADBAND_PATHS_POWER = ["/Dc/0/Power"]
+    PUBLISH_DEADBAND_PATHS_TEMPERATURE = [
+        "/Dc/0/Temperature",
+        "/System/MinCellTemperature",
+        "/System/MaxCellTemperature",
+        "/System/MOSTemperature",
+        "/System/Temperature1",
+        "/System/Temperature2",
+        "/System/Temperature3",
+        "/System/Temperature4",
+    ]
+
+    # dbus paths, that are not included in the JSON data
+    # the packed cell paths are excluded, since they duplicate the single cell paths and can contain NaN
+    JSON_DATA_EXCLUDED_PATHS = ["/JsonData", "/Settings/ResetSoc", "/Settings/HasSettings", "/Voltages/All", "/Balances/All"]
+
+    # cached settings of com.victronenergy.settings, shared between all batteries
+    # the VeDbusItemImport objects are kept up to date by PropertiesChanged and ItemsChanged signals
+    settings_cache: dict = {}
+    settings_cache_bus: dbus.bus.BusConnection = None
+
+    # cached proxy objects of com.victronenergy.settings, used to write the settings
+    settings_proxies: dict = {}
+
     def __init__(self, battery, bms_address=None):
         self.battery = battery
         self.instance = 1
@@ -51,7 +181,46 @@ class DbusHelper:
             + self.battery.port[self.battery.port.rfind("/") + 1 :]
             + ("__" + str(bms_address) if bms_address is not None and bms_address != 0 else "")
         )
-        self._dbusservice = VeDbusService(self._dbusname, get_bus(), register=False)
+        self.cell_voltage_items: list = []
+        """
+        Dbus items of the cell voltages, the index is the cell index.
+        """
+        self.cell_balance_items: list = []
+        """
+        Dbus items of the cell balancing states, the index is the cell index.
+        """
+        self.cell_resistance_items: list = []
+        """
+        Dbus items of the estimated cell resistances, the index is the cell index.
+        """
+        self.cell_sum_item: VeDbusItemExport = None
+        self.cell_diff_item: VeDbusItemExport = None
+        self.cell_voltages_all_item: VeDbusItemExport = None
+        self.cell_balances_all_item: VeDbusItemExport = None
+        self.can_diagnostics: bool = False
+        """
+        True if the reception statistics of the CAN frames are published, only for batteries connected via CAN.
+        """
+        self.json_data: dict = {}
+        """
+        Nested dictionary with all published values, used for the JSON data.
+        """
+        self.json_data_leaves: dict = {}
+        """
+        Parent dictionary and key in `json_data` for each dbus path.
+        """
+        self.json_data_changed: bool = False
+        """
+        True, if a value in `json_data` changed since the last publish.
+        """
+        self._dbusservice = DbusService(
+            self._dbusname,
+            get_bus(),
+            register=False,
+            path_added_callback=self.json_data_add_path if utils.PUBLISH_BATTERY_DATA_AS_JSON else None,
+            value_changed_callback=self.json_data_set_value if utils.PUBLISH_BATTERY_DATA_AS_JSON else None,
+            deadband_callback=self.get_publish_deadband,
+        )
         self.bms_id = (
             "".join(
                 # remove all non alphanumeric characters except underscore from the identifier
@@ -67,8 +236,39 @@ class DbusHelper:
             "max_voltage_start_time": self.battery.max_voltage_start_time,
             "soc_calc": (self.battery.soc_calc if self.battery.soc_calc is not None else ""),
             "soc_reset_last_reached": self.battery.soc_reset_last_reached,
-            "history_values": "",
         }
+        self.save_battery_state_last_time: int = int(time())
+        """
+        Last time the battery state was saved to dbus.
+        """
+        self.history_store: utils.HistoryStore = None
+        """
+        File in which the history values are saved, set up with the settings.
+        """
+        self.save_history_last_time: int = int(time())
+        """
+        Last time the history values were saved.
+        """
+        self.save_history_serialized_last: tuple = None
+        """
+        Serialized history values and exclusions of the last save, to write them only if they changed.
+        """
+        self.history_values_setting_obsolete: bool = False
+        """
+        True if the `HistoryValues` setting of older driver versions still has to be cleared.
+        """
+        self.settings_write_in_flight: dict = {}
+        """
+        Asynchronous settings writes waiting for a reply, the key is the service name and path.
+        """
+        self.settings_write_pending: dict = {}
+        """
+        Latest values to write, after the write in flight for the same setting finished.
+        """
+        self.settings_write_error_count: int = 0
+        """
+        Count of failed asynchronous settings writes since driver start.
+        """
         self.history_calculated_last_time: int = 0
         """
         Last time the history values were calculated.
@@ -168,19 +368,29 @@ class DbusHelper:
         device_instance = "1"
         device_instances_used = []
         found_bms = False
+        history_values_settings = None
         self.path_battery = "/Settings/Devices/serialbattery" + "_" + str(self.bms_id)
 
         # prepare settings class
         self.settings = SettingsDevice(get_bus(), self.EMPTY_DICT, self.handle_changed_setting)
         logger.debug("setup_instance(): SettingsDevice")
 
-        # get all the settings from the dbus
-        settings_from_dbus = self.get_settings_with_values(
+        # get all the settings from the dbus with a single call
+        settings_from_dbus = self.get_settings_with_values_bulk(
             get_bus(),
             "com.victronenergy.settings",
             "/Settings/Devices",
         )
-        logger.debug("setup_instance(): get_settings_with_values")
+        logger.debug("setup_instance(): get_settings_with_values_bulk")
+
+        # fallback to the introspection of each node, if the bulk read is not supported
+        if settings_from_dbus is None:
+            settings_from_dbus = self.get_settings_with_values(
+                get_bus(),
+                "com.victronenergy.settings",
+                "/Settings/Devices",
+            )
+            logger.debug("setup_instance(): get_settings_with_values")
         # output:
         # {
         #     "Settings": {
@@ -290,16 +500,12 @@ class DbusHelper:
 
                                 logger.error("SocResetLastReached could not be converted to type int: " + str(value["SocResetLastReached"]))
 
-                        # check if the battery has HistoryValues set
+                        # check if the battery has HistoryValues set, saved by older driver versions
+                        # they are only used, if there is no history file yet
                         if "HistoryValues" in value and value["HistoryValues"] != "":
                             try:
-                                history_values = json.loads(value["HistoryValues"])
-                                logger.debug(f"HistoryValues read from dbus: {history_values}")
-                                for key in history_values:
-                                    setattr(self.battery.history, key, float(history_values[key]))
-                                    # Restore value after driver restart
-                                    if key == "last_discharge":
-                                        self.battery.charge_discharged_last = float(history_values[key])
+                                history_values_settings = json.loads(value["HistoryValues"])
+                                logger.debug(f"HistoryValues read from dbus: {history_values_settings}")
 
                             except Exception:
                                 # set error code, to show in the GUI that something is wrong
@@ -311,7 +517,6 @@ class DbusHelper:
                     elif "LastSeen" in value and int(value["LastSeen"]) < int(time()) - (60 * 60 * 24 * 30):
                         # remove entry
                         del_return = self.remove_settings(
-                            get_bus(),
                             "com.victronenergy.settings",
                             "/Settings/Devices/" + key,
                             [
@@ -331,7 +536,6 @@ class DbusHelper:
                     # check if the battery has a last seen time, if not then it's an old entry and can be removed
                     elif "LastSeen" not in value:
                         del_return = self.remove_settings(
-                            get_bus(),
                             "com.victronenergy.settings",
                             "/Settings/Devices/" + key,
                             ["ClassAndVrmInstance"],
@@ -342,7 +546,6 @@ class DbusHelper:
                     # check if Ruuvi tag is enabled, if not remove entry.
                     if "Enabled" in value and value["Enabled"] == "0" and "ClassAndVrmInstance" not in value:
                         del_return = self.remove_settings(
-                            get_bus(),
                             "com.victronenergy.settings",
                             "/Settings/Devices/" + key,
                             ["CustomName", "Enabled", "TemperatureType"],
@@ -354,6 +557,8 @@ class DbusHelper:
 
         logger.debug("setup_instance(): for loop ended")
 
+        self.setup_history_store(history_values_settings)
+
         # create class and crm instance
         class_and_vrm_instance = "battery:" + str(device_instance)
 
@@ -418,7 +623,6 @@ class DbusHelper:
         # update last seen
         if found_bms:
             self.set_settings(
-                get_bus(),
                 "com.victronenergy.settings",
                 self.path_battery,
                 "LastSeen",
@@ -437,6 +641,52 @@ class DbusHelper:
 
         return True
 
+    def setup_history_store(self, history_values_settings: Union[dict, None]) -> None:
+        """
+        Set up the history store and restore the history values from it.
+        If there is no history file yet, the values saved in the dbus settings by older driver versions are migrated.
+        The setting is cleared as soon as the values are in the file, so that they are not restored again later.
+
+        :param history_values_settings: The history values read from the `HistoryValues` setting, if available.
+        :return: None
+        """
+        file_name = "history_" + "".join(c if c.isalnum() else "_" for c in str(self.bms_id)) + ".bin"
+        self.history_store = utils.HistoryStore(os.path.join(utils.HISTORY_SAVE_PATH, file_name), self.battery.history.VALUES)
+
+        history_values = self.history_store.load()
+        if history_values is not None:
+            logger.debug(f"History read from {self.history_store.path}: {history_values}")
+            # left over, if the setting could not be cleared after the migration
+            if history_values_settings:
+                self.clear_history_values_setting()
+        # only migrate once, a corrupted file must not restore the values of the day of the migration
+        elif history_values_settings and not os.path.exists(self.history_store.path):
+            logger.info(f"Migrate the history from the dbus settings to {self.history_store.path}")
+            history_values = history_values_settings
+            self.history_values_setting_obsolete = True
+        else:
+            return
+
+        try:
+            for key in history_values:
+                # skip values that are not part of the history anymore
+                if key not in self.battery.history.VALUES:
+                    continue
+                setattr(self.battery.history, key, float(history_values[key]))
+                # Restore value after driver restart
+                if key == "last_discharge":
+                    self.battery.charge_discharged_last = float(history_values[key])
+
+        except Exception:
+            # set error code, to show in the GUI that something is wrong
+            self.battery.manage_error_code(8)
+
+            logger.error("History values could not be restored: " + str(history_values))
+
+        # values read from the history file don't have to be saved again, migrated values are saved with the next save
+        if history_values is not history_values_settings:
+            self.save_history_serialized_last = (self.battery.history.serialize(), tuple(self.battery.history.exclude_values_to_calculate))
+
     def get_role_instance(self) -> tuple:
         """
         Get the role and instance from the settings.
@@ -706,31 +956,73 @@ class DbusHelper:
         self._dbusservice.add_path("/Alarms/FuseBlown", None, writeable=True)
 
         # cell voltages
+        # keep the items, so that the cell paths don't have to be built on each publish
         if utils.BATTERY_CELL_DATA_FORMAT > 0:
+            cellpath = "/Cell/%s/Volts" if (utils.BATTERY_CELL_DATA_FORMAT & 2) else "/Voltages/Cell%s"
             for i in range(1, self.battery.cell_count + 1):
-                cellpath = "/Cell/%s/Volts" if (utils.BATTERY_CELL_DATA_FORMAT & 2) else "/Voltages/Cell%s"
-                self._dbusservice.add_path(
-                    cellpath % (str(i)),
-                    None,
-                    writeable=True,
-                    gettextcallback=lambda p, v: "{:0.3f}V".format(v),
+                self.cell_voltage_items.append(
+                    self._dbusservice.add_path(
+                        cellpath % (str(i)),
+                        None,
+                        writeable=True,
+                        gettextcallback=lambda p, v: "{:0.3f}V".format(v),
+                    )
                 )
                 if utils.BATTERY_CELL_DATA_FORMAT & 1:
-                    self._dbusservice.add_path("/Balances/Cell%s" % (str(i)), None, writeable=True)
+                    self.cell_balance_items.append(self._dbusservice.add_path("/Balances/Cell%s" % (str(i)), None, writeable=True))
             pathbase = "Cell" if (utils.BATTERY_CELL_DATA_FORMAT & 2) else "Voltages"
-            self._dbusservice.add_path(
+            self.cell_sum_item = self._dbusservice.add_path(
                 "/%s/Sum" % pathbase,
                 None,
                 writeable=True,
                 gettextcallback=lambda p, v: "{:2.2f}V".format(v),
             )
-            self._dbusservice.add_path(
+            self.cell_diff_item = self._dbusservice.add_path(
                 "/%s/Diff" % pathbase,
                 None,
                 writeable=True,
                 gettextcallback=lambda p, v: "{:0.3f}V".format(v),
             )
 
+            # all cell voltages as list (NaN for missing values) and the balancing states as bitmask (bit 0 = cell 1)
+            # this allows consumers like the GUI to subscribe to two paths instead of two per cell
+            self.cell_voltages_all_item = self._dbusservice.add_path("/Voltages/All", None, writeable=True)
+            if utils.BATTERY_CELL_DATA_FORMAT & 1:
+                self.cell_balances_all_item = self._dbusservice.add_path("/Balances/All", None, writeable=True)
+
+        # estimated internal resistance of the cells
+        if utils.CELL_RESISTANCE_ENABLE:
+            for i in range(1, self.battery.cell_count + 1):
+                self.cell_resistance_items.append(
+                    self._dbusservice.add_path(
+                        "/Cell/%s/Resistance" % (str(i)),
+                        None,
+                        writeable=True,
+                        gettextcallback=lambda p, v: "{:0.2f}mOhm".format(v * 1000),
+                    )
+                )
+            for name in ("Sum", "Avg", "Max"):
+                self._dbusservice.add_path(
+                    "/Cell/Resistance/%s" % name,
+                    None,
+                    writeable=True,
+                    gettextcallback=lambda p, v: "{:0.2f}mOhm".format(v * 1000),
+                )
+
+        # reception statistics of the CAN frames of this battery, to diagnose a bad bus or a BMS that stops sending
+        if self.battery.can_transport_interface is not None and self.battery.can_transport_interface.can_receiver_thread is not None:
+            self.can_diagnostics = True
+            self._dbusservice.add_path("/Diagnostics/Can/FrameIds", None, writeable=True)
+            self._dbusservice.add_path("/Diagnostics/Can/FrameCount", None, writeable=True)
+            self._dbusservice.add_path("/Diagnostics/Can/OverdueIds", None, writeable=True)
+            self._dbusservice.add_path("/Diagnostics/Can/Timeouts", None, writeable=True)
+            self._dbusservice.add_path(
+                "/Diagnostics/Can/MaxJitter",
+                None,
+                writeable=True,
+                gettextcallback=lambda p, v: "{:0.1f}ms".format(v),
+            )
+
         self._dbusservice.add_path("/TimeToGo", None, writeable=True)
         self._dbusservice.add_path(
             "/CurrentAvg",
@@ -780,23 +1072,13 @@ class DbusHelper:
 
         try:
             # Call the battery's refresh_data function
+            self.battery.invalidate_derived_snapshot()
             result = self.battery.refresh_data()
 
-            # Check if external sensor is still connected
-            if utils.EXTERNAL_SENSOR_DBUS_DEVICE is not None and (
-                utils.EXTERNAL_SENSOR_DBUS_PATH_CURRENT is not None or utils.EXTERNAL_SENSOR_DBUS_PATH_SOC is not None
-            ):
-                # Check if external sensor was and is still connected
-                if self.battery.dbus_external_objects is not None and utils.EXTERNAL_SENSOR_DBUS_DEVICE not in get_bus().list_names():
-                    logger.error("External current sensor was disconnected, falling back to internal sensor")
-                    self.battery.dbus_external_objects = None
-
-                # Check if external current sensor was not connected and is now connected
-                elif self.battery.dbus_external_objects is None and utils.EXTERNAL_SENSOR_DBUS_DEVICE in get_bus().list_names():
-                    logger.info("External current sensor was connected, switching to external sensor")
-                    self.battery.setup_external_sensor()
-
             if result:
+                # calculate the derived values once for this cycle
+                self.battery.update_derived_snapshot()
+
                 # check if battery has been reconnected
                 if self.battery.online is False and self.error["count"] >= RETRY_CYCLE_SHORT_COUNT:
                     logger.info(">>> Battery reconnected <<<")
@@ -819,12 +1101,18 @@ class DbusHelper:
                 # Calculate the values for the battery
                 self.battery.set_calculated_data()
 
+                # Estimate the internal resistance of the cells
+                self.battery.estimate_cell_resistances()
+
                 # This is to manage CVCL
                 self.battery.manage_charge_voltage()
 
                 # This is to manage CCL\DCL
                 self.battery.manage_charge_and_discharge_current()
 
+                # Keep the values of this cycle for analytics and trends
+                self.battery.record_time_series()
+
                 # Manage battery error code reset
                 # Check if the error code should be reset every hour
                 if self.battery.error_code_last_reset_check < int(time()) - 3600:
@@ -870,10 +1158,11 @@ class DbusHelper:
 
                             # check if the cell voltages are good to go for some minutes
                             if self.cell_voltages_good is None:
+                                min_cell_voltage = self.battery.get_derived_value("min_cell_voltage")
+                                max_cell_voltage = self.battery.get_derived_value("max_cell_voltage")
                                 self.cell_voltages_good = (
                                     True
-                                    if self.battery.get_min_cell_voltage() > utils.BLOCK_ON_DISCONNECT_VOLTAGE_MIN
-                                    and self.battery.get_max_cell_voltage() < utils.BLOCK_ON_DISCONNECT_VOLTAGE_MAX
+                                    if min_cell_voltage > utils.BLOCK_ON_DISCONNECT_VOLTAGE_MIN and max_cell_voltage < utils.BLOCK_ON_DISCONNECT_VOLTAGE_MAX
                                     else False
                                 )
                                 logger.error(
@@ -883,15 +1172,15 @@ class DbusHelper:
                                 )
                                 logger.error(
                                     "    |- "
-                                    + f"Min cell voltage: {self.battery.get_min_cell_voltage():.3f} > "
+                                    + f"Min cell voltage: {min_cell_voltage:.3f} > "
                                     + f"Min Threshold: {utils.BLOCK_ON_DISCONNECT_VOLTAGE_MIN:.3f} --> "
-                                    + ("OK" if self.battery.get_min_cell_voltage() > utils.BLOCK_ON_DISCONNECT_VOLTAGE_MIN else "NOT OK")
+                                    + ("OK" if min_cell_voltage > utils.BLOCK_ON_DISCONNECT_VOLTAGE_MIN else "NOT OK")
                                 )
                                 logger.error(
                                     "    |- "
-                                    + f"Max cell voltage: {self.battery.get_max_cell_voltage():.3f} < "
+                                    + f"Max cell voltage: {max_cell_voltage:.3f} < "
                                     + f"Max threshold: {utils.BLOCK_ON_DISCONNECT_VOLTAGE_MAX:.3f} --> "
-                                    + ("OK" if self.battery.get_max_cell_voltage() < utils.BLOCK_ON_DISCONNECT_VOLTAGE_MAX else "NOT OK")
+                                    + ("OK" if max_cell_voltage < utils.BLOCK_ON_DISCONNECT_VOLTAGE_MAX else "NOT OK")
                                 )
                                 logger.error(
                                     "    |- Trying further for "
@@ -946,7 +1235,7 @@ class DbusHelper:
         self._dbusservice["/Dc/0/Voltage"] = round(self.battery.voltage, 2) if self.battery.voltage is not None else None
         self._dbusservice["/Dc/0/Current"] = round(self.battery.current_calc, 2) if self.battery.current_calc is not None else None
         self._dbusservice["/Dc/0/Power"] = round(self.battery.power_calc, 2) if self.battery.power_calc is not None else None
-        self._dbusservice["/Dc/0/Temperature"] = self.battery.get_temperature()
+        self._dbusservice["/Dc/0/Temperature"] = self.battery.get_derived_value("temperature")
         self._dbusservice["/Capacity"] = self.battery.get_capacity_remain()
         self._dbusservice["/ConsumedAmphours"] = self.battery.get_capacity_consumed()
 
@@ -994,9 +1283,9 @@ class DbusHelper:
         self._dbusservice["/System/NrOfModulesBlockingDischarge"] = 0 if self.battery.get_allow_to_discharge() else 1
         self._dbusservice["/System/NrOfModulesOnline"] = 1 if self.battery.online else 0
         self._dbusservice["/System/NrOfModulesOffline"] = 0 if self.battery.online else 1
-        self._dbusservice["/System/MinCellTemperature"] = self.battery.get_min_temperature()
+        self._dbusservice["/System/MinCellTemperature"] = self.battery.get_derived_value("min_temperature")
         self._dbusservice["/System/MinTemperatureCellId"] = self.battery.get_min_temperature_id()
-        self._dbusservice["/System/MaxCellTemperature"] = self.battery.get_max_temperature()
+        self._dbusservice["/System/MaxCellTemperature"] = self.battery.get_derived_value("max_temperature")
         self._dbusservice["/System/MaxTemperatureCellId"] = self.battery.get_max_temperature_id()
         self._dbusservice["/System/MOSTemperature"] = self.battery.temperature_mos
         self._dbusservice["/System/Temperature1"] = self.battery.temperature_1
@@ -1032,10 +1321,10 @@ class DbusHelper:
         self._dbusservice["/Info/DischargeLimitation"] = self.battery.discharge_limitation
 
         # Updates from cells
-        self._dbusservice["/System/MinVoltageCellId"] = self.battery.get_min_cell_desc()
-        self._dbusservice["/System/MaxVoltageCellId"] = self.battery.get_max_cell_desc()
-        self._dbusservice["/System/MinCellVoltage"] = self.battery.get_min_cell_voltage()
-        self._dbusservice["/System/MaxCellVoltage"] = self.battery.get_max_cell_voltage()
+        self._dbusservice["/System/MinVoltageCellId"] = self.battery.get_derived_value("min_cell_desc")
+        self._dbusservice["/System/MaxVoltageCellId"] = self.battery.get_derived_value("max_cell_desc")
+        self._dbusservice["/System/MinCellVoltage"] = self.battery.get_derived_value("min_cell_voltage")
+        self._dbusservice["/System/MaxCellVoltage"] = self.battery.get_derived_value("max_cell_voltage")
         self._dbusservice["/Balancing"] = self.battery.get_balancing()
 
         # Update the alarms
@@ -1069,20 +1358,30 @@ class DbusHelper:
         # cell voltages
         if utils.BATTERY_CELL_DATA_FORMAT > 0:
             try:
-                voltage_sum = 0
-                for i in range(self.battery.cell_count):
-                    voltage = self.battery.get_cell_voltage(i)
-                    cellpath = "/Cell/%s/Volts" if (utils.BATTERY_CELL_DATA_FORMAT & 2) else "/Voltages/Cell%s"
-                    self._dbusservice[cellpath % (str(i + 1))] = voltage
-                    if utils.BATTERY_CELL_DATA_FORMAT & 1:
-                        self._dbusservice["/Balances/Cell%s" % (str(i + 1))] = self.battery.get_cell_balancing(i)
-                    if voltage:
-                        voltage_sum += voltage
-                pathbase = "Cell" if (utils.BATTERY_CELL_DATA_FORMAT & 2) else "Voltages"
-                self._dbusservice["/%s/Sum" % pathbase] = round(voltage_sum, 2)
-                self._dbusservice["/%s/Diff" % pathbase] = round(
-                    self.battery.get_max_cell_voltage() - self.battery.get_min_cell_voltage(),
-                    3,
+                # only cells that are available and within the cell count have values
+                cells = self.battery.cells[: min(len(self.battery.cells), self.battery.cell_count)]
+                missing = [None] * (len(self.cell_voltage_items) - len(cells))
+
+                voltages = [cell.voltage for cell in cells] + missing
+                for item, voltage in zip(self.cell_voltage_items, voltages):
+                    item.local_set_value(voltage)
+
+                if self.cell_balance_items:
+                    balances = [1 if cell.balance else 0 for cell in cells] + missing
+                    for item, balance in zip(self.cell_balance_items, balances):
+                        item.local_set_value(balance)
+
+                # a list over the dbus needs values of the same type, so missing voltages are NaN instead of None
+                self.cell_voltages_all_item.local_set_value([cell.voltage if cell.voltage is not None else math.nan for cell in cells])
+                if self.cell_balances_all_item is not None:
+                    self.cell_balances_all_item.local_set_value(self.battery.cells.balance_active & ((1 << len(cells)) - 1))
+
+                self.cell_sum_item.local_set_value(round(self.battery.get_cell_voltage_sum(), 2))
+                self.cell_diff_item.local_set_value(
+                    round(
+                        self.battery.get_derived_value("max_cell_voltage") - self.battery.get_derived_value("min_cell_voltage"),
+                        3,
+                    )
                 )
             except Exception:
                 # set error code, to show in the GUI that something is wrong
@@ -1093,18 +1392,26 @@ class DbusHelper:
                 line = exception_traceback.tb_lineno
                 logger.error("Non blocking exception occurred: " + f"{repr(exception_object)} of type {exception_type} in {file} line #{line}")
 
-        # Calculate average current for the last 300 cycles
+        # estimated internal resistance of the cells
+        if self.cell_resistance_items:
+            resistances = self.battery.cell_resistances[: len(self.cell_resistance_items)]
+            for item, resistance in zip(self.cell_resistance_items, resistances + [None] * (len(self.cell_resistance_items) - len(resistances))):
+                item.local_set_value(round(resistance, 6) if resistance is not None else None)
+
+            # the sum is only known, if the resistance of all cells is known
+            known = [resistance for resistance in resistances if resistance is not None]
+            self._dbusservice["/Cell/Resistance/Sum"] = round(sum(known), 6) if known and len(known) == len(self.cell_resistance_items) else None
+            self._dbusservice["/Cell/Resistance/Avg"] = round(sum(known) / len(known), 6) if known else None
+            self._dbusservice["/Cell/Resistance/Max"] = round(max(known), 6) if known else None
+
+        if self.can_diagnostics:
+            self.publish_can_diagnostics()
+
+        # Calculate average current for the last CURRENT_AVG_WINDOW cycles
         self.battery.previous_current_avg = self.battery.current_avg
         if self.battery.current_calc is not None:
-            self.battery.current_avg_lst.append(self.battery.current_calc)
-            # delete oldest value
-            if len(self.battery.current_avg_lst) > 300:
-                del self.battery.current_avg_lst[0]
-
-            self.battery.current_avg = round(
-                sum(self.battery.current_avg_lst) / len(self.battery.current_avg_lst),
-                2,
-            )
+            self.battery.current_avg_statistics.add(self.battery.current_calc)
+            self.battery.current_avg = round(self.battery.current_avg_statistics.mean, 2)
         else:
             self.battery.current_avg = None
 
@@ -1127,39 +1434,23 @@ class DbusHelper:
                 # Update TimeToGo item
                 if utils.TIME_TO_GO_ENABLE and percent_per_seconds is not None:
 
-                    # Get settings from dbus
-                    settings_battery_life = self.get_settings_with_values(
-                        get_bus(),
-                        "com.victronenergy.settings",
-                        "/Settings/CGwacs/BatteryLife",
-                    )
-                    settings_hub4mode = self.get_settings_with_values(
-                        get_bus(),
-                        "com.victronenergy.settings",
-                        "/Settings/CGwacs/Hub4Mode",
-                    )
+                    # Get settings from the settings cache
+                    hub4mode = self.get_cached_setting("/Settings/CGwacs/Hub4Mode")
+                    state = self.get_cached_setting("/Settings/CGwacs/BatteryLife/State")
+                    minimum_soc_limit = self.get_cached_setting("/Settings/CGwacs/BatteryLife/MinimumSocLimit")
+                    soc_limit = self.get_cached_setting("/Settings/CGwacs/BatteryLife/SocLimit")
 
-                    hub4mode = int(settings_hub4mode["Settings"]["CGwacs"]["Hub4Mode"]) if "Settings" in settings_hub4mode else None
-                    state = (
-                        int(settings_battery_life["Settings"]["CGwacs"]["BatteryLife"]["State"])
-                        if "Settings" in settings_battery_life and "State" in settings_battery_life["Settings"]["CGwacs"]["BatteryLife"]
-                        else None
-                    )
+                    hub4mode = int(hub4mode) if hub4mode is not None else None
+                    state = int(state) if state is not None else None
 
-                    if (
-                        hub4mode == 1
-                        and state != 9
-                        and "Settings" in settings_battery_life
-                        and "MinimumSocLimit" in settings_battery_life["Settings"]["CGwacs"]["BatteryLife"]
-                        and "SocLimit" in settings_battery_life["Settings"]["CGwacs"]["BatteryLife"]
-                    ):
+                    if hub4mode == 1 and state != 9 and minimum_soc_limit is not None and soc_limit is not None:
                         # Optimized without BatteryLife
-                        if state >= 10 and state <= 12:
-                            time_to_go_soc = int(float(settings_battery_life["Settings"]["CGwacs"]["BatteryLife"]["MinimumSocLimit"]))
+                        if state is not None and state >= 10 and state <= 12:
+                            time_to_go_soc = int(float(minimum_soc_limit))
                             logger.debug(f"Time-to-Go: Use /Settings/CGwacs/BatteryLife/MinimumSocLimit: {time_to_go_soc}")
                         # Optimized with BatteryLife
                         else:
-                            time_to_go_soc = int(float(settings_battery_life["Settings"]["CGwacs"]["BatteryLife"]["SocLimit"]))
+                            time_to_go_soc = int(float(soc_limit))
                             logger.debug(f"Time-to-Go: Use /Settings/CGwacs/BatteryLife/SocLimit: {time_to_go_soc}")
                     # External control
                     # Keep batteries charged
@@ -1200,9 +1491,8 @@ class DbusHelper:
             self.battery.history_calculate_values()
             self.history_calculated_last_time = int(time())
 
-        # save settings every 15 seconds to dbus
-        if int(time()) % 15:
-            self.save_current_battery_state()
+        # save changed settings every SAVE_BATTERY_STATE_INTERVAL seconds to dbus
+        self.save_current_battery_state()
 
         if self.battery.soc is not None:
             logger.debug("logged to dbus [%s]" % str(round(self.battery.soc, 2)))
@@ -1211,65 +1501,98 @@ class DbusHelper:
         if self.battery.has_settings:
             self._dbusservice["/Settings/ResetSoc"] = self.battery.reset_soc
 
-        # get all paths from the dbus service
-        if utils.PUBLISH_BATTERY_DATA_AS_JSON:
-            all_items = self._dbusservice._dbusnodes["/"].GetItems()
+        # publish the data to the JsonData path, only if a value changed
+        if utils.PUBLISH_BATTERY_DATA_AS_JSON and self.json_data_changed:
+            self.json_data_changed = False
+            self._dbusservice["/JsonData"] = json.dumps(self.json_data)
+
+    def get_publish_deadband(self, path: str) -> Union[float, None]:
+        """
+        Get the publish deadband for a dbus path.
+        Paths which are safety relevant or consumed by other services for control, like alarms,
+        charge voltage and current limits or allow to charge/discharge, have no deadband.
+
+        :param path: The dbus path.
+        :return: The deadband or None, if every change should be published immediately.
+        """
+        if path in self.PUBLISH_DEADBAND_PATHS_CELL_VOLTAGE or path.startswith("/Voltages/Cell") or (path.startswith("/Cell/") and path.endswith("/Volts")):
+            deadband = utils.PUBLISH_DEADBAND_CELL_VOLTAGE
+        elif path in self.PUBLISH_DEADBAND_PATHS_VOLTAGE:
+            deadband = utils.PUBLISH_DEADBAND_VOLTAGE
+        elif path in self.PUBLISH_DEADBAND_PATHS_CURRENT:
+            deadband = utils.PUBLISH_DEADBAND_CURRENT
+        elif path in self.PUBLISH_DEADBAND_PATHS_POWER:
+            deadband = utils.PUBLISH_DEADBAND_POWER
+        elif path in self.PUBLISH_DEADBAND_PATHS_TEMPERATURE:
+            deadband = utils.PUBLISH_DEADBAND_TEMPERATURE
+        else:
+            deadband = 0
 
-            # Convert dbus data types to python native data types
-            all_items = {key: self.dbus_to_python(value["Value"]) for key, value in all_items.items()}
+        return deadband if deadband > 0 else None
 
-            # Filter out unwanted keys
-            filtered_data = {key: value for key, value in all_items.items() if key not in ["/JsonData", "/Settings/ResetSoc", "/Settings/HasSettings"]}
+    def publish_can_diagnostics(self) -> None:
+        """
+        Publish a summary of the reception statistics of the CAN frames of this battery:
 
-            # Set empty lists to empty string
-            filtered_data = {key: "" if value == [] else value for key, value in filtered_data.items()}
+        - `FrameIds`: number of received arbitration IDs
+        - `FrameCount`: number of received frames since the start, it does not decrease when an ID times out
+        - `OverdueIds`: number of IDs, which missed at least one expected frame, but are still cached
+        - `Timeouts`: number of times a cached frame was removed, because it was not received within its time to live
+        - `MaxJitter`: highest average deviation of the time between two frames from their period in ms
 
-            cascaded_data_json = json.dumps(self.cascade_data(filtered_data))
+        :return: None
+        """
+        can_transport_interface = self.battery.can_transport_interface
+        statistics = can_transport_interface.get_frame_statistics().values()
 
-            # publish the data to the JsonData path
-            self._dbusservice["/JsonData"] = cascaded_data_json
+        self._dbusservice["/Diagnostics/Can/FrameIds"] = len(statistics)
+        self._dbusservice["/Diagnostics/Can/FrameCount"] = (
+            can_transport_interface.can_subscriber.frame_count if can_transport_interface.can_subscriber is not None else None
+        )
+        self._dbusservice["/Diagnostics/Can/OverdueIds"] = sum(
+            1 for values in statistics if values["period"] is not None and values["age"] > values["period"] * 2 + values["jitter"] * 4
+        )
+        self._dbusservice["/Diagnostics/Can/Timeouts"] = (
+            can_transport_interface.can_subscriber.timeouts if can_transport_interface.can_subscriber is not None else None
+        )
+        self._dbusservice["/Diagnostics/Can/MaxJitter"] = round(max((values["jitter"] for values in statistics), default=0) * 1000, 1)
 
-    def dbus_to_python(self, data) -> any:
+    def json_data_add_path(self, path: str, value) -> None:
         """
-        convert dbus data types to python native data types
+        Add a dbus path to the nested JSON data structure.
+        Called once for each path, when it's added to the dbus service.
 
-        :param data: The data to convert.
-        :return: The converted data.
+        :param path: The dbus path.
+        :param value: The initial value.
         """
-        if isinstance(data, dbus.String):
-            data = str(data)
-        elif isinstance(data, dbus.Boolean):
-            data = bool(data)
-        elif isinstance(data, dbus.Int64):
-            data = int(data)
-        elif isinstance(data, dbus.Double):
-            data = float(data)
-        elif isinstance(data, dbus.Array):
-            data = [self.dbus_to_python(value) for value in data]
-        elif isinstance(data, dbus.Dictionary):
-            new_data = dict()
-            for key in data.keys():
-                new_data[self.dbus_to_python(key)] = self.dbus_to_python(data[key])
-            data = new_data
-        return data
+        if path in self.JSON_DATA_EXCLUDED_PATHS:
+            return
+
+        parts = path.strip("/").split("/")
+        data = self.json_data
+        for part in parts[:-1]:
+            if part not in data:
+                data[part] = {}
+            data = data[part]
 
-    def cascade_data(self, data) -> dict:
+        self.json_data_leaves[path] = (data, parts[-1])
+        self.json_data_set_value(path, value)
+
+    def json_data_set_value(self, path: str, value) -> None:
         """
-        Cascade the data to a nested dictionary structure.
+        Update a single value in the nested JSON data structure.
+        Called each time a value of the dbus service changes.
 
-        :param data: The data to cascade.
-        :return: The cascaded data.
+        :param path: The dbus path.
+        :param value: The new value.
         """
-        cascaded = {}
-        for key, value in data.items():
-            parts = key.strip("/").split("/")
-            d = cascaded
-            for part in parts[:-1]:
-                if part not in d:
-                    d[part] = {}
-                d = d[part]
-            d[parts[-1]] = value
-        return cascaded
+        if path not in self.json_data_leaves:
+            return
+
+        data, key = self.json_data_leaves[path]
+        # invalid values are published as empty string
+        data[key] = "" if value is None or value == [] else value
+        self.json_data_changed = True
 
     def get_settings_with_values(self, bus, service: str, object_path: str, recursive: bool = True) -> dict:
         """
@@ -1318,11 +1641,89 @@ class DbusHelper:
 
         return result
 
-    def set_settings(self, bus, service: str, object_path: str, setting_name: str, value) -> bool:
+    def get_settings_with_values_bulk(self, bus, service: str, object_path: str) -> Union[dict, None]:
         """
-        Set a setting with a value to dbus.
+        Get all settings with values from dbus with a single call.
+
+        First `GetValue` is called on the object path, which returns all values of the subtree.
+        If this is not supported, `GetItems` is called on the root and filtered by the object path.
+        The result has the same format as `get_settings_with_values()`.
 
         :param bus: The dbus object.
+        :param service: The service name.
+        :param object_path: The object path.
+        :return: A dictionary with all settings and values or None, if no bulk method is available.
+        """
+        object_path = object_path.rstrip("/")
+        values = None
+
+        # get all values of the subtree, the keys are relative to the object path
+        try:
+            value = bus.get_object(service, object_path, introspect=False).get_dbus_method("GetValue", "com.victronenergy.BusItem")()
+            if type(value) is dbus.Dictionary:
+                values = {object_path + "/" + str(key).lstrip("/"): item for key, item in value.items()}
+        except dbus.exceptions.DBusException as e:
+            logger.debug(f"get_settings_with_values_bulk(): GetValue on {object_path} failed: {e}")
+
+        # get all items of the service, the keys are absolute paths
+        if values is None:
+            try:
+                items = bus.get_object(service, "/", introspect=False).get_dbus_method("GetItems", "com.victronenergy.BusItem")()
+                values = {str(key): item["Value"] for key, item in items.items() if str(key).startswith(object_path + "/") and "Value" in item}
+            except dbus.exceptions.DBusException as e:
+                logger.debug(f"get_settings_with_values_bulk(): GetItems on / failed: {e}")
+                return None
+
+        result = {}
+        for path, value in values.items():
+            if type(value) is not dbus.Dictionary:
+                self.merge_dicts(result, self.create_nested_dict(path, str(value)))
+
+        return result
+
+    def get_cached_setting(self, path: str, service: str = "com.victronenergy.settings"):
+        """
+        Get the value of a setting from the settings cache.
+        On the first request of a path the setting is imported and subscribed to the change signals,
+        so all further requests are served from memory without any dbus call.
+
+        :param path: The path of the setting, e.g. /Settings/CGwacs/Hub4Mode
+        :param service: The service name of the settings
+        :return: The value of the setting or None, if the setting does not exist
+        """
+        key = service + path
+
+        if key not in DbusHelper.settings_cache:
+            if DbusHelper.settings_cache_bus is None:
+                DbusHelper.settings_cache_bus = get_bus()
+
+            DbusHelper.settings_cache[key] = VeDbusItemImport(DbusHelper.settings_cache_bus, service, path)
+
+        return DbusHelper.settings_cache[key].get_value()
+
+    def get_settings_proxy(self, service: str, object_path: str) -> dbus.proxies.ProxyObject:
+        """
+        Get a proxy object of a settings path. The proxy objects are cached, so they
+        are resolved only once and share the same bus connection as the settings cache.
+
+        :param service: The service name.
+        :param object_path: The object path.
+        :return: The proxy object.
+        """
+        key = service + object_path
+
+        if key not in DbusHelper.settings_proxies:
+            if DbusHelper.settings_cache_bus is None:
+                DbusHelper.settings_cache_bus = get_bus()
+
+            DbusHelper.settings_proxies[key] = DbusHelper.settings_cache_bus.get_object(service, object_path, introspect=False)
+
+        return DbusHelper.settings_proxies[key]
+
+    def set_settings(self, service: str, object_path: str, setting_name: str, value) -> bool:
+        """
+        Set a setting with a value to dbus and wait for the result.
+
         :param service: The service name.
         :param object_path: The object path.
         :param setting_name: The setting name.
@@ -1333,40 +1734,97 @@ class DbusHelper:
         if value is None:
             return False
 
-        obj = bus.get_object(service, object_path + "/" + setting_name)
-        # iface = dbus.Interface(obj, "org.freedesktop.DBus.Introspectable")
-        # xml_string = iface.Introspect()
-        # print(xml_string)
-        settings_iface = dbus.Interface(obj, "com.victronenergy.BusItem")
-        method = settings_iface.get_dbus_method("SetValue")
+        obj = self.get_settings_proxy(service, object_path + "/" + setting_name)
         try:
             logger.debug(f"Setted setting {object_path}/{setting_name} to {value}")
-            return True if method(value) == 0 else False
+            return True if obj.SetValue(wrap_dbus_value(value), dbus_interface="com.victronenergy.BusItem") == 0 else False
         except dbus.exceptions.DBusException as e:
             # set error code, to show in the GUI that something is wrong
             self.battery.manage_error_code(8)
 
             logger.error(f"Failed to set setting: {e}")
 
-    def remove_settings(self, bus, service: str, object_path: str, setting_name: list) -> bool:
+    def set_settings_async(self, service: str, object_path: str, setting_name: str, value, callback: Callable[[bool], None] = None) -> None:
+        """
+        Set a setting with a value to dbus without waiting for the result.
+
+        If a write to the same setting is still in flight, only the latest value is kept
+        and written as soon as the previous write finished.
+
+        :param service: The service name.
+        :param object_path: The object path.
+        :param setting_name: The setting name.
+        :param value: The value to set.
+        :param callback: Called with True if the value was written, else with False.
+        """
+        # check if value is None
+        if value is None:
+            return
+
+        key = service + object_path + "/" + setting_name
+
+        # coalesce writes, the latest value wins
+        if key in self.settings_write_in_flight:
+            self.settings_write_pending[key] = (service, object_path, setting_name, value, callback)
+            return
+
+        self.settings_write_in_flight[key] = (value, callback)
+
+        try:
+            obj = self.get_settings_proxy(service, object_path + "/" + setting_name)
+            obj.SetValue(
+                wrap_dbus_value(value),
+                dbus_interface="com.victronenergy.BusItem",
+                reply_handler=lambda result: self.set_settings_async_done(key, result),
+                error_handler=lambda error: self.set_settings_async_done(key, None, error),
+            )
+        except Exception as e:
+            # e.g. the settings service is gone, release the setting so that the next write is sent
+            self.set_settings_async_done(key, None, e)
+            return
+
+        logger.debug(f"Queued setting {object_path}/{setting_name} to {value}")
+
+    def set_settings_async_done(self, key: str, result: Union[int, None], error: Exception = None) -> None:
+        """
+        Handle the reply of an asynchronous settings write and send the pending value, if any.
+
+        :param key: The service name and path of the setting.
+        :param result: The result of SetValue, 0 if the value was accepted.
+        :param error: The exception, if the write failed.
+        """
+        value, callback = self.settings_write_in_flight.pop(key, (None, None))
+        success = error is None and result == 0
+
+        if callback is not None:
+            callback(success)
+
+        if not success:
+            self.settings_write_error_count += 1
+
+            # set error code, to show in the GUI that something is wrong
+            self.battery.manage_error_code(8)
+
+            logger.error(f"Failed to set setting {key} to {value}: {error if error is not None else f'result {result}'}")
+            logger.error(f"Failed settings writes since driver start: {self.settings_write_error_count}")
+
+        # write the value, that was set while this write was in flight
+        if key in self.settings_write_pending:
+            self.set_settings_async(*self.settings_write_pending.pop(key))
+
+    def remove_settings(self, service: str, object_path: str, setting_name: list) -> bool:
         """
         Remove a setting from dbus.
 
-        :param bus: The dbus object.
         :param service: The service name.
         :param object_path: The object path.
         :param setting_name: The setting name.
         :return: True if the setting was removed, otherwise False.
         """
-        obj = bus.get_object(service, object_path)
-        # iface = dbus.Interface(obj, "org.freedesktop.DBus.Introspectable")
-        # xml_string = iface.Introspect()
-        # print(xml_string)
-        settings_iface = dbus.Interface(obj, "com.victronenergy.Settings")
-        method = settings_iface.get_dbus_method("RemoveSettings")
+        obj = self.get_settings_proxy(service, object_path)
         try:
             logger.debug(f"Removed setting at {object_path}")
-            return True if method(setting_name) == 0 else False
+            return True if obj.RemoveSettings(dbus.Array(setting_name, signature="s"), dbus_interface="com.victronenergy.Settings") == 0 else False
         except dbus.exceptions.DBusException as err:
             # set error code, to show in the GUI that something is wrong
             self.battery.manage_error_code(8)
@@ -1425,7 +1883,6 @@ class DbusHelper:
         :return: The custom name if the operation was successful, otherwise None.
         """
         result = self.set_settings(
-            get_bus(),
             "com.victronenergy.settings",
             self.path_battery,
             "CustomName",
@@ -1435,95 +1892,157 @@ class DbusHelper:
         return value if result else None
 
     # save current battery states to dbus
-    def save_current_battery_state(self) -> bool:
+    def get_battery_state_changes(self, force: bool = False) -> dict:
         """
-        Save the current battery state to dbus.
+        Get the battery state values, that changed since the last save.
 
-        This function saves the current battery state to dbus. It checks if the values have changed and
-        only saves the values that have changed.
+        Changes of the calculated SoC are only considered, if they exceed `SAVE_SOC_CALC_MIN_DELTA`,
+        since the value changes almost every poll cycle.
 
-        :return: True if the values have been saved, otherwise False.
+        :param force: If True, all changed values are returned regardless of the minimum delta.
+        :return: A dictionary with the changed values, the key is the name in `save_charge_details_last`.
         """
-        result = True
+        changes = {}
 
         if self.battery.allow_max_voltage != self.save_charge_details_last["allow_max_voltage"]:
-            result = result + self.set_settings(
-                get_bus(),
-                "com.victronenergy.settings",
-                self.path_battery,
-                "AllowMaxVoltage",
-                1 if self.battery.allow_max_voltage else 0,
-            )
-            logger.debug(f"Saved AllowMaxVoltage. Before {self.save_charge_details_last['allow_max_voltage']}, " + f"after {self.battery.allow_max_voltage}")
-            self.save_charge_details_last["allow_max_voltage"] = self.battery.allow_max_voltage
+            changes["allow_max_voltage"] = self.battery.allow_max_voltage
 
         if self.battery.max_voltage_start_time != self.save_charge_details_last["max_voltage_start_time"]:
-            result = result and self.set_settings(
-                get_bus(),
-                "com.victronenergy.settings",
-                self.path_battery,
-                "MaxVoltageStartTime",
-                (self.battery.max_voltage_start_time if self.battery.max_voltage_start_time is not None else ""),
-            )
-            logger.debug(
-                f"Saved MaxVoltageStartTime. Before {self.save_charge_details_last['max_voltage_start_time']}, "
-                + f"after {self.battery.max_voltage_start_time}"
-            )
-            self.save_charge_details_last["max_voltage_start_time"] = self.battery.max_voltage_start_time
+            changes["max_voltage_start_time"] = self.battery.max_voltage_start_time
 
-        if self.battery.soc_calc != self.save_charge_details_last["soc_calc"]:
-            result = result and self.set_settings(
-                get_bus(),
-                "com.victronenergy.settings",
-                self.path_battery,
-                "SocCalc",
-                self.battery.soc_calc,
-            )
-            logger.debug(f"soc_calc written to dbus: {self.battery.soc_calc}")
-            self.save_charge_details_last["soc_calc"] = self.battery.soc_calc
+        if self.battery.soc_calc is not None and self.battery.soc_calc != self.save_charge_details_last["soc_calc"]:
+            if (
+                force
+                or self.save_charge_details_last["soc_calc"] == ""
+                or abs(self.battery.soc_calc - self.save_charge_details_last["soc_calc"]) >= utils.SAVE_SOC_CALC_MIN_DELTA
+            ):
+                changes["soc_calc"] = self.battery.soc_calc
 
         if self.battery.soc_reset_last_reached != self.save_charge_details_last["soc_reset_last_reached"]:
-            result = result and self.set_settings(
-                get_bus(),
-                "com.victronenergy.settings",
-                self.path_battery,
-                "SocResetLastReached",
-                self.battery.soc_reset_last_reached,
-            )
-            logger.debug(
-                f"Saved SocResetLastReached. Before {self.save_charge_details_last['soc_reset_last_reached']}, "
-                + f"after {self.battery.soc_reset_last_reached}",
-            )
-            self.save_charge_details_last["soc_reset_last_reached"] = self.battery.soc_reset_last_reached
-
-        # copy history values
-        history_values_dict = self.battery.history.__dict__.copy()
-        # remove values that should not be saved
-        history_remove_values = self.battery.history.exclude_values_to_calculate + ["exclude_values_to_calculate"]
-        # remove keys that should not be saved
-        for key in history_remove_values:
-            history_values_dict.pop(key, None)
-        # remove keys with None values
-        keys_to_remove = [key for key, value in history_values_dict.items() if value is None]
-        for key in keys_to_remove:
-            history_values_dict.pop(key)
-
-        history_values = json.dumps(history_values_dict)
-        if history_values != self.save_charge_details_last["history_values"]:
-            result = result and self.set_settings(
-                get_bus(),
-                "com.victronenergy.settings",
-                self.path_battery,
-                "HistoryValues",
-                history_values,
-            )
-            logger.debug(
-                f"Saved HistoryValues. Before {self.save_charge_details_last['history_values']}, after {history_values}",
-            )
-            self.save_charge_details_last["history_values"] = history_values
+            changes["soc_reset_last_reached"] = self.battery.soc_reset_last_reached
+
+        return changes
+
+    def save_current_battery_state(self, force: bool = False) -> bool:
+        """
+        Save the current battery state to dbus.
+
+        The values are saved at most every `SAVE_BATTERY_STATE_INTERVAL` seconds to reduce
+        the dbus load and the writes to the flash. Only the values that changed since the last
+        save are written and all of them are written together in one flush.
+
+        :param force: If True, save all changed values immediately, e.g. on driver shutdown.
+        :return: False if a forced save failed or the settings are not initialized, otherwise True.
+        """
+        # settings are not yet initialized
+        if self.path_battery is None:
+            return False
+
+        # the history is saved to its own file in its own interval
+        self.save_history(force)
+
+        if not force and int(time()) - self.save_battery_state_last_time < utils.SAVE_BATTERY_STATE_INTERVAL:
+            return True
+
+        self.save_battery_state_last_time = int(time())
+
+        changes = self.get_battery_state_changes(force)
+        if not changes:
+            return True
+
+        # map the changed values to the setting names and the values to write
+        settings = {
+            "allow_max_voltage": ("AllowMaxVoltage", lambda value: 1 if value else 0),
+            "max_voltage_start_time": ("MaxVoltageStartTime", lambda value: value if value is not None else ""),
+            "soc_calc": ("SocCalc", lambda value: value),
+            "soc_reset_last_reached": ("SocResetLastReached", lambda value: value),
+        }
+
+        result = True
+        for key, value in changes.items():
+            setting_name, convert = settings[key]
+
+            # on shutdown wait for the result, else the writes could get lost
+            if force:
+                saved = self.set_settings("com.victronenergy.settings", self.path_battery, setting_name, convert(value))
+                self.save_battery_state_done(key, value, saved)
+                result = saved and result
+            # while running don't block the poll cycle
+            else:
+                self.set_settings_async(
+                    "com.victronenergy.settings",
+                    self.path_battery,
+                    setting_name,
+                    convert(value),
+                    lambda saved, key=key, value=value: self.save_battery_state_done(key, value, saved),
+                )
 
         return result
 
+    def save_battery_state_done(self, key: str, value, saved: bool) -> None:
+        """
+        Remember the saved value, so that it's only written again when it changes.
+        A value that could not be written is kept unchanged, so it's retried with the next save.
+
+        :param key: The name in `save_charge_details_last`.
+        :param value: The value that was written.
+        :param saved: True if the value was written.
+        """
+        if not saved:
+            return
+
+        logger.debug(f"Saved {key}. Before {self.save_charge_details_last[key]}, after {value}")
+        self.save_charge_details_last[key] = value
+
+    def save_history(self, force: bool = False) -> bool:
+        """
+        Save the history values to the history store, if they changed since the last save.
+
+        The values are saved at most every `HISTORY_SAVE_INTERVAL` seconds to reduce the writes to the flash.
+
+        :param force: If True, save the changed values immediately, e.g. on driver shutdown.
+        :return: False if the values could not be saved, otherwise True.
+        """
+        if self.history_store is None:
+            return True
+
+        if not force and int(time()) - self.save_history_last_time < utils.HISTORY_SAVE_INTERVAL:
+            return True
+
+        self.save_history_last_time = int(time())
+
+        history_serialized = (self.battery.history.serialize(), tuple(self.battery.history.exclude_values_to_calculate))
+        if history_serialized == self.save_history_serialized_last:
+            return True
+
+        if not self.history_store.save(self.battery.history.get_values_to_save()):
+            return False
+
+        self.save_history_serialized_last = history_serialized
+        logger.debug(f"Saved history to {self.history_store.path}")
+
+        # the migrated values are in the file now
+        if self.history_values_setting_obsolete:
+            self.clear_history_values_setting()
+
+        return True
+
+    def clear_history_values_setting(self) -> None:
+        """
+        Clear the `HistoryValues` setting of older driver versions, after the values were saved to the history store.
+        If the setting could not be cleared, it's retried after the next save.
+
+        :return: None
+        """
+        self.history_values_setting_obsolete = True
+
+        def done(saved: bool) -> None:
+            if saved:
+                self.history_values_setting_obsolete = False
+                logger.info("Cleared the HistoryValues setting, the history is saved to the history file")
+
+        self.set_settings_async("com.victronenergy.settings", self.path_battery, "HistoryValues", "", done)
+
     def telemetry_upload(self) -> None:
         """
         Check if telemetry should be uploaded
@@ -18,10 +18,19 @@ Page {
 	readonly property int cellCount: 32
 	readonly property real cellVoltageDiffThreshold: isNaN(cellVoltagesMean) ? NaN : cellVoltagesMean * 0.05 // 5% of mean voltage
 
-	// Arrays to hold references to VeQuickItems
+	// Arrays to hold references to the cell values, either the VeQuickItems of the single cell paths
+	// or, if available, objects with valid and value filled from the packed paths
 	property var cellVoltageItems: []
 	property var cellBalanceItems: []
 
+	// Arrays to hold references to the VeQuickItems of the single cell paths
+	property var cellVoltageQuickItems: []
+	property var cellBalanceQuickItems: []
+
+	// The packed paths contain all cell voltages as list and the balancing states as bitmask,
+	// if available the single cell paths are not subscribed
+	readonly property bool packedAvailable: cellVoltagesAll.valid
+
 	function getCellTextColor(cell) {
 		if (cell < 1 || cell > cellCount) {
 			return Theme.color_font_primary;
@@ -40,6 +49,29 @@ Page {
 		}
 	}
 
+	// Update the cell references from the packed paths, if available, else use the single cell paths
+	function updateCellItems() {
+		if (cellVoltagesAll.valid) {
+			var voltages = cellVoltagesAll.value;
+			var balances = cellBalancesAll.valid ? cellBalancesAll.value : 0;
+			var voltageItems = [];
+			var balanceItems = [];
+			for (var cell = 0; cell < cellCount; cell++) {
+				// missing cell voltages are published as NaN
+				var valid = cell < voltages.length && !isNaN(voltages[cell]);
+				var balanceValid = valid && cellBalancesAll.valid;
+				voltageItems.push({ valid: valid, value: valid ? voltages[cell] : undefined });
+				balanceItems.push({ valid: balanceValid, value: balanceValid ? Math.floor(balances / Math.pow(2, cell)) % 2 : undefined });
+			}
+			cellVoltageItems = voltageItems;
+			cellBalanceItems = balanceItems;
+		} else {
+			cellVoltageItems = cellVoltageQuickItems.slice(0);
+			cellBalanceItems = cellBalanceQuickItems.slice(0);
+		}
+		updateCellVoltagesMean();
+	}
+
 	// Get mean cell voltage by adding all cell voltages and dividing by number of cells
 	// since the battery voltage is not accurate enough
 	function updateCellVoltagesMean() {
@@ -63,14 +95,22 @@ Page {
 			property int cellIndex: index
 			VeQuickItem {
 				id: voltageItem
-				uid: root.bindPrefix + "/Voltages/Cell" + (cellIndex + 1)
-				onValidChanged: root.updateCellVoltagesMean()
-				onValueChanged: root.updateCellVoltagesMean()
+				uid: root.packedAvailable ? "" : root.bindPrefix + "/Voltages/Cell" + (cellIndex + 1)
+				onValidChanged: {
+					if (!root.packedAvailable) {
+						root.updateCellVoltagesMean();
+					}
+				}
+				onValueChanged: {
+					if (!root.packedAvailable) {
+						root.updateCellVoltagesMean();
+					}
+				}
 				Component.onCompleted: {
-					root.cellVoltageItems[cellIndex] = voltageItem;
-					// Trigger a slice to notify that the array has changed
+					root.cellVoltageQuickItems[cellIndex] = voltageItem;
+					// Update the references, when all items are created
 					if (cellIndex === root.cellCount - 1) {
-						root.cellVoltageItems = root.cellVoltageItems.slice(0);
+						root.updateCellItems();
 					}
 				}
 			}
@@ -83,18 +123,30 @@ Page {
 			property int cellIndex: index
 			VeQuickItem {
 				id: balanceItem
-				uid: root.bindPrefix + "/Balances/Cell" + (cellIndex + 1)
+				uid: root.packedAvailable ? "" : root.bindPrefix + "/Balances/Cell" + (cellIndex + 1)
 				Component.onCompleted: {
-					root.cellBalanceItems[cellIndex] = balanceItem;
-					// Trigger a slice to notify that the array has changed
+					root.cellBalanceQuickItems[cellIndex] = balanceItem;
+					// Update the references, when all items are created
 					if (cellIndex === root.cellCount - 1) {
-						root.cellBalanceItems = root.cellBalanceItems.slice(0);
+						root.updateCellItems();
 					}
 				}
 			}
 		}
 	}
 
+	VeQuickItem {
+		id: cellVoltagesAll
+		uid: root.bindPrefix + "/Voltages/All"
+		onValidChanged: root.updateCellItems()
+		onValueChanged: root.updateCellItems()
+	}
+	VeQuickItem {
+		id: cellBalancesAll
+		uid: root.bindPrefix + "/Balances/All"
+		onValueChanged: root.updateCellItems()
+	}
+
 	VeQuickItem {
 		id: cellVoltageSum
 		uid: root.bindPrefix + "/Voltages/Sum"
@@ -30,15 +30,18 @@ class DbusHelper:
             "max_voltage_start_time": self.battery.max_voltage_start_time,
             "soc_calc": (self.battery.soc_calc if self.battery.soc_calc is not None else ""),
             "soc_reset_last_reached": self.battery.soc_reset_last_reached,
-            "history_values": "",
         }
 
     def publish_battery(self, loop):
         # This is called every battery.poll_interval milli second as set up per battery type to read and update the data
         try:
             # Call the battery's refresh_data function
+            self.battery.invalidate_derived_snapshot()
             result = self.battery.refresh_data()
             if result:
+                # calculate the derived values once for this cycle
+                self.battery.update_derived_snapshot()
+
                 # reset error variables
                 self.error["count"] = 0
                 self.battery.online = True
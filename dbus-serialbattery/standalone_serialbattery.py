@@ -350,6 +350,7 @@ class standalone_serialbattery:
                 can_transport_interface = CanTransportInterface()
                 can_transport_interface.can_message_cache_callback = can_thread.get_message_cache
                 can_transport_interface.can_bus = can_thread.can_bus
+                can_transport_interface.can_receiver_thread = can_thread
                 logging.debug("Wait shortly to make sure that all needed data is in the cache")
                 # Slowest message cycle transmission is every 1 second, wait a bit more for the first time to fetch all needed data (only jk bms)
                 sleep(2)
@@ -372,6 +373,11 @@ class standalone_serialbattery:
                     can_thread.setup_can(channel=self.devpath, bitrate=busspeed, force=True)
                     sleep(2)
 
+                # let each battery receive only its own frames, which are then filtered by the kernel
+                for bat in self.battery.values():
+                    bat.set_can_transport_interface(can_transport_interface.subscribe(bat.get_can_filters(), bat.get_can_sample_ids()))
+                can_thread.release_message_cache()
+
         # SERIAL
         else:  # Serial, modbus, ...
             # check if BMS_TYPE is not empty and all BMS types in the list are supported
@@ -3,11 +3,15 @@
 import bisect
 import configparser
 import logging
+import math
+import os
 import sys
+import zlib
+from array import array
 from pathlib import Path
-from struct import unpack_from
+from struct import Struct, unpack_from
 from time import sleep
-from typing import List, Any, Callable, Union
+from typing import List, Any, Callable, Dict, Iterable, Tuple, Union
 
 # Third-party imports
 import serial
@@ -179,6 +183,96 @@ def check_config_issue(condition: bool, message: str):
         errors_in_config.append(f"{message}")
 
 
+class PiecewiseLookup:
+    """
+    Immutable lookup table for a linear or step relationship between two arrays, like
+    `calc_linear_relationship()` and `calc_step_relationship()`.
+
+    The arrays are brought into ascending order and the slopes of the segments are calculated once
+    when the config is loaded, so that an evaluation only needs a bisect and a multiplication.
+    Invalid arrays don't raise on creation, but on evaluation, like the functions do.
+
+    :param in_array: Input array
+    :param out_array: Output array
+    """
+
+    __slots__ = ("in_values", "out_values", "slopes", "out_low", "out_high", "error")
+
+    def __init__(self, in_array: List[float], out_array: List[float]):
+        self.error: Union[str, None] = None
+        if len(in_array) == 0 or len(in_array) != len(out_array):
+            self.error = f"Input array ({len(in_array)} values) and output array ({len(out_array)} values) must have the same length"
+            in_array, out_array = [], []
+
+        # Change compare-direction in array
+        if in_array and in_array[0] > in_array[-1]:
+            in_array, out_array = in_array[::-1], out_array[::-1]
+
+        self.in_values: tuple = tuple(in_array)
+        self.out_values: tuple = tuple(out_array)
+
+        # slope, lower and upper output value of the segment ending at each index
+        slopes = [None]
+        out_low = [None]
+        out_high = [None]
+        for idx in range(1, len(self.in_values)):
+            in_diff = self.in_values[idx - 1] - self.in_values[idx]
+            slopes.append((self.out_values[idx - 1] - self.out_values[idx]) / in_diff if in_diff != 0 else None)
+            out_low.append(min(self.out_values[idx - 1], self.out_values[idx]))
+            out_high.append(max(self.out_values[idx - 1], self.out_values[idx]))
+        self.slopes: tuple = tuple(slopes)
+        self.out_low: tuple = tuple(out_low)
+        self.out_high: tuple = tuple(out_high)
+
+    def linear(self, in_value: float) -> float:
+        """
+        Calculate the linear relationship for a value.
+
+        :param in_value: Input value
+        :return: Calculated value
+        """
+        if self.error is not None:
+            raise ValueError(self.error)
+
+        in_values = self.in_values
+
+        # Handle out of bounds
+        if in_value <= in_values[0]:
+            return self.out_values[0]
+        if in_value >= in_values[-1]:
+            return self.out_values[-1]
+
+        # Calculate linear value between the setpoints
+        idx = bisect.bisect(in_values, in_value)
+        slope = self.slopes[idx]
+        if slope is None:
+            raise ValueError(f"Input array has the same value {in_values[idx]} at consecutive positions")
+
+        value = self.out_values[idx] + (in_value - in_values[idx]) * slope
+        return min(self.out_high[idx], max(self.out_low[idx], value))
+
+    def step(self, in_value: float, return_lower: bool) -> float:
+        """
+        Calculate the step relationship for a value.
+
+        :param in_value: Input value
+        :param return_lower: Return lower value if True, else return higher value
+        :return: Calculated value
+        """
+        if self.error is not None:
+            raise ValueError(self.error)
+
+        # Handle out of bounds
+        if in_value <= self.in_values[0]:
+            return self.out_values[0]
+        if in_value >= self.in_values[-1]:
+            return self.out_values[-1]
+
+        # Get index between the setpoints
+        idx = bisect.bisect(self.in_values, in_value)
+        return self.out_values[idx] if return_lower else self.out_values[idx - 1]
+
+
 # SAVE CONFIG VALUES to constants
 # --------- Battery Current Limits ---------
 MAX_BATTERY_CHARGE_CURRENT: float = get_float_from_config("DEFAULT", "MAX_BATTERY_CHARGE_CURRENT")
@@ -251,14 +345,19 @@ CURRENT_MEASURED_BY_USER: list = get_list_from_config("DEFAULT", "CURRENT_MEASUR
 # check if lists are different
 # this allows to calculate linear relationship between the two lists only if needed
 CURRENT_CORRECTION: bool = CURRENT_REPORTED_BY_BMS != CURRENT_MEASURED_BY_USER
+CURRENT_CORRECTION_LOOKUP: PiecewiseLookup = PiecewiseLookup(CURRENT_REPORTED_BY_BMS, CURRENT_MEASURED_BY_USER)
 
 
 # --------- Bluetooth BMS ---------
 BLUETOOTH_USE_POLLING = get_bool_from_config("DEFAULT", "BLUETOOTH_USE_POLLING")
 BLUETOOTH_FORCE_RESET_BLE_STACK = get_bool_from_config("DEFAULT", "BLUETOOTH_FORCE_RESET_BLE_STACK")
 
+# --------- CAN BMS ---------
+CAN_USE_POLLING = get_bool_from_config("DEFAULT", "CAN_USE_POLLING")
+
 # --------- Daisy Chain Configuration (Multiple BMS on one cable) ---------
 BATTERY_ADDRESSES: list = get_list_from_config("DEFAULT", "BATTERY_ADDRESSES", str)
+BATTERY_AGGREGATE: bool = get_bool_from_config("DEFAULT", "BATTERY_AGGREGATE")
 
 # --------- BMS Disconnect Behavior ---------
 BLOCK_ON_DISCONNECT: bool = get_bool_from_config("DEFAULT", "BLOCK_ON_DISCONNECT")
@@ -354,6 +453,7 @@ Discharge current control management referring to cell-voltage
 """
 CELL_VOLTAGES_WHILE_CHARGING: List[float] = get_list_from_config("DEFAULT", "CELL_VOLTAGES_WHILE_CHARGING", float)
 MAX_CHARGE_CURRENT_CV: List[float] = get_list_from_config("DEFAULT", "MAX_CHARGE_CURRENT_CV_FRACTION", lambda v: MAX_BATTERY_CHARGE_CURRENT * float(v))
+MAX_CHARGE_CURRENT_CV_LOOKUP: PiecewiseLookup = PiecewiseLookup(CELL_VOLTAGES_WHILE_CHARGING, MAX_CHARGE_CURRENT_CV)
 
 
 # Common configuration checks
@@ -377,6 +477,7 @@ check_config_issue(
 
 CELL_VOLTAGES_WHILE_DISCHARGING: List[float] = get_list_from_config("DEFAULT", "CELL_VOLTAGES_WHILE_DISCHARGING", float)
 MAX_DISCHARGE_CURRENT_CV: List[float] = get_list_from_config("DEFAULT", "MAX_DISCHARGE_CURRENT_CV_FRACTION", lambda v: MAX_BATTERY_DISCHARGE_CURRENT * float(v))
+MAX_DISCHARGE_CURRENT_CV_LOOKUP: PiecewiseLookup = PiecewiseLookup(CELL_VOLTAGES_WHILE_DISCHARGING, MAX_DISCHARGE_CURRENT_CV)
 
 check_config_issue(
     CELL_VOLTAGES_WHILE_DISCHARGING[0] > MIN_CELL_VOLTAGE and MAX_DISCHARGE_CURRENT_CV[0] == 0,
@@ -401,6 +502,7 @@ Discharge current control management referring to temperature
 """
 TEMPERATURES_WHILE_CHARGING: List[float] = get_list_from_config("DEFAULT", "TEMPERATURES_WHILE_CHARGING", float)
 MAX_CHARGE_CURRENT_T: List[float] = get_list_from_config("DEFAULT", "MAX_CHARGE_CURRENT_T_FRACTION", lambda v: MAX_BATTERY_CHARGE_CURRENT * float(v))
+MAX_CHARGE_CURRENT_T_LOOKUP: PiecewiseLookup = PiecewiseLookup(TEMPERATURES_WHILE_CHARGING, MAX_CHARGE_CURRENT_T)
 
 check_config_issue(
     MAX_BATTERY_CHARGE_CURRENT not in MAX_CHARGE_CURRENT_T,
@@ -410,6 +512,7 @@ check_config_issue(
 
 TEMPERATURES_WHILE_DISCHARGING: List[float] = get_list_from_config("DEFAULT", "TEMPERATURES_WHILE_DISCHARGING", float)
 MAX_DISCHARGE_CURRENT_T: List[float] = get_list_from_config("DEFAULT", "MAX_DISCHARGE_CURRENT_T_FRACTION", lambda v: MAX_BATTERY_DISCHARGE_CURRENT * float(v))
+MAX_DISCHARGE_CURRENT_T_LOOKUP: PiecewiseLookup = PiecewiseLookup(TEMPERATURES_WHILE_DISCHARGING, MAX_DISCHARGE_CURRENT_T)
 
 check_config_issue(
     MAX_BATTERY_DISCHARGE_CURRENT not in MAX_DISCHARGE_CURRENT_T,
@@ -430,6 +533,7 @@ MOSFET_TEMPERATURES_WHILE_CHARGING: List[float] = get_list_from_config("DEFAULT"
 MAX_CHARGE_CURRENT_T_MOSFET: List[float] = get_list_from_config(
     "DEFAULT", "MAX_CHARGE_CURRENT_T_MOSFET_FRACTION", lambda v: MAX_BATTERY_CHARGE_CURRENT * float(v)
 )
+MAX_CHARGE_CURRENT_T_MOSFET_LOOKUP: PiecewiseLookup = PiecewiseLookup(MOSFET_TEMPERATURES_WHILE_CHARGING, MAX_CHARGE_CURRENT_T_MOSFET)
 
 check_config_issue(
     MAX_BATTERY_CHARGE_CURRENT not in MAX_CHARGE_CURRENT_T_MOSFET,
@@ -441,6 +545,7 @@ MOSFET_TEMPERATURES_WHILE_DISCHARGING: List[float] = get_list_from_config("DEFAU
 MAX_DISCHARGE_CURRENT_T_MOSFET: List[float] = get_list_from_config(
     "DEFAULT", "MAX_DISCHARGE_CURRENT_T_MOSFET_FRACTION", lambda v: MAX_BATTERY_DISCHARGE_CURRENT * float(v)
 )
+MAX_DISCHARGE_CURRENT_T_MOSFET_LOOKUP: PiecewiseLookup = PiecewiseLookup(MOSFET_TEMPERATURES_WHILE_DISCHARGING, MAX_DISCHARGE_CURRENT_T_MOSFET)
 
 check_config_issue(
     MAX_BATTERY_DISCHARGE_CURRENT not in MAX_DISCHARGE_CURRENT_T_MOSFET,
@@ -459,6 +564,7 @@ Discharge current control management referring to SoC
 """
 SOC_WHILE_CHARGING: List[float] = get_list_from_config("DEFAULT", "SOC_WHILE_CHARGING", float)
 MAX_CHARGE_CURRENT_SOC: List[float] = get_list_from_config("DEFAULT", "MAX_CHARGE_CURRENT_SOC_FRACTION", lambda v: MAX_BATTERY_CHARGE_CURRENT * float(v))
+MAX_CHARGE_CURRENT_SOC_LOOKUP: PiecewiseLookup = PiecewiseLookup(SOC_WHILE_CHARGING, MAX_CHARGE_CURRENT_SOC)
 
 check_config_issue(
     MAX_BATTERY_CHARGE_CURRENT not in MAX_CHARGE_CURRENT_SOC,
@@ -470,6 +576,7 @@ SOC_WHILE_DISCHARGING: List[float] = get_list_from_config("DEFAULT", "SOC_WHILE_
 MAX_DISCHARGE_CURRENT_SOC: List[float] = get_list_from_config(
     "DEFAULT", "MAX_DISCHARGE_CURRENT_SOC_FRACTION", lambda v: MAX_BATTERY_DISCHARGE_CURRENT * float(v)
 )
+MAX_DISCHARGE_CURRENT_SOC_LOOKUP: PiecewiseLookup = PiecewiseLookup(SOC_WHILE_DISCHARGING, MAX_DISCHARGE_CURRENT_SOC)
 
 check_config_issue(
     MAX_BATTERY_DISCHARGE_CURRENT not in MAX_DISCHARGE_CURRENT_SOC,
@@ -491,6 +598,10 @@ Defines the percentage of the maximum discharge current that the battery has to
 
 # --------- Time-To-Go ---------
 TIME_TO_GO_ENABLE: bool = get_bool_from_config("DEFAULT", "TIME_TO_GO_ENABLE")
+CURRENT_AVG_WINDOW: int = max(get_int_from_config("DEFAULT", "CURRENT_AVG_WINDOW"), 1)
+"""
+Number of cycles used to calculate the average current.
+"""
 
 # --------- Time-To-Soc ---------
 TIME_TO_SOC_POINTS: List[int] = get_list_from_config("DEFAULT", "TIME_TO_SOC_POINTS", int)
@@ -500,6 +611,35 @@ TIME_TO_SOC_INC_FROM: bool = get_bool_from_config("DEFAULT", "TIME_TO_SOC_INC_FR
 
 # --------- History ---------
 HISTORY_ENABLE: bool = get_bool_from_config("DEFAULT", "HISTORY_ENABLE")
+HISTORY_SAVE_PATH: str = config["DEFAULT"]["HISTORY_SAVE_PATH"]
+HISTORY_SAVE_INTERVAL: int = max(get_int_from_config("DEFAULT", "HISTORY_SAVE_INTERVAL"), 60)
+
+# --------- Cell internal resistance ---------
+CELL_RESISTANCE_ENABLE: bool = get_bool_from_config("DEFAULT", "CELL_RESISTANCE_ENABLE")
+CELL_RESISTANCE_MIN_CURRENT_STEP: float = max(get_float_from_config("DEFAULT", "CELL_RESISTANCE_MIN_CURRENT_STEP"), 1)
+CELL_RESISTANCE_FORGETTING_FACTOR: float = min(max(get_float_from_config("DEFAULT", "CELL_RESISTANCE_FORGETTING_FACTOR"), 0.5), 1)
+
+# --------- Time series ---------
+TIME_SERIES_ENABLE: bool = get_bool_from_config("DEFAULT", "TIME_SERIES_ENABLE")
+TIME_SERIES_LEVELS: List[Tuple[int, ...]] = get_list_from_config("DEFAULT", "TIME_SERIES_LEVELS", lambda level: tuple(int(part) for part in level.split(":")))
+check_config_issue(
+    any(len(level) != 2 or level[0] < 1 or level[1] < level[0] for level in TIME_SERIES_LEVELS),
+    f"TIME_SERIES_LEVELS ({TIME_SERIES_LEVELS}) has to be a list of <interval>:<retention> in seconds with a retention greater than the interval. "
+    + "Invalid levels are ignored.",
+)
+TIME_SERIES_LEVELS = sorted(level for level in TIME_SERIES_LEVELS if len(level) == 2 and 1 <= level[0] <= level[1])
+
+# --------- Battery state persistence ---------
+SAVE_BATTERY_STATE_INTERVAL: int = max(get_int_from_config("DEFAULT", "SAVE_BATTERY_STATE_INTERVAL"), 5)
+SAVE_SOC_CALC_MIN_DELTA: float = get_float_from_config("DEFAULT", "SAVE_SOC_CALC_MIN_DELTA")
+
+# --------- Publish deadband ---------
+PUBLISH_DEADBAND_CELL_VOLTAGE: float = get_float_from_config("DEFAULT", "PUBLISH_DEADBAND_CELL_VOLTAGE")
+PUBLISH_DEADBAND_VOLTAGE: float = get_float_from_config("DEFAULT", "PUBLISH_DEADBAND_VOLTAGE")
+PUBLISH_DEADBAND_CURRENT: float = get_float_from_config("DEFAULT", "PUBLISH_DEADBAND_CURRENT")
+PUBLISH_DEADBAND_POWER: float = get_float_from_config("DEFAULT", "PUBLISH_DEADBAND_POWER")
+PUBLISH_DEADBAND_TEMPERATURE: float = get_float_from_config("DEFAULT", "PUBLISH_DEADBAND_TEMPERATURE")
+PUBLISH_MAX_INTERVAL: int = get_int_from_config("DEFAULT", "PUBLISH_MAX_INTERVAL")
 
 # --------- Additional settings ---------
 BMS_TYPE: List[str] = get_list_from_config("DEFAULT", "BMS_TYPE", str)
@@ -650,6 +790,564 @@ def calc_step_relationship(in_value: float, in_array: List[float], out_array: Li
     return out_array[idx] if return_lower else out_array[idx - 1]
 
 
+class RollingStatistics:
+    """
+    Rolling statistics over the last `window` samples.
+
+    The samples are stored in a fixed ring buffer and the sum and the sum of squares are updated
+    with every new sample, so adding a sample and reading the statistics is O(1) regardless of
+    the window size. To avoid an accumulating floating point error, the sums are recalculated
+    from the buffer once per window.
+
+    :param window: Maximum number of samples
+    :param ewma_alpha: Smoothing factor of the exponentially weighted moving average between 0 and 1,
+        `None` to disable it
+    """
+
+    def __init__(self, window: int, ewma_alpha: float = None):
+        self.window: int = max(int(window), 1)
+        self.ewma_alpha: Union[float, None] = ewma_alpha
+        self.samples: array = array("d", [0.0]) * self.window
+        self.clear()
+
+    def clear(self) -> None:
+        """
+        Remove all samples.
+
+        :return: None
+        """
+        self.index: int = 0
+        self.count: int = 0
+        self.sum: float = 0.0
+        self.sum_squares: float = 0.0
+        self.ewma: Union[float, None] = None
+
+    def add(self, value: float) -> None:
+        """
+        Add a sample and drop the oldest one, if the window is full.
+
+        :param value: The new sample
+        :return: None
+        """
+        if self.count == self.window:
+            oldest = self.samples[self.index]
+            self.sum -= oldest
+            self.sum_squares -= oldest * oldest
+        else:
+            self.count += 1
+
+        self.samples[self.index] = value
+        self.sum += value
+        self.sum_squares += value * value
+
+        self.index += 1
+        if self.index == self.window:
+            self.index = 0
+            self.sum = math.fsum(self.samples[: self.count])
+            self.sum_squares = math.fsum(sample * sample for sample in self.samples[: self.count])
+
+        if self.ewma_alpha is not None:
+            self.ewma = value if self.ewma is None else self.ewma + self.ewma_alpha * (value - self.ewma)
+
+    def __len__(self) -> int:
+        return self.count
+
+    @property
+    def mean(self) -> Union[float, None]:
+        """
+        Mean of the samples in the window, `None` if there are no samples.
+        """
+        return self.sum / self.count if self.count else None
+
+    @property
+    def variance(self) -> Union[float, None]:
+        """
+        Population variance of the samples in the window, `None` if there are no samples.
+        """
+        if not self.count:
+            return None
+        mean = self.sum / self.count
+        # rounding can lead to a small negative value, if all samples are equal
+        return max(self.sum_squares / self.count - mean * mean, 0.0)
+
+
+class TrapezoidalIntegrator:
+    """
+    Integrates a value over time with the trapezoidal rule, e.g. the current to the charge
+    or the power to the energy.
+
+    The timestamps have to be monotonic (`time.monotonic()`), ideally captured by the transport
+    when the value was received, so that the result is neither affected by the duration of the
+    serial/BLE/CAN communication nor by clock changes (NTP). Samples can be added at any rate.
+
+    The positive and negative areas are returned separately. If the value changes its sign between
+    two samples, the area is split at the zero crossing.
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self) -> None:
+        """
+        Forget the last sample, e.g. after a connection loss, so that the gap is not integrated.
+
+        :return: None
+        """
+        self.last_timestamp: Union[float, None] = None
+        self.last_value: Union[float, None] = None
+
+    def add(self, value: float, timestamp: float) -> Tuple[float, float]:
+        """
+        Add a sample and integrate the area since the previous sample.
+
+        :param value: The value of the sample
+        :param timestamp: The monotonic timestamp of the sample in seconds
+        :return: The positive and the negative area since the previous sample in value * seconds,
+            both as positive numbers
+        """
+        last_value = self.last_value
+        last_timestamp = self.last_timestamp
+
+        # ignore samples that are older than the last one
+        if last_timestamp is not None and timestamp < last_timestamp:
+            return 0.0, 0.0
+
+        self.last_value = value
+        self.last_timestamp = timestamp
+
+        if last_timestamp is None:
+            return 0.0, 0.0
+
+        duration = timestamp - last_timestamp
+
+        # same sign: one trapezoid
+        if last_value >= 0 and value >= 0:
+            return (last_value + value) / 2 * duration, 0.0
+        if last_value <= 0 and value <= 0:
+            return 0.0, -(last_value + value) / 2 * duration
+
+        # different sign: split the trapezoid into two triangles at the zero crossing
+        zero_crossing = last_value / (last_value - value) * duration
+        if last_value > 0:
+            return last_value * zero_crossing / 2, -value * (duration - zero_crossing) / 2
+        return value * (duration - zero_crossing) / 2, -last_value * zero_crossing / 2
+
+
+class HistoryStore:
+    """
+    Saves the history values of a battery in a small binary file with a fixed layout.
+
+    The file consists of two slots of `SLOT_SIZE` bytes, which are written alternately.
+    Each slot contains a header with a sequence number, the values as doubles (`NaN` for
+    not set values) and a CRC32. On load the valid slot with the highest sequence number
+    is used, so a power loss while writing only loses the last update.
+
+    The values are stored in the order of the given names. New names have to be appended
+    at the end, so that files written by older versions can still be read.
+    """
+
+    MAGIC: bytes = b"SBHS"
+    VERSION: int = 1
+    SLOT_SIZE: int = 256
+    HEADER: Struct = Struct("<4sHHI")
+    """
+    Magic, version, number of values and sequence number
+    """
+    CRC: Struct = Struct("<I")
+
+    def __init__(self, path: str, names: Tuple[str, ...]):
+        """
+        :param path: The path of the file
+        :param names: The names of the values in the order they are stored
+        """
+        if self.HEADER.size + len(names) * 8 + self.CRC.size > self.SLOT_SIZE:
+            raise ValueError(f"HistoryStore: {len(names)} values don't fit into a slot of {self.SLOT_SIZE} bytes")
+
+        self.path: str = path
+        self.names: Tuple[str, ...] = names
+        self.values: Struct = Struct(f"<{len(names)}d")
+        self.sequence: int = 0
+
+    def read_slot(self, data: bytes) -> Union[Tuple[int, Dict[str, float]], None]:
+        """
+        Parse and validate a slot.
+
+        :param data: The content of the slot
+        :return: The sequence number and the values, or `None` if the slot is empty or invalid
+        """
+        if len(data) < self.HEADER.size + self.CRC.size:
+            return None
+
+        magic, version, count, sequence = self.HEADER.unpack_from(data)
+        end = self.HEADER.size + count * 8
+        if magic != self.MAGIC or version != self.VERSION or end + self.CRC.size > len(data):
+            return None
+
+        if self.CRC.unpack_from(data, end)[0] != zlib.crc32(data[:end]):
+            return None
+
+        # ignore values, that are not known by this version
+        count = min(count, len(self.names))
+        values = Struct(f"<{count}d").unpack_from(data, self.HEADER.size)
+        return sequence, {name: value for name, value in zip(self.names, values) if not math.isnan(value)}
+
+    def load(self) -> Union[Dict[str, float], None]:
+        """
+        Load the values from the newest valid slot.
+
+        :return: The values that are set, or `None` if there is no file or no valid slot
+        """
+        try:
+            with open(self.path, "rb") as file:
+                data = file.read(self.SLOT_SIZE * 2)
+        except FileNotFoundError:
+            return None
+        except OSError as e:
+            logger.error(f"History could not be read from {self.path}: {e}")
+            return None
+
+        slots = [self.read_slot(data[offset : offset + self.SLOT_SIZE]) for offset in (0, self.SLOT_SIZE)]
+        slots = [slot for slot in slots if slot is not None]
+        if not slots:
+            logger.error(f"History file {self.path} is corrupted")
+            return None
+
+        self.sequence, values = max(slots, key=lambda slot: slot[0])
+        return values
+
+    def save(self, values: Dict[str, Union[float, int, None]]) -> bool:
+        """
+        Save the values to the slot, that does not contain the newest values.
+
+        :param values: The values to save, names not included are saved as not set
+        :return: True if the values were written to the flash
+        """
+        sequence = (self.sequence + 1) & 0xFFFFFFFF
+        data = self.HEADER.pack(self.MAGIC, self.VERSION, len(self.names), sequence) + self.values.pack(
+            *(float(values[name]) if values.get(name) is not None else math.nan for name in self.names)
+        )
+        data += self.CRC.pack(zlib.crc32(data))
+
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with open(self.path, "r+b" if os.path.exists(self.path) else "w+b") as file:
+                file.seek((sequence % 2) * self.SLOT_SIZE)
+                file.write(data.ljust(self.SLOT_SIZE, b"\x00"))
+                file.flush()
+                os.fsync(file.fileno())
+        except OSError as e:
+            logger.error(f"History could not be saved to {self.path}: {e}")
+            return False
+
+        self.sequence = sequence
+        return True
+
+
+class TimeSeriesLevel:
+    """
+    Ring buffer of one resolution of a `TimeSeries`.
+
+    The samples are averaged per column over `interval` seconds. When a new interval starts, the
+    averages are written to the ring, which holds the intervals of the last `retention` seconds.
+    The columns are stored as single precision floats with `NaN` for missing values.
+
+    :param interval: Resolution in seconds
+    :param retention: Time span in seconds, that is kept
+    :param column_count: Number of columns
+    """
+
+    def __init__(self, interval: int, retention: int, column_count: int):
+        self.interval: int = interval
+        self.retention: int = retention
+        self.size: int = max(retention // interval, 1)
+        self.timestamps: array = array("d", [math.nan]) * self.size
+        self.columns: List[array] = [array("f", [math.nan]) * self.size for _ in range(column_count)]
+        self.index: int = 0
+        """
+        Position in the ring, that is written next
+        """
+        self.count: int = 0
+        """
+        Number of intervals in the ring
+        """
+        self.bin: Union[int, None] = None
+        """
+        Number of the interval, that is currently averaged (`timestamp // interval`)
+        """
+        self.sums: List[float] = [0.0] * column_count
+        self.counts: List[int] = [0] * column_count
+
+    def add_columns(self, column_count: int) -> None:
+        """
+        Append empty columns, the intervals recorded before are `NaN`.
+
+        :param column_count: Number of columns to append
+        :return: None
+        """
+        self.columns.extend(array("f", [math.nan]) * self.size for _ in range(column_count))
+        self.sums.extend([0.0] * column_count)
+        self.counts.extend([0] * column_count)
+
+    def add(self, timestamp: float, values: List[Union[float, None]]) -> None:
+        """
+        Add a sample to the average of the current interval.
+
+        :param timestamp: The timestamp of the sample in seconds
+        :param values: The values of the columns, `None` or `NaN` for missing values
+        :return: None
+        """
+        interval_bin = int(timestamp // self.interval)
+        if interval_bin != self.bin:
+            if self.bin is not None:
+                self.commit()
+            self.bin = interval_bin
+
+        sums = self.sums
+        counts = self.counts
+        for column, value in enumerate(values):
+            # NaN is not equal to itself
+            if value is not None and value == value:
+                sums[column] += value
+                counts[column] += 1
+
+    def commit(self) -> None:
+        """
+        Write the averages of the current interval to the ring and start a new average.
+
+        :return: None
+        """
+        index = self.index
+        self.timestamps[index] = self.bin * self.interval
+        for column, values in enumerate(self.columns):
+            values[index] = self.sums[column] / self.counts[column] if self.counts[column] else math.nan
+
+        self.index = (index + 1) % self.size
+        self.count = min(self.count + 1, self.size)
+        self.sums = [0.0] * len(self.sums)
+        self.counts = [0] * len(self.counts)
+
+    def query(self, columns: List[int], start: float, end: float) -> Tuple[List[float], List[List[Union[float, None]]]]:
+        """
+        Get the intervals within the time range in chronological order, including the interval
+        that is currently averaged.
+
+        :param columns: The indexes of the columns
+        :param start: Start of the time range in seconds
+        :param end: End of the time range in seconds
+        :return: The timestamps (start of the interval) and the values of each column, `None` for missing values
+        """
+        timestamps = []
+        values = [[] for _ in columns]
+
+        for position in range(self.index - self.count, self.index):
+            position %= self.size
+            timestamp = self.timestamps[position]
+            if start <= timestamp <= end:
+                timestamps.append(timestamp)
+                for result, column in zip(values, columns):
+                    value = self.columns[column][position]
+                    result.append(value if value == value else None)
+
+        # the interval that is currently averaged
+        if self.bin is not None and start <= self.bin * self.interval <= end:
+            timestamps.append(float(self.bin * self.interval))
+            for result, column in zip(values, columns):
+                result.append(self.sums[column] / self.counts[column] if self.counts[column] else None)
+
+        return timestamps, values
+
+    def get_memory_size(self) -> int:
+        """
+        :return: The size of the ring buffers in bytes
+        """
+        return self.timestamps.itemsize * self.size + sum(column.itemsize * self.size for column in self.columns)
+
+
+class TimeSeries:
+    """
+    Memory bounded time series of several columns with multiple resolutions, e.g. 1 second for
+    1 hour and 1 minute for 7 days. Each sample is added to all levels, which average it
+    over their interval, so adding a sample is cheap and doesn't depend on the retention.
+
+    :param names: The names of the columns
+    :param levels: The levels as `(interval, retention)` in seconds
+    """
+
+    def __init__(self, names: Iterable[str], levels: Iterable[Tuple[int, int]]):
+        self.names: Tuple[str, ...] = tuple(names)
+        self.indexes: Dict[str, int] = {name: index for index, name in enumerate(self.names)}
+        self.levels: List[TimeSeriesLevel] = [
+            TimeSeriesLevel(interval, retention, len(self.names)) for interval, retention in sorted(levels) if interval > 0 and retention > 0
+        ]
+
+    def add_columns(self, names: Iterable[str]) -> None:
+        """
+        Append columns, e.g. when the number of cells is known. The values recorded before are missing.
+
+        :param names: The names of the new columns
+        :return: None
+        """
+        names = tuple(names)
+        self.indexes.update({name: index for index, name in enumerate(names, len(self.names))})
+        self.names += names
+        for level in self.levels:
+            level.add_columns(len(names))
+
+    def add(self, timestamp: float, values: Iterable[Union[float, None]]) -> None:
+        """
+        Add a sample to all levels.
+
+        :param timestamp: The timestamp of the sample in seconds
+        :param values: The values in the order of `names`, `None` or `NaN` for missing values
+        :return: None
+        """
+        values = list(values)
+        for level in self.levels:
+            level.add(timestamp, values)
+
+    def get_level(self, start: float, end: float, interval: int = None) -> Union[TimeSeriesLevel, None]:
+        """
+        Get the level with the given interval, or the finest level that covers the time range.
+
+        :param start: Start of the time range in seconds
+        :param end: End of the time range in seconds
+        :param interval: The resolution in seconds, `None` to select it automatically
+        :return: The level or `None`, if there is no matching level
+        """
+        if interval is not None:
+            return next((level for level in self.levels if level.interval == interval), None)
+
+        for level in self.levels:
+            if end - start <= level.retention:
+                return level
+        return self.levels[-1] if self.levels else None
+
+    def query(self, names: Iterable[str], start: float, end: float, interval: int = None) -> Tuple[List[float], Dict[str, List[Union[float, None]]]]:
+        """
+        Get the values of the columns within the time range.
+
+        :param names: The names of the columns
+        :param start: Start of the time range in seconds
+        :param end: End of the time range in seconds
+        :param interval: The resolution in seconds, `None` to use the finest level that covers the time range
+        :return: The timestamps and a dict with the values of each column, `None` for missing values
+        """
+        names = list(names)
+        level = self.get_level(start, end, interval)
+        if level is None:
+            return [], {name: [] for name in names}
+
+        timestamps, values = level.query([self.indexes[name] for name in names], start, end)
+        return timestamps, dict(zip(names, values))
+
+    def get_memory_size(self) -> int:
+        """
+        :return: The size of the ring buffers in bytes
+        """
+        return sum(level.get_memory_size() for level in self.levels)
+
+
+class ResistanceEstimator:
+    """
+    Estimates the internal resistance of each cell from the change of the cell voltages on
+    current steps (dV/dI), e.g. when an inverter or a charger starts.
+
+    For each step between two cycles the change of the current and of each cell voltage is added
+    to an incremental least squares fit through the origin with exponential forgetting:
+
+    `R = sum(dI * dV) / sum(dI * dI)`
+
+    Only the sums and the last sample are kept, so the memory is constant and one update is a
+    single pass over the cells. Steps over a longer time are ignored, since the voltage also
+    changes with the SoC and the cell relaxation.
+
+    :param cell_count: Number of cells
+    :param min_current_step: Minimum change of the current in A between two samples
+    :param forgetting_factor: Weight of the previous steps between 0 and 1, lower values follow changes faster
+    :param max_sample_gap: Maximum time in seconds between two samples to use them
+    """
+
+    def __init__(self, cell_count: int, min_current_step: float, forgetting_factor: float, max_sample_gap: float = 5):
+        self.cell_count: int = cell_count
+        self.min_current_step: float = min_current_step
+        self.forgetting_factor: float = forgetting_factor
+        self.max_sample_gap: float = max_sample_gap
+        self.reset()
+
+    def reset(self) -> None:
+        """
+        Forget all steps and the last sample.
+
+        :return: None
+        """
+        self.last_timestamp: Union[float, None] = None
+        self.last_current: Union[float, None] = None
+        self.last_voltages: array = array("d", [math.nan]) * self.cell_count
+        self.sum_current_current: array = array("d", [0.0]) * self.cell_count
+        self.sum_current_voltage: array = array("d", [0.0]) * self.cell_count
+        self.steps: int = 0
+
+    def update(self, timestamp: float, current: float, voltages: array) -> bool:
+        """
+        Add a sample and update the fit, if the current changed by at least `min_current_step`.
+
+        :param timestamp: The monotonic timestamp of the sample in seconds
+        :param current: The battery current in A
+        :param voltages: The cell voltages in V, `NaN` for missing values
+        :return: True if the sample was used as step
+        """
+        last_current = self.last_current
+        last_voltages = self.last_voltages
+        gap = timestamp - self.last_timestamp if self.last_timestamp is not None else None
+
+        self.last_timestamp = timestamp
+        self.last_current = current
+        self.last_voltages = array("d", voltages[: self.cell_count])
+
+        if gap is None or gap > self.max_sample_gap or len(self.last_voltages) != self.cell_count:
+            return False
+
+        delta_current = current - last_current
+        if abs(delta_current) < self.min_current_step:
+            return False
+
+        # update all cells in one pass, missing voltages (NaN) don't change the sums of the cell
+        forgetting_factor = self.forgetting_factor
+        delta_current_squared = delta_current * delta_current
+        delta_voltages = [voltage - last_voltage for voltage, last_voltage in zip(self.last_voltages, last_voltages)]
+        self.sum_current_current = array(
+            "d",
+            (
+                sum_current_current * forgetting_factor + delta_current_squared if delta_voltage == delta_voltage else sum_current_current
+                for sum_current_current, delta_voltage in zip(self.sum_current_current, delta_voltages)
+            ),
+        )
+        self.sum_current_voltage = array(
+            "d",
+            (
+                sum_current_voltage * forgetting_factor + delta_current * delta_voltage if delta_voltage == delta_voltage else sum_current_voltage
+                for sum_current_voltage, delta_voltage in zip(self.sum_current_voltage, delta_voltages)
+            ),
+        )
+        self.steps += 1
+
+        return True
+
+    def get_resistances(self, min_steps: int = 3) -> List[Union[float, None]]:
+        """
+        Get the estimated resistance of each cell.
+
+        :param min_steps: Minimum number of steps, before a resistance is estimated
+        :return: The resistance of each cell in Ohm, `None` if not enough steps were seen for the cell
+        """
+        # the sum of squares has to contain at least min_steps of the minimum current step
+        min_sum = min_steps * self.min_current_step * self.min_current_step * self.forgetting_factor ** (min_steps - 1)
+        return [
+            sum_current_voltage / sum_current_current if self.steps >= min_steps and sum_current_current >= min_sum else None
+            for sum_current_current, sum_current_voltage in zip(self.sum_current_current, self.sum_current_voltage)
+        ]
+
+
 def is_bit_set(value: Any) -> bool:
     """
     Check if a bit is set high or low.
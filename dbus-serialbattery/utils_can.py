@@ -1,9 +1,221 @@
 # -*- coding: utf-8 -*-
+import logging
 import threading
 import can
+import socket
+import struct
 import subprocess
+from collections import deque
+from typing import Callable, Deque, Dict, Iterable, List, Set, Tuple, Union
 from utils import logger
-from time import sleep, time
+from time import monotonic, sleep, time
+
+# interface flag from linux/if.h
+IFF_UP = 0x1
+
+# rtnetlink constants from linux/netlink.h, linux/rtnetlink.h, linux/if_link.h and linux/can/netlink.h
+NETLINK_ROUTE = 0
+NLM_F_REQUEST = 0x1
+RTM_NEWLINK = 16
+RTM_GETLINK = 18
+IFLA_LINKINFO = 18
+IFLA_INFO_DATA = 2
+IFLA_CAN_BITTIMING = 1
+
+
+def can_filter(can_id: int, can_mask: int = None, extended: bool = None) -> dict:
+    """
+    Create a filter in the format of python-can, which is installed as SocketCAN kernel filter
+
+    :param can_id: arbitration id to receive
+    :param can_mask: bits of the arbitration id that have to match, default are all bits
+    :param extended: True for 29 bit ids, False for 11 bit ids, default is detected from the id
+    :return: filter for `can.BusABC.set_filters()`
+    """
+    if extended is None:
+        extended = can_id > 0x7FF
+    if can_mask is None:
+        can_mask = 0x1FFFFFFF if extended else 0x7FF
+    return {"can_id": can_id, "can_mask": can_mask, "extended": extended}
+
+
+class CanSubscriber:
+    """
+    Class to cache the CAN messages of the arbitration ids a driver subscribed to
+    """
+
+    # maximum number of samples kept, if the driver does not fetch them
+    SAMPLES_MAX = 1000
+
+    def __init__(self, filters: Union[List[dict], None], sample_ids: Iterable[int] = ()):
+        """
+        :param filters: filters created with `can_filter()`, None to receive all messages
+        :param sample_ids: arbitration ids (as cached) of which every message is kept with its timestamp
+        """
+        self.filters = filters
+        self.callback: Union[Callable, None] = None
+        self.callback_ids: Set[int] = set()
+        # the receiver thread replaces the dict instead of changing its size,
+        # so the driver can iterate over it without a copy and without a lock
+        self.message_cache = {}
+        self.sample_ids: Set[int] = set(sample_ids)
+        self.samples: Deque[Tuple[float, int, bytearray]] = deque(maxlen=self.SAMPLES_MAX)
+        self.frame_count = 0
+        """
+        Number of received messages since the start
+        """
+        self.timeouts = 0
+        """
+        Number of cached messages removed, because they were not received within their time to live
+        """
+
+    def matches(self, arbitration_id: int, is_extended_id: bool) -> bool:
+        """
+        Check if the message is one of the subscribed arbitration ids
+
+        :param arbitration_id: arbitration id as received from the bus
+        :param is_extended_id: True if the message has a 29 bit id
+        :return: True if the message matches one of the filters
+        """
+        if self.filters is None:
+            return True
+        for _filter in self.filters:
+            if _filter["extended"] == is_extended_id and arbitration_id & _filter["can_mask"] == _filter["can_id"] & _filter["can_mask"]:
+                return True
+        return False
+
+    def set_message(self, arbitration_id: int, data: bytearray) -> None:
+        """
+        Cache the data of a message
+
+        :param arbitration_id: arbitration id used as key
+        :param data: data of the message
+        :return: None
+        """
+        if arbitration_id in self.message_cache:
+            self.message_cache[arbitration_id] = data
+        else:
+            message_cache = dict(self.message_cache)
+            message_cache[arbitration_id] = data
+            self.message_cache = message_cache
+
+    def delete_message(self, arbitration_id: int) -> None:
+        """
+        Remove the data of a message from the cache
+
+        :param arbitration_id: arbitration id used as key
+        :return: None
+        """
+        if arbitration_id in self.message_cache:
+            message_cache = dict(self.message_cache)
+            del message_cache[arbitration_id]
+            self.message_cache = message_cache
+
+    def set_callback(self, callback_ids: Iterable[int], callback: Union[Callable, None]) -> None:
+        """
+        Set a function, which is called by the receiver thread when one of the messages arrived.
+        This allows to process the data as soon as a complete set of messages was received.
+
+        :param callback_ids: arbitration ids (as cached) which complete a set of messages
+        :param callback: function without parameters or None to remove the callback
+        :return: None
+        """
+        self.callback_ids = set(callback_ids)
+        self.callback = callback
+
+    def get_message_cache(self) -> dict:
+        """
+        Get the cache of the subscribed CAN messages. The dict must not be changed by the caller.
+
+        :return: dict of received CAN messages
+        """
+        return self.message_cache
+
+    def add_sample(self, timestamp: float, arbitration_id: int, data: bytearray) -> None:
+        """
+        Keep a message of the sample ids, which would be overwritten in the cache by the next one
+
+        :param timestamp: timestamp of the message in seconds since the epoch
+        :param arbitration_id: arbitration id as cached
+        :param data: data of the message
+        :return: None
+        """
+        if arbitration_id in self.sample_ids:
+            self.samples.append((timestamp, arbitration_id, data))
+
+    def take_samples(self) -> Deque[Tuple[float, int, bytearray]]:
+        """
+        Get the samples received since the last call, the caller has to hold the cache lock of the receiver thread
+
+        :return: samples as tuple of timestamp, arbitration id and data
+        """
+        samples = self.samples
+        self.samples = deque(maxlen=self.SAMPLES_MAX)
+        return samples
+
+
+class CanFrameStatistics:
+    """
+    Class to track the reception of one arbitration id based on the timestamps of the messages
+    """
+
+    # weight of a new period in the moving averages
+    SMOOTHING = 0.1
+
+    # time to live of a cached message, as long as the period is unknown
+    TTL_DEFAULT = 5.0
+    # minimum time to live, to tolerate short delays of fast messages
+    TTL_MIN = 1.0
+    # number of periods a message can be missed, before it's removed from the cache
+    TTL_PERIODS = 5
+
+    def __init__(self, timestamp: float):
+        """
+        :param timestamp: timestamp of the first message in seconds
+        """
+        self.count = 1
+        self.last_timestamp = timestamp
+        self.period: Union[float, None] = None
+        """
+        Average time between two messages in seconds
+        """
+        self.jitter = 0.0
+        """
+        Average deviation of the time between two messages from the period in seconds
+        """
+
+    def update(self, timestamp: float) -> None:
+        """
+        Update the statistics with a new message
+
+        :param timestamp: timestamp of the message in seconds
+        :return: None
+        """
+        period = max(timestamp - self.last_timestamp, 0.0)
+        self.last_timestamp = timestamp
+        self.count += 1
+
+        if self.period is None:
+            self.period = period
+        else:
+            self.jitter += self.SMOOTHING * (abs(period - self.period) - self.jitter)
+            self.period += self.SMOOTHING * (period - self.period)
+
+    @property
+    def rate(self) -> Union[float, None]:
+        """
+        Messages per second
+        """
+        return 1 / self.period if self.period else None
+
+    @property
+    def ttl(self) -> float:
+        """
+        Time in seconds after the last message, after which the cached message is outdated
+        """
+        if self.period is None:
+            return self.TTL_DEFAULT
+        return max(self.TTL_MIN, self.period * self.TTL_PERIODS + self.jitter * 4)
 
 
 class CanTransportInterface:
@@ -13,6 +225,73 @@ class CanTransportInterface:
 
     can_message_cache_callback: callable = None
     can_bus = None
+    can_receiver_thread: "CanReceiverThread" = None
+    can_subscriber: CanSubscriber = None
+
+    def subscribe(self, filters: Union[List[dict], None], sample_ids: Iterable[int] = ()) -> "CanTransportInterface":
+        """
+        Create a transport interface, which only receives the messages matching the filters
+
+        :param filters: filters created with `can_filter()`, None to receive all messages
+        :param sample_ids: arbitration ids (as cached) of which every message is kept, see `get_samples()`
+        :return: transport interface for one driver
+        """
+        if self.can_receiver_thread is None:
+            return self
+
+        can_transport_interface = CanTransportInterface()
+        can_transport_interface.can_subscriber = self.can_receiver_thread.subscribe(filters, sample_ids)
+        can_transport_interface.can_message_cache_callback = can_transport_interface.can_subscriber.get_message_cache
+        can_transport_interface.can_bus = self.can_bus
+        can_transport_interface.can_receiver_thread = self.can_receiver_thread
+        return can_transport_interface
+
+    def set_callback(self, callback_ids: Iterable[int], callback: Union[Callable, None]) -> bool:
+        """
+        Call a function as soon as one of the messages arrived, see `CanSubscriber.set_callback()`
+
+        :param callback_ids: arbitration ids (as cached) which complete a set of messages
+        :param callback: function without parameters or None to remove the callback
+        :return: True if the callback is used, False if the messages are not received by a subscriber
+        """
+        if self.can_subscriber is None:
+            return False
+
+        self.can_subscriber.set_callback(callback_ids, callback)
+        return callback is not None
+
+    def get_samples(self) -> List[Tuple[float, int, bytearray]]:
+        """
+        Get all messages of the sample ids received since the last call, e.g. to integrate
+        every current measurement and not only the last cached one
+
+        :return: list of monotonic timestamp (`time.monotonic()`), arbitration id and data, oldest first
+        """
+        if self.can_subscriber is None:
+            return []
+
+        with self.can_receiver_thread.cache_lock:
+            samples = self.can_subscriber.take_samples()
+
+        # the kernel timestamps are wall-clock time, convert them to the monotonic clock used for the integration
+        offset = monotonic() - time()
+        return [(timestamp + offset, arbitration_id, data) for timestamp, arbitration_id, data in samples]
+
+    def get_frame_statistics(self) -> Dict[int, dict]:
+        """
+        Get the reception statistics of the messages of this driver, see `CanReceiverThread.get_frame_statistics()`
+
+        :return: dict with the arbitration ID as key and the statistics as value
+        """
+        if self.can_receiver_thread is None:
+            return {}
+
+        statistics = self.can_receiver_thread.get_frame_statistics()
+        if self.can_subscriber is None:
+            return statistics
+
+        # the statistics do not store the id type, but the standard ids used by the BMS are all below 0x7FF
+        return {arb_id: values for arb_id, values in statistics.items() if self.can_subscriber.matches(arb_id, arb_id > 0x7FF)}
 
 
 class CanReceiverThread(threading.Thread):
@@ -31,11 +310,14 @@ class CanReceiverThread(threading.Thread):
         super().__init__(name=f"CanReceiverThread-{channel}")
         self.channel = channel
         self.bustype = bustype
-        self._current_time = int(time())
-        self.message_cache = {}  # cache can frames here
+        self._current_time = time()
+        self.message_cache = {}  # cache all can frames here, until the drivers subscribed to their frames
+        self.cache_all_messages = True
+        self.subscribers: List[CanSubscriber] = []
         self.cache_lock = threading.Lock()  # lock for thread safety
-        self._last_received_time = {}  # track last received time for each arbitration ID
+        self._frame_statistics: Dict[int, CanFrameStatistics] = {}  # track the reception of each arbitration ID
         self._last_cache_clean_time = 0  # last time the cached was cleaned (deleted too old values)
+        self._last_statistics_log_time = 0  # last time the reception statistics were logged
         CanReceiverThread._instances[(channel, bustype)] = self
         self.daemon = True
         self._running = True  # flag to control the running state
@@ -74,59 +356,70 @@ class CanReceiverThread(threading.Thread):
         bitrate = self.get_bitrate(self.channel)
         logger.info(f"Detected CAN Bus bitrate: {bitrate/1000:.0f} kbps")
 
-        # timestamp of last received message
-        last_message_time_stamp = 0
         self.can_initialised.set()
 
         while self._running:
-            self._current_time = int(time())
+            self._current_time = time()
 
             link_status = self.get_link_status()
             self.clear_old_cache_entries()
+            self.log_frame_statistics()
 
             if link_status:
                 try:
                     message = self.can_bus.recv(timeout=1.0)  # wait for max 1 second to receive message
 
                     if message is not None:
-                        last_message_time_stamp = self._current_time
+                        # use the timestamp of the kernel, which is not delayed by the scheduling of this thread
+                        timestamp = message.timestamp if message.timestamp else time()
                         with self.cache_lock:
+                            arbitration_id = message.arbitration_id
 
                             # daly hack: cell voltage messages are sent with same id, so use frame id additionally as offset for cmd byte
-                            if message.arbitration_id & 0xFFFFFF00 == 0x18954000:
-                                message.arbitration_id = message.arbitration_id + 0x100000 + (message.data[0] << 16)
+                            if arbitration_id & 0xFFFFFF00 == 0x18954000:
+                                arbitration_id = arbitration_id + 0x100000 + (message.data[0] << 16)
                                 # 18954001 -> 18A64001  frame 1
                                 # 18954001 -> 18A74001  frame 2...
 
                             # cache data with arbitration id as key
-                            self.message_cache[message.arbitration_id] = message.data
-                            self._last_received_time[message.arbitration_id] = last_message_time_stamp  # update last received time
+                            if self.cache_all_messages:
+                                self.message_cache[arbitration_id] = message.data
+                            callbacks = []
+                            for subscriber in self.subscribers:
+                                if subscriber.matches(message.arbitration_id, message.is_extended_id):
+                                    subscriber.set_message(arbitration_id, message.data)
+                                    subscriber.frame_count += 1
+                                    subscriber.add_sample(timestamp, arbitration_id, message.data)
+                                    if subscriber.callback is not None and arbitration_id in subscriber.callback_ids:
+                                        callbacks.append(subscriber.callback)
+
+                            # update the reception statistics
+                            if arbitration_id in self._frame_statistics:
+                                self._frame_statistics[arbitration_id].update(timestamp)
+                            else:
+                                self._frame_statistics[arbitration_id] = CanFrameStatistics(timestamp)
+
+                        # call outside of the lock, since the callback reads the cache
+                        for callback in callbacks:
+                            callback()
 
                         logger.debug(f"[{self.channel}] Received: ID={hex(message.arbitration_id)}, Daten={message.data}")
 
                 except can.exceptions.CanOperationError as e:
                     logger.debug(f"CAN Bus {self.channel}: {e}")
-                    self.message_cache = {}
-                    self._last_received_time = {}
+                    self.clear_cache()
                     sleep(1)
             else:
                 logger.error(">>> ERROR: CAN Bus interface is down")
-                self.message_cache = {}
-                self._last_received_time = {}
+                self.clear_cache()
                 sleep(1)
 
-            if self._current_time - last_message_time_stamp > 2 and self.message_cache:
-                logger.debug(f"CAN Bus {self.channel} has not received any messages in the last 2 seconds")
-                self.message_cache = {}
-                self._last_received_time = {}
-                sleep(2)
-
         self.stop()
 
-    # Clear cache entries for defined arbitration IDs if they have not been received for 5 seconds.
     def clear_old_cache_entries(self) -> None:
         """
-        Clear cache entries for defined arbitration IDs if they have not been received for 5 seconds.
+        Clear cache entries for arbitration IDs, which have not been received within their time to live.
+        The time to live is derived from the observed period of each ID, see `CanFrameStatistics.ttl`.
 
         :return: None
         """
@@ -138,11 +431,31 @@ class CanReceiverThread(threading.Thread):
         self._last_cache_clean_time = self._current_time
 
         with self.cache_lock:
-            for arb_id in list(self._last_received_time.keys()):
-                if self._current_time - self._last_received_time[arb_id] > 5:
-                    del self.message_cache[arb_id]
-                    del self._last_received_time[arb_id]
-                    logger.debug(f"[{self.channel}] Cleared cache for arbitration ID {hex(arb_id)} due to timeout")
+            for arb_id, statistics in list(self._frame_statistics.items()):
+                age = self._current_time - statistics.last_timestamp
+                if age > statistics.ttl:
+                    self.message_cache.pop(arb_id, None)
+                    for subscriber in self.subscribers:
+                        if arb_id in subscriber.message_cache:
+                            subscriber.timeouts += 1
+                        subscriber.delete_message(arb_id)
+                    del self._frame_statistics[arb_id]
+                    logger.debug(
+                        f"[{self.channel}] Cleared cache for arbitration ID {hex(arb_id)} due to timeout: "
+                        + f"not received for {age:.3f} s, time to live {statistics.ttl:.3f} s"
+                    )
+
+    def clear_cache(self) -> None:
+        """
+        Clear all cached messages, e.g. if the CAN bus is down
+
+        :return: None
+        """
+        with self.cache_lock:
+            self.message_cache = {}
+            for subscriber in self.subscribers:
+                subscriber.message_cache = {}
+            self._frame_statistics = {}
 
     def stop(self) -> None:
         """
@@ -173,6 +486,100 @@ class CanReceiverThread(threading.Thread):
             # return a copy of the current cache
             return dict(self.message_cache)
 
+    def get_frame_statistics(self) -> Dict[int, dict]:
+        """
+        Get the reception statistics of the cached arbitration IDs for diagnostics
+
+        :return: dict with the arbitration ID as key and the count, rate (1/s), period, jitter, time to live and age (s) as value
+        """
+        current_time = time()
+        with self.cache_lock:
+            return {
+                arb_id: {
+                    "count": statistics.count,
+                    "rate": statistics.rate,
+                    "period": statistics.period,
+                    "jitter": statistics.jitter,
+                    "ttl": statistics.ttl,
+                    "age": current_time - statistics.last_timestamp,
+                }
+                for arb_id, statistics in self._frame_statistics.items()
+            }
+
+    def log_frame_statistics(self) -> None:
+        """
+        Log the reception statistics every 60 seconds, if debug logging is enabled
+
+        :return: None
+        """
+        if self._last_statistics_log_time + 60 > self._current_time or not logger.isEnabledFor(logging.DEBUG):
+            return
+
+        self._last_statistics_log_time = self._current_time
+
+        for arb_id, statistics in sorted(self.get_frame_statistics().items()):
+            logger.debug(
+                f"[{self.channel}] ID={hex(arb_id)}: {statistics['count']} messages"
+                + (f", {statistics['rate']:.2f}/s, jitter {statistics['jitter'] * 1000:.1f} ms" if statistics["rate"] is not None else "")
+                + f", time to live {statistics['ttl']:.3f} s"
+            )
+
+    def subscribe(self, filters: Union[List[dict], None], sample_ids: Iterable[int] = ()) -> CanSubscriber:
+        """
+        Subscribe to the messages matching the filters. Already cached messages are taken over.
+
+        :param filters: filters created with `can_filter()`, None to receive all messages
+        :param sample_ids: arbitration ids (as cached) of which every message is kept with its timestamp
+        :return: subscriber with the cache of the matching messages
+        """
+        subscriber = CanSubscriber(filters, sample_ids)
+
+        with self.cache_lock:
+            # the cache does not store the id type, but the standard ids used by the BMS are all below 0x7FF
+            subscriber.message_cache = {
+                arbitration_id: data for arbitration_id, data in self.message_cache.items() if subscriber.matches(arbitration_id, arbitration_id > 0x7FF)
+            }
+            self.subscribers.append(subscriber)
+
+        self.apply_filters()
+        return subscriber
+
+    def release_message_cache(self) -> None:
+        """
+        Stop caching all messages after the drivers subscribed to their messages.
+        From now on, only the subscribed messages are received.
+
+        :return: None
+        """
+        with self.cache_lock:
+            self.cache_all_messages = False
+            self.message_cache = {}
+
+        self.apply_filters()
+
+    def apply_filters(self) -> None:
+        """
+        Install the filters of all subscribers as SocketCAN kernel filters,
+        so that messages of other devices on the bus don't wake up this thread.
+
+        :return: None
+        """
+        if self.can_bus is None:
+            return
+
+        with self.cache_lock:
+            if self.cache_all_messages or any(subscriber.filters is None for subscriber in self.subscribers):
+                filters = None
+            else:
+                filters = [_filter for subscriber in self.subscribers for _filter in subscriber.filters]
+
+        try:
+            self.can_bus.set_filters(filters)
+            logger.debug(f"[{self.channel}] Applied {len(filters) if filters is not None else 'no'} CAN filters")
+        except Exception as e:
+            # python-can falls back to filtering in software, if the interface does not support it
+            logger.warning(f"Error applying CAN filters on {self.channel}: {e}")
+
     def get_link_status(self) -> bool:
         """
         Check if the CAN interface is up. Cache the result for 1 second.
@@ -185,8 +592,12 @@ class CanReceiverThread(threading.Thread):
         if self._link_status_cache["timestamp"] + 1 > self._current_time:
             return self._link_status_cache["result"]
 
-        result = subprocess.run(["ip", "link", "show", self.channel], capture_output=True, text=True, check=True)
-        status = "UP" in result.stdout
+        flags = self.get_link_flags(self.channel)
+        if flags is not None:
+            status = bool(flags & IFF_UP)
+        else:
+            result = subprocess.run(["ip", "link", "show", self.channel], capture_output=True, text=True, check=True)
+            status = "UP" in result.stdout
 
         # Update the cache
         self._link_status_cache["timestamp"] = self._current_time
@@ -194,6 +605,75 @@ class CanReceiverThread(threading.Thread):
 
         return status
 
+    @staticmethod
+    def get_link_flags(channel: str) -> Union[int, None]:
+        """
+        Read the interface flags from sysfs, which is much cheaper than starting `ip` every second
+
+        :param channel: CAN interface name
+        :return: interface flags (IFF_*) or None, if not available
+        """
+        try:
+            with open(f"/sys/class/net/{channel}/flags", "r") as file:
+                return int(file.read().strip(), 16)
+        except (OSError, ValueError):
+            return None
+
+    @staticmethod
+    def get_netlink_bitrate(channel: str) -> Union[int, None]:
+        """
+        Request the bit timing of the CAN interface over rtnetlink (RTM_GETLINK)
+
+        :param channel: CAN interface name
+        :return: bitrate in bps or None, if not available
+        """
+        try:
+            index = socket.if_nametoindex(channel)
+            with socket.socket(socket.AF_NETLINK, socket.SOCK_RAW, NETLINK_ROUTE) as netlink_socket:
+                netlink_socket.settimeout(1)
+                netlink_socket.bind((0, 0))
+                # struct nlmsghdr + struct ifinfomsg
+                request = struct.pack("=LHHLLBxHiII", 32, RTM_GETLINK, NLM_F_REQUEST, 1, 0, socket.AF_UNSPEC, 0, index, 0, 0)
+                netlink_socket.send(request)
+                response = netlink_socket.recv(65536)
+        except OSError as e:
+            logger.debug(f"Error requesting bitrate over netlink: {e}")
+            return None
+
+        length, message_type = struct.unpack_from("=LH", response)
+        if message_type != RTM_NEWLINK:
+            return None
+
+        # IFLA_LINKINFO -> IFLA_INFO_DATA -> IFLA_CAN_BITTIMING -> struct can_bittiming, which starts with the bitrate
+        attributes = response[32:length]
+        for attribute_type in (IFLA_LINKINFO, IFLA_INFO_DATA, IFLA_CAN_BITTIMING):
+            attributes = CanReceiverThread.get_netlink_attribute(attributes, attribute_type)
+            if attributes is None:
+                return None
+
+        return struct.unpack_from("=L", attributes)[0] if len(attributes) >= 4 else None
+
+    @staticmethod
+    def get_netlink_attribute(data: bytes, attribute_type: int) -> Union[bytes, None]:
+        """
+        Get the payload of a netlink attribute (struct rtattr)
+
+        :param data: attributes
+        :param attribute_type: type of the attribute to find
+        :return: payload of the attribute or None, if not found
+        """
+        offset = 0
+        while offset + 4 <= len(data):
+            length, _type = struct.unpack_from("=HH", data, offset)
+            if length < 4:
+                return None
+            # strip NLA_F_NESTED and NLA_F_NET_BYTEORDER
+            if _type & 0x3FFF == attribute_type:
+                return data[offset + 4 : offset + length]
+            # attributes are aligned to 4 bytes
+            offset += (length + 3) & ~3
+        return None
+
     @staticmethod
     def get_bitrate(channel: str) -> int:
         """
@@ -204,6 +684,11 @@ class CanReceiverThread(threading.Thread):
         # vcan doesn't support bitrate, so return static value
         if channel.startswith("vcan"):
             return 250000
+
+        bitrate = CanReceiverThread.get_netlink_bitrate(channel)
+        if bitrate is not None:
+            return bitrate
+
         try:
             result = subprocess.run(["ip", "-details", "link", "show", channel], capture_output=True, text=True, check=True)
             for line in result.stdout.split("\n"):
@@ -224,16 +709,17 @@ class CanReceiverThread(threading.Thread):
         """
         try:
             # check if CAN interface exists and is down
-            result = subprocess.run(["ip", "link", "show", f"{channel}"], capture_output=True, text=True, check=True)
+            flags = CanReceiverThread.get_link_flags(channel)
+            if flags is not None:
+                link_up = bool(flags & IFF_UP)
+            else:
+                result = subprocess.run(["ip", "link", "show", f"{channel}"], capture_output=True, text=True, check=True)
+                link_up = "DOWN" not in result.stdout
 
-            if not force and "DOWN" not in result.stdout:
+            if not force and link_up:
                 logger.debug(f"Interface {channel} is already up")
                 return True
 
-            if result.returncode != 0:
-                logger.error(result.stderr)
-                return False
-
             # bring down the interface
             subprocess.run(["ip", "link", "set", f"{channel}", "down"], capture_output=True, text=True, check=True)
 
@@ -0,0 +1,143 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""
+CAN decoder benchmark
+---------------------
+Compares the time needed per cycle to decode the cached CAN frames of Jkbms_Can and Daly_Can:
+
+- chain: the frame ID is compared with the CAN_FRAMES lists of the frame types one after another
+  and the data is unpacked with the format string, like the drivers did before
+- dispatch table: the decoders built once in `get_can_decoders()` with the device address applied
+  are looked up in a dict and the data is unpacked with the precompiled `struct.Struct`
+
+Both variants call the same decode functions, so only the lookup and unpacking differ.
+
+The frames are taken from a candump log (`candump -l can0`), if given, else a synthetic
+bus traffic of a 16 cell JKBMS CAN V2 and a 16 cell Daly CAN BMS is used.
+
+Requirements:
+- pyserial (imported by utils.py)
+- python-can (imported by utils_can.py)
+- the driver configuration (config.default.ini) next to utils.py
+
+Usage:
+- python can_decoder_benchmark.py [cycles] [candump log]
+"""
+
+import sys
+import os
+import time
+import random
+from struct import unpack_from
+
+sys.path.insert(1, os.path.join(os.path.dirname(__file__), "../dbus-serialbattery"))
+
+from bms.daly_can import Daly_Can  # noqa: E402
+from bms.jkbms_can import Jkbms_Can  # noqa: E402
+
+
+def read_candump(path: str) -> dict:
+    """
+    Replay a candump log into a cache like the CanReceiverThread does
+    """
+    message_cache = {}
+    with open(path, "r") as file:
+        for line in file:
+            # (1700000000.123456) can0 18F128F4#0A0B0C0D0E0F1011
+            parts = line.split()
+            if len(parts) < 3 or "#" not in parts[2]:
+                continue
+            frame_id, data = parts[2].split("#", 1)
+            arbitration_id = int(frame_id, 16)
+            data = bytearray.fromhex(data)
+
+            # daly hack: cell voltage messages are sent with same id, see CanReceiverThread.run()
+            if arbitration_id & 0xFFFFFF00 == 0x18954000:
+                arbitration_id = arbitration_id + 0x100000 + (data[0] << 16)
+
+            message_cache[arbitration_id] = data
+    return message_cache
+
+
+def get_synthetic_traffic() -> dict:
+    random.seed(1)
+    message_cache = {}
+
+    # JKBMS CAN V2 with 16 cells
+    for frame_id in (0x02F4, 0x04F4, 0x05F4, 0x07F4, 0x18F128F4, 0x18F228F4, 0x18F328F4, 0x18F428F4, 0x18F528F4, 0x1806E5F4):
+        message_cache[frame_id] = bytearray(random.randint(1, 60) for _ in range(8))
+    for frame_id in (0x18E028F4, 0x18E128F4, 0x18E228F4, 0x18E328F4):
+        message_cache[frame_id] = bytearray(b"".join(random.randint(3200, 3400).to_bytes(2, "little") for _ in range(4)))
+
+    # Daly CAN with 16 cells
+    message_cache[0x18944001] = bytearray(b"\x10\x02\x00\x01\x00\x00\x2a\x00")
+    message_cache[0x18904001] = bytearray(b"\x02\x10\x00\x00\x75\x30\x01\xf4")
+    for frame_id in (0x18914001, 0x18924001, 0x18934001, 0x18504001, 0x18984001):
+        message_cache[frame_id] = bytearray(random.randint(1, 60) for _ in range(8))
+    for frame in range(1, 7):
+        cell_voltages = b"".join(random.randint(3200, 3400).to_bytes(2, "big") for _ in range(3))
+        message_cache[0x18954001 + 0x100000 + (frame << 16)] = bytearray([frame]) + cell_voltages + b"\x00"
+
+    return message_cache
+
+
+def get_chain(battery) -> list:
+    """
+    Rebuild the if/elif chain of the previous driver versions from the decoders
+    """
+    chain = []
+    for frame_id, (struct, function) in battery.can_decoders.items():
+        chain.append(([frame_id], struct.format, function))
+    return chain
+
+
+def run_chain(battery, chain: list, message_cache: dict, cycles: int) -> int:
+    data_check = 0
+    for _ in range(cycles):
+        data_check = 0
+        for frame_id, data in message_cache.items():
+            for frame_ids, format, function in chain:
+                if frame_id in frame_ids:
+                    data_check += function(*unpack_from(format, data))
+                    break
+    return data_check
+
+
+def run_dispatch_table(battery, chain: list, message_cache: dict, cycles: int) -> int:
+    data_check = 0
+    can_decoders = battery.can_decoders
+    for _ in range(cycles):
+        data_check = 0
+        for frame_id, data in message_cache.items():
+            decoder = can_decoders.get(frame_id)
+            if decoder is not None:
+                data_check += decoder[1](*decoder[0].unpack_from(data))
+    return data_check
+
+
+def measure(function, battery, message_cache: dict, cycles: int) -> tuple:
+    chain = get_chain(battery)
+    start = time.perf_counter()
+    result = function(battery, chain, message_cache, cycles)
+    return (time.perf_counter() - start) / cycles, result
+
+
+def main() -> None:
+    cycles = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    message_cache = read_candump(sys.argv[2]) if len(sys.argv) > 2 else get_synthetic_traffic()
+
+    print(f"{cycles} cycles with {len(message_cache)} cached frames, time per cycle")
+    for battery in (Jkbms_Can("can0", None, None), Daly_Can("can0", None, None)):
+        frames = len([frame_id for frame_id in message_cache if frame_id in battery.can_decoders])
+
+        duration_chain, result_chain = measure(run_chain, battery, message_cache, cycles)
+        duration_table, result_table = measure(run_dispatch_table, battery, message_cache, cycles)
+        print(
+            f"{battery.type:12s} {frames:3d} frames   chain {duration_chain * 1e6:7.2f} µs   "
+            + f"dispatch table {duration_table * 1e6:7.2f} µs   equal {result_chain == result_table}"
+        )
+
+
+if __name__ == "__main__":
+    main()
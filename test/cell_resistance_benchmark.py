@@ -0,0 +1,69 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""
+Cell resistance benchmark
+-------------------------
+Simulates cells with a known internal resistance, random current steps, a slowly changing
+open circuit voltage, measurement noise and a cell voltage resolution of 1 mV. Measures the
+time needed per cycle by `ResistanceEstimator.update()` and compares the estimated with the
+simulated resistances.
+
+Requirements:
+- pyserial (imported by utils.py)
+- the driver configuration (config.default.ini) next to utils.py
+
+Usage:
+- python cell_resistance_benchmark.py [cycles] [cell count]
+"""
+
+import sys
+import os
+import time
+import random
+from array import array
+
+sys.path.insert(1, os.path.join(os.path.dirname(__file__), "../dbus-serialbattery"))
+
+from utils import ResistanceEstimator, CELL_RESISTANCE_MIN_CURRENT_STEP, CELL_RESISTANCE_FORGETTING_FACTOR  # noqa: E402
+
+
+def main() -> None:
+    cycles = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    cell_count = int(sys.argv[2]) if len(sys.argv) > 2 else 32
+
+    random.seed(1)
+    resistances = [random.uniform(0.0005, 0.003) for _ in range(cell_count)]
+    open_circuit_voltages = [3.3] * cell_count
+    estimator = ResistanceEstimator(cell_count, CELL_RESISTANCE_MIN_CURRENT_STEP, CELL_RESISTANCE_FORGETTING_FACTOR)
+
+    current = 0.0
+    steps = 0
+    duration = 0.0
+    for cycle in range(cycles):
+        # a load or charger starts/stops in about 10% of the cycles, else the current changes slightly
+        if random.random() < 0.1:
+            current = random.choice([-100, -50, -10, 0, 20, 50])
+        else:
+            current += random.uniform(-0.5, 0.5)
+
+        open_circuit_voltages = [voltage + current * 1e-6 for voltage in open_circuit_voltages]
+        voltages = array(
+            "d",
+            (round(voltage + resistance * current + random.gauss(0, 0.0003), 3) for voltage, resistance in zip(open_circuit_voltages, resistances)),
+        )
+
+        start = time.perf_counter()
+        steps += estimator.update(cycle, current, voltages)
+        duration += time.perf_counter() - start
+
+    estimated = estimator.get_resistances()
+    errors = [abs(estimate - resistance) / resistance * 100 for estimate, resistance in zip(estimated, resistances) if estimate is not None]
+
+    print(f"{cycles} cycles with {cell_count} cells, {steps} current steps used")
+    print(f"update(): {duration / cycles * 1e6:9.2f} µs per cycle")
+    print(f"Error of the estimated resistances: max {max(errors):.2f} %, average {sum(errors) / len(errors):.2f} %")
+
+
+if __name__ == "__main__":
+    main()
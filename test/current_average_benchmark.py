@@ -0,0 +1,74 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""
+Current average benchmark
+-------------------------
+Compares the time needed per cycle to update the average current (/CurrentAvg)
+for different window sizes:
+
+- list: append, `del lst[0]` and `sum(lst) / len(lst)` like the driver did before
+- RollingStatistics: ring buffer with running sum from utils.py
+
+Requirements:
+- pyserial (imported by utils.py)
+- the driver configuration (config.default.ini) next to utils.py
+
+Usage:
+- python current_average_benchmark.py [cycles] [window ...]
+- e.g. python current_average_benchmark.py 20000 300 1000 3600 10000
+"""
+
+import sys
+import os
+import time
+import random
+
+sys.path.insert(1, os.path.join(os.path.dirname(__file__), "../dbus-serialbattery"))
+
+from utils import RollingStatistics  # noqa: E402
+
+
+def run_list(samples: list, window: int) -> float:
+    current_avg_lst = []
+    current_avg = None
+    for current in samples:
+        current_avg_lst.append(current)
+        if len(current_avg_lst) > window:
+            del current_avg_lst[0]
+        current_avg = round(sum(current_avg_lst) / len(current_avg_lst), 2)
+    return current_avg
+
+
+def run_rolling_statistics(samples: list, window: int) -> float:
+    current_avg_statistics = RollingStatistics(window)
+    current_avg = None
+    for current in samples:
+        current_avg_statistics.add(current)
+        current_avg = round(current_avg_statistics.mean, 2)
+    return current_avg
+
+
+def measure(function, samples: list, window: int) -> tuple:
+    start = time.perf_counter()
+    result = function(samples, window)
+    return (time.perf_counter() - start) / len(samples), result
+
+
+def main() -> None:
+    cycles = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    windows = [int(window) for window in sys.argv[2:]] or [300, 1000, 3600, 10000]
+
+    random.seed(1)
+    samples = [random.uniform(-100, 100) for _ in range(cycles)]
+
+    print(f"{cycles} cycles per run, time per cycle")
+    print(f"{'window':>8s} {'list':>12s} {'RollingStatistics':>20s} {'equal':>7s}")
+    for window in windows:
+        duration_list, result_list = measure(run_list, samples, window)
+        duration_rolling, result_rolling = measure(run_rolling_statistics, samples, window)
+        print(f"{window:8d} {duration_list * 1e6:9.2f} µs {duration_rolling * 1e6:17.2f} µs {str(result_list == result_rolling):>7s}")
+
+
+if __name__ == "__main__":
+    main()
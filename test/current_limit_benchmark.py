@@ -0,0 +1,90 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""
+Current limit benchmark
+-----------------------
+Compares the time needed per cycle to look up the CCL/DCL limits from the
+cell voltage, temperature, MOSFET temperature and SoC curves of the config:
+
+- calc_linear_relationship() / calc_step_relationship() with the config lists
+- PiecewiseLookup tables compiled when the config is loaded
+
+Requirements:
+- pyserial (imported by utils.py)
+- the driver configuration (config.default.ini) next to utils.py
+
+Usage:
+- python current_limit_benchmark.py [cycles]
+"""
+
+import sys
+import os
+import time
+import random
+
+sys.path.insert(1, os.path.join(os.path.dirname(__file__), "../dbus-serialbattery"))
+
+import utils  # noqa: E402
+
+# input list, output list and compiled lookup per curve, like used in Battery.calc_max_*_current_*()
+CURVES = [
+    (utils.CELL_VOLTAGES_WHILE_CHARGING, utils.MAX_CHARGE_CURRENT_CV, utils.MAX_CHARGE_CURRENT_CV_LOOKUP),
+    (utils.CELL_VOLTAGES_WHILE_DISCHARGING, utils.MAX_DISCHARGE_CURRENT_CV, utils.MAX_DISCHARGE_CURRENT_CV_LOOKUP),
+    (utils.TEMPERATURES_WHILE_CHARGING, utils.MAX_CHARGE_CURRENT_T, utils.MAX_CHARGE_CURRENT_T_LOOKUP),
+    (utils.TEMPERATURES_WHILE_DISCHARGING, utils.MAX_DISCHARGE_CURRENT_T, utils.MAX_DISCHARGE_CURRENT_T_LOOKUP),
+    (utils.MOSFET_TEMPERATURES_WHILE_CHARGING, utils.MAX_CHARGE_CURRENT_T_MOSFET, utils.MAX_CHARGE_CURRENT_T_MOSFET_LOOKUP),
+    (utils.MOSFET_TEMPERATURES_WHILE_DISCHARGING, utils.MAX_DISCHARGE_CURRENT_T_MOSFET, utils.MAX_DISCHARGE_CURRENT_T_MOSFET_LOOKUP),
+    (utils.SOC_WHILE_CHARGING, utils.MAX_CHARGE_CURRENT_SOC, utils.MAX_CHARGE_CURRENT_SOC_LOOKUP),
+    (utils.SOC_WHILE_DISCHARGING, utils.MAX_DISCHARGE_CURRENT_SOC, utils.MAX_DISCHARGE_CURRENT_SOC_LOOKUP),
+]
+
+
+def run_functions(inputs: list, step: bool) -> list:
+    results = []
+    for values in inputs:
+        for value, (in_array, out_array, _) in zip(values, CURVES):
+            if step:
+                results.append(utils.calc_step_relationship(value, in_array, out_array, False))
+            else:
+                results.append(utils.calc_linear_relationship(value, in_array, out_array))
+    return results
+
+
+def run_lookups(inputs: list, step: bool) -> list:
+    results = []
+    for values in inputs:
+        for value, (_, _, lookup) in zip(values, CURVES):
+            if step:
+                results.append(lookup.step(value, False))
+            else:
+                results.append(lookup.linear(value))
+    return results
+
+
+def measure(function, inputs: list, step: bool) -> tuple:
+    start = time.perf_counter()
+    result = function(inputs, step)
+    return (time.perf_counter() - start) / len(inputs), result
+
+
+def main() -> None:
+    cycles = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+
+    # random input values within and around the range of each curve
+    random.seed(1)
+    inputs = [[random.uniform(min(in_array) - 1, max(in_array) + 1) for in_array, _, _ in CURVES] for _ in range(cycles)]
+
+    print(f"{cycles} cycles with {len(CURVES)} curves each, time per cycle")
+    for name, step in (("linear (CHARGE_MODE 1)", False), ("step (CHARGE_MODE 2)", True)):
+        duration_functions, result_functions = measure(run_functions, inputs, step)
+        duration_lookups, result_lookups = measure(run_lookups, inputs, step)
+        max_difference = max(abs(a - b) for a, b in zip(result_functions, result_lookups))
+        print(
+            f"{name:24s} functions {duration_functions * 1e6:7.2f} µs   "
+            + f"PiecewiseLookup {duration_lookups * 1e6:7.2f} µs   max difference {max_difference:.2e}"
+        )
+
+
+if __name__ == "__main__":
+    main()
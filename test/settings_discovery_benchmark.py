@@ -0,0 +1,121 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""
+Settings discovery benchmark
+----------------------------
+Compares the time needed by DbusHelper.setup_instance() to read all entries
+below /Settings/Devices from com.victronenergy.settings:
+
+- get_settings_with_values(): recursive Introspect, XML parse and one GetValue per leaf
+- get_settings_with_values_bulk(): one GetValue on the subtree or one GetItems on the root
+
+A fake settings service with the given number of device entries is started in
+a child process, so the real com.victronenergy.settings is not touched.
+
+Requirements:
+- dbus-python and PyGObject (available on Venus OS)
+- the driver configuration (config.default.ini) next to dbushelper.py
+
+Usage:
+- python settings_discovery_benchmark.py [devices] [runs]
+- Run it in a separate session bus to not disturb the system, e.g.
+  dbus-run-session -- python settings_discovery_benchmark.py 100 5
+"""
+
+import sys
+import os
+import time
+import multiprocessing
+
+sys.path.insert(1, os.path.join(os.path.dirname(__file__), "../dbus-serialbattery"))
+sys.path.insert(1, os.path.join(os.path.dirname(__file__), "../dbus-serialbattery/ext/velib_python"))
+
+import dbus  # noqa: E402
+import dbus.service  # noqa: E402
+from dbus.mainloop.glib import DBusGMainLoop  # noqa: E402
+from gi.repository import GLib  # noqa: E402
+from vedbus import VeDbusService, VeDbusItemExport  # noqa: E402
+
+SERVICE_NAME = "com.victronenergy.settingsbenchmark"
+
+
+class SettingsItemExport(VeDbusItemExport):
+    """
+    Item which exposes the com.victronenergy.Settings interface like localsettings does,
+    so that it's detected by get_settings_with_values()
+    """
+
+    @dbus.service.method("com.victronenergy.Settings", out_signature="v")
+    def GetDefault(self):
+        return self.GetValue()
+
+
+def run_service(devices: int, ready) -> None:
+    DBusGMainLoop(set_as_default=True)
+    service = VeDbusService(SERVICE_NAME, dbus.SessionBus(), register=False)
+
+    for device in range(devices):
+        path = f"/Settings/Devices/serialbattery_BENCH{device:04d}"
+        service.add_path(path + "/AllowMaxVoltage", 1, itemtype=SettingsItemExport)
+        service.add_path(path + "/ClassAndVrmInstance", f"battery:{device + 1}", itemtype=SettingsItemExport)
+        service.add_path(path + "/CustomName", f"Battery {device}", itemtype=SettingsItemExport)
+        service.add_path(path + "/LastSeen", int(time.time()), itemtype=SettingsItemExport)
+        service.add_path(path + "/MaxVoltageStartTime", "", itemtype=SettingsItemExport)
+        service.add_path(path + "/SocCalc", 55.5, itemtype=SettingsItemExport)
+        service.add_path(path + "/SocResetLastReached", 0, itemtype=SettingsItemExport)
+        service.add_path(path + "/HistoryValues", '{"charge_cycles": 12.0}', itemtype=SettingsItemExport)
+        service.add_path(path + "/UniqueIdentifier", f"BENCH{device:04d}", itemtype=SettingsItemExport)
+
+    service.register()
+    ready.set()
+    GLib.MainLoop().run()
+
+
+def measure(name: str, function, runs: int) -> dict:
+    durations = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        result = function()
+        durations.append(time.perf_counter() - start)
+
+    print(f"{name:32s} min {min(durations) * 1000:9.1f} ms   avg {sum(durations) / runs * 1000:9.1f} ms")
+    return result
+
+
+def main() -> None:
+    devices = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    runs = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+
+    ready = multiprocessing.Event()
+    process = multiprocessing.Process(target=run_service, args=(devices, ready), daemon=True)
+    process.start()
+    ready.wait(30)
+
+    from dbushelper import DbusHelper
+
+    # the methods only need the battery object in case of errors
+    helper = DbusHelper.__new__(DbusHelper)
+    helper.battery = None
+
+    bus = dbus.SessionBus()
+
+    print(f"Reading /Settings/Devices with {devices} devices, {runs} runs")
+    result_introspect = measure(
+        "get_settings_with_values",
+        lambda: helper.get_settings_with_values(bus, SERVICE_NAME, "/Settings/Devices"),
+        runs,
+    )
+    result_bulk = measure(
+        "get_settings_with_values_bulk",
+        lambda: helper.get_settings_with_values_bulk(bus, SERVICE_NAME, "/Settings/Devices"),
+        runs,
+    )
+
+    print("Results are equal:", result_introspect == result_bulk)
+
+    process.terminate()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""
+Time series benchmark
+---------------------
+Measures the time needed per cycle to add the values of a battery to the time series
+(`Battery.record_time_series()`), the time to query them and the memory used
+for the levels configured in TIME_SERIES_LEVELS.
+
+Requirements:
+- pyserial (imported by utils.py)
+- the driver configuration (config.default.ini) next to utils.py
+
+Usage:
+- python time_series_benchmark.py [cycles] [cell count]
+"""
+
+import sys
+import os
+import time
+import random
+
+sys.path.insert(1, os.path.join(os.path.dirname(__file__), "../dbus-serialbattery"))
+
+from utils import TimeSeries, TIME_SERIES_LEVELS  # noqa: E402
+from battery import Battery  # noqa: E402
+
+
+def main() -> None:
+    cycles = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    cell_count = int(sys.argv[2]) if len(sys.argv) > 2 else 16
+
+    names = Battery.TIME_SERIES_NAMES + tuple(f"cell_{cell}" for cell in range(1, cell_count + 1))
+    time_series = TimeSeries(names, TIME_SERIES_LEVELS)
+
+    # one sample per second, like with the default poll interval
+    random.seed(1)
+    samples = [[random.uniform(0, 100) for _ in names] for _ in range(1000)]
+    start_timestamp = time.time() - cycles
+
+    start = time.perf_counter()
+    for cycle in range(cycles):
+        time_series.add(start_timestamp + cycle, samples[cycle % len(samples)])
+    duration_add = (time.perf_counter() - start) / cycles
+
+    print(f"Levels (interval, retention): {TIME_SERIES_LEVELS}, {len(names)} values, {cycles} cycles")
+    print(f"Memory: {time_series.get_memory_size() / 1024:.0f} kB")
+    print(f"add():   {duration_add * 1e6:9.2f} µs per cycle")
+
+    for name, duration in (("1 hour", 3600), ("1 day", 86400), ("7 days", 604800)):
+        end_timestamp = start_timestamp + cycles
+        start = time.perf_counter()
+        timestamps, _ = time_series.query(["voltage", "cell_1"], end_timestamp - duration, end_timestamp)
+        print(f"query() {name:8s} {(time.perf_counter() - start) * 1000:9.2f} ms for {len(timestamps)} intervals")
+
+
+if __name__ == "__main__":
+    main()